@@ -0,0 +1,345 @@
+#!/usr/bin/env python3
+"""
+Benchmark suite for the AI modules
+
+Times the fraud detector and the income predictor on synthetic histories
+(see synthetic.py) from a handful of rows up to a million:
+
+    fraud.extract_features      FraudDetector.extract_features
+    fraud.analyze_transaction   FraudDetector.analyze_transaction (result cache off)
+    income.predict_income       IncomePredictor.predict_income
+    fraud.cli / income.cli      the scripts end to end, one process per call,
+                                as server.js runs them
+
+Each case and size runs in a fresh process, so peak RSS is that case's own.
+Results - latency percentiles, throughput and peak RSS - are written as JSON;
+--compare checks them against an earlier run and exits with status 1 when
+a case's median latency regressed by more than --threshold.
+
+Usage:
+    python run_benchmarks.py [--cases fraud.cli,...] [--sizes 5,500,...]
+                             [--out results.json] [--compare baseline.json]
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+import subprocess
+import multiprocessing
+from datetime import datetime, timezone
+from queue import Empty
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+AI_MODULES = os.path.dirname(BENCH_DIR)
+FRAUD_SCRIPT = os.path.join(AI_MODULES, 'fraud_detection', 'fraud_detector.py')
+INCOME_SCRIPT = os.path.join(AI_MODULES, 'income_prediction', 'income_predictor.py')
+
+for path in (AI_MODULES, os.path.dirname(FRAUD_SCRIPT), os.path.dirname(INCOME_SCRIPT)):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+import numpy as np
+
+from synthetic import SyntheticBank
+
+DEFAULT_SIZES = (5, 50, 500, 5000, 50000, 1000000)
+DEFAULT_SEED = 42
+
+# Every case runs at least this many timed calls, whatever --max-seconds says
+MIN_ITERATIONS = 3
+
+# Seconds between checks that a case process is still alive
+CASE_POLL_S = 1.0
+
+# Payloads up to this size go on the command line, as server.js sends them;
+# larger ones through --stdin (argv is limited to 128 KiB per argument on Linux)
+ARGV_LIMIT = 100000
+
+
+def peak_rss_mb(usage):
+    """ru_maxrss in MiB (kilobytes on Linux, bytes on macOS)"""
+    scale = 1024 * 1024 if sys.platform == 'darwin' else 1024
+    return round(usage.ru_maxrss / scale, 1)
+
+
+def _fraud_detector():
+    from fraud_detector import FraudDetector
+    detector = FraudDetector(state_path=os.path.join(tempfile.mkdtemp(), 'fraud_state.db'))
+    detector.result_cache = None   # measure scoring, not cache hits
+    return detector
+
+
+def case_fraud_extract_features(bank, rows):
+    detector = _fraud_detector()
+    history = bank.history(rows)
+    transaction = bank.transaction()
+    return (lambda: detector.extract_features(transaction, history)), {}
+
+
+def case_fraud_analyze_transaction(bank, rows):
+    detector = _fraud_detector()
+    request = {'transaction': bank.transaction(), 'userHistory': bank.history(rows)}
+    return (lambda: detector.analyze_transaction(request)), {'model_loaded': detector.model_loaded}
+
+
+def case_income_predict_income(bank, rows):
+    from income_predictor import IncomePredictor
+    predictor = IncomePredictor()
+    request = {'transactions': bank.history(rows)}
+    method = predictor.predict_income(request).get('method')
+    return (lambda: predictor.predict_income(request)), {'method': method}
+
+
+def _cli_case(script, request):
+    """
+    Callable running `script` on `request` once and recording the child's peak RSS
+
+    A --stdin payload file is removed by the callable's `cleanup()`.
+    """
+    payload = json.dumps(request)
+    if len(payload) <= ARGV_LIMIT:
+        argv, stdin_path = [payload], None
+    else:
+        fd, stdin_path = tempfile.mkstemp(suffix='.json')
+        with os.fdopen(fd, 'w') as fh:
+            fh.write(payload)
+        argv = ['--stdin']
+    extra = {'transport': 'stdin' if stdin_path else 'argv', 'payload_bytes': len(payload), 'peak_rss_mb': 0.0}
+
+    def call():
+        stdin = open(stdin_path, 'rb') if stdin_path else subprocess.DEVNULL
+        try:
+            process = subprocess.Popen([sys.executable, script] + argv, stdin=stdin, stdout=subprocess.PIPE)
+            output = process.stdout.read()
+            process.stdout.close()
+            # wait4 rather than wait() for this child's own resource usage
+            _, status, usage = os.wait4(process.pid, 0)
+            process.returncode = os.waitstatus_to_exitcode(status)
+        finally:
+            if stdin_path:
+                stdin.close()
+        if process.returncode != 0 or not json.loads(output).get('success'):
+            raise RuntimeError(f'{os.path.basename(script)} failed: {output[:200]!r}')
+        extra['peak_rss_mb'] = max(extra['peak_rss_mb'], peak_rss_mb(usage))
+
+    def cleanup():
+        if stdin_path:
+            os.unlink(stdin_path)
+
+    call.cleanup = cleanup
+    return call, extra
+
+
+def case_fraud_cli(bank, rows):
+    return _cli_case(FRAUD_SCRIPT, {'transaction': bank.transaction(), 'userHistory': bank.history(rows)})
+
+
+def case_income_cli(bank, rows):
+    return _cli_case(INCOME_SCRIPT, {'transactions': bank.history(rows)})
+
+
+CASES = {
+    'fraud.extract_features': case_fraud_extract_features,
+    'fraud.analyze_transaction': case_fraud_analyze_transaction,
+    'income.predict_income': case_income_predict_income,
+    'fraud.cli': case_fraud_cli,
+    'income.cli': case_income_cli,
+}
+
+
+def measure(call, iterations, max_seconds, warmup=1):
+    """
+    Time repeated calls
+
+    Returns:
+        List of per-call seconds: `iterations` calls, or fewer if
+        `max_seconds` runs out (never fewer than MIN_ITERATIONS)
+    """
+    for _ in range(warmup):
+        call()
+    times = []
+    deadline = time.perf_counter() + max_seconds
+    while len(times) < iterations and (len(times) < MIN_ITERATIONS or time.perf_counter() < deadline):
+        started = time.perf_counter()
+        call()
+        times.append(time.perf_counter() - started)
+    return times
+
+
+def summarize(times, rows):
+    ms = np.asarray(times) * 1000
+    mean_s = float(np.mean(times))
+    return {
+        'iterations': len(times),
+        'latency_ms': {
+            'p50': round(float(np.percentile(ms, 50)), 4),
+            'p90': round(float(np.percentile(ms, 90)), 4),
+            'p99': round(float(np.percentile(ms, 99)), 4),
+            'mean': round(float(ms.mean()), 4),
+            'min': round(float(ms.min()), 4),
+            'max': round(float(ms.max()), 4),
+        },
+        'throughput': {
+            'calls_per_s': round(1 / mean_s, 2),
+            'rows_per_s': round(rows / mean_s, 1),
+        },
+    }
+
+
+def _run_case(name, rows, seed, now, iterations, max_seconds, queue):
+    """Worker process: build one case, time it and report through `queue`"""
+    import resource
+    call = None
+    try:
+        bank = SyntheticBank(seed, now=now)
+        call, extra = CASES[name](bank, rows)
+        result = summarize(measure(call, iterations, max_seconds), rows)
+        if 'peak_rss_mb' not in extra:
+            extra['peak_rss_mb'] = peak_rss_mb(resource.getrusage(resource.RUSAGE_SELF))
+        result.update(extra)
+    except Exception as e:
+        result = {'error': f'{type(e).__name__}: {e}'}
+    finally:
+        # Remove what the case left on disk (e.g. a --stdin payload file)
+        cleanup = getattr(call, 'cleanup', None)
+        if cleanup is not None:
+            cleanup()
+    queue.put(result)
+
+
+def run_case(name, rows, seed, now, iterations, max_seconds):
+    """
+    Run one case at one size in a fresh process
+
+    A process that dies without reporting (killed for memory, a crash in a
+    native library) is recorded as an error instead of hanging the suite.
+    """
+    context = multiprocessing.get_context('spawn')
+    queue = context.Queue()
+    process = context.Process(target=_run_case, args=(name, rows, seed, now, iterations, max_seconds, queue))
+    process.start()
+    result = None
+    while result is None:
+        try:
+            result = queue.get(timeout=CASE_POLL_S)
+        except Empty:
+            if process.exitcode is not None:
+                # It may have reported just before exiting
+                try:
+                    result = queue.get(timeout=CASE_POLL_S)
+                except Empty:
+                    result = {'error': f'case process exited with code {process.exitcode} without a result'}
+    process.join()
+    return dict({'case': name, 'rows': rows}, **result)
+
+
+def environment(seed, now):
+    """What a result file was measured on, for comparing runs"""
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=AI_MODULES,
+            capture_output=True, text=True, timeout=10
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'commit': commit,
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'seed': seed,
+        'now': now,
+    }
+
+
+def compare(results, baseline, threshold):
+    """
+    Median-latency changes against a baseline run
+
+    Returns:
+        (lines, regressed) - a report line per case present in both runs,
+        and whether any case got slower by more than `threshold`
+    """
+    before = {(r['case'], r['rows']): r for r in baseline.get('results', []) if 'latency_ms' in r}
+    lines = []
+    regressed = False
+    for result in results:
+        old = before.get((result['case'], result['rows']))
+        if old is None or 'latency_ms' not in result:
+            continue
+        change = result['latency_ms']['p50'] / old['latency_ms']['p50'] - 1
+        flag = ''
+        if change > threshold:
+            flag = '  REGRESSION'
+            regressed = True
+        lines.append(
+            f"{result['case']:<28} {result['rows']:>9} rows  p50 {old['latency_ms']['p50']:>10.3f} -> "
+            f"{result['latency_ms']['p50']:>10.3f} ms ({change:+.1%}){flag}"
+        )
+    return lines, regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the AI modules on synthetic histories')
+    parser.add_argument('--cases', default=','.join(CASES),
+                        help='Comma-separated cases (default: all)')
+    parser.add_argument('--sizes', default=','.join(map(str, DEFAULT_SIZES)),
+                        help='Comma-separated history sizes in rows')
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED)
+    parser.add_argument('--iterations', type=int, default=50, help='Timed calls per case and size')
+    parser.add_argument('--max-seconds', type=float, default=5.0,
+                        help=f'Stop timing a case after this long (at least {MIN_ITERATIONS} calls)')
+    parser.add_argument('--out', help='Write the JSON results here (default: stdout)')
+    parser.add_argument('--compare', help='Earlier results file to compare median latencies with')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='Median latency increase counted as a regression (default 0.2 = 20%%)')
+    args = parser.parse_args()
+
+    cases = [c.strip() for c in args.cases.split(',') if c.strip()]
+    unknown = [c for c in cases if c not in CASES]
+    if unknown:
+        parser.error(f"unknown case(s): {', '.join(unknown)} (choose from {', '.join(CASES)})")
+    sizes = [int(s) for s in args.sizes.split(',') if s.strip()]
+
+    # One anchor time for the whole run, so every case sees the same histories
+    now = float(int(time.time()) // 60 * 60)
+    results = []
+    for name in cases:
+        for rows in sizes:
+            result = run_case(name, rows, args.seed, now, args.iterations, args.max_seconds)
+            results.append(result)
+            if 'error' in result:
+                print(f"{name:<28} {rows:>9} rows  ERROR {result['error']}", file=sys.stderr)
+            else:
+                latency = result['latency_ms']
+                print(
+                    f"{name:<28} {rows:>9} rows  p50 {latency['p50']:>10.3f} ms  p99 {latency['p99']:>10.3f} ms  "
+                    f"peak RSS {result['peak_rss_mb']:>7.1f} MiB",
+                    file=sys.stderr
+                )
+
+    report = {'environment': environment(args.seed, now), 'results': results}
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, 'w') as fh:
+            fh.write(text + '\n')
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare) as fh:
+            baseline = json.load(fh)
+        lines, regressed = compare(results, baseline, args.threshold)
+        print('\n'.join(lines), file=sys.stderr)
+        if regressed:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+Seeded synthetic account histories for the AI module benchmarks
+
+Histories look like what server.js sends - rows of amount / createdAt /
+description, newest first, timestamps as naive UTC ISO strings - and are
+generated with vectorized NumPy, so a million rows takes about a second:
+
+- everyday transfers: log-normal amounts at daytime-weighted hours, a
+  little busier at weekends
+- income: a salary on the account's pay weekday every week, plus the
+  occasional irregular deposit
+- fraud bursts: a handful of large transfers minutes apart in the early
+  morning, labelled with is_fraud
+
+The same seed, size and anchor time always give the same history.
+"""
+
+import time
+import zlib
+
+import numpy as np
+
+# Relative transfer volume per hour of day (UTC)
+HOURLY_WEIGHTS = np.array([
+    1, 0.5, 0.3, 0.2, 0.2, 0.4, 1, 3, 6, 7, 7, 8,
+    9, 8, 7, 7, 7, 8, 9, 9, 7, 5, 3, 2,
+], dtype=float)
+
+# Relative transfer volume per weekday (Monday = 0)
+WEEKDAY_WEIGHTS = np.array([1.0, 0.95, 0.95, 1.0, 1.1, 1.3, 1.2])
+
+# 1970-01-01 was a Thursday
+EPOCH_WEEKDAY = 3
+
+# Share of rows that belong to fraud bursts (when enabled)
+DEFAULT_FRAUD_RATE = 0.01
+
+
+class SyntheticBank:
+    """Reproducible generator of account histories"""
+
+    def __init__(self, seed=0, now=None):
+        """
+        Args:
+            seed: Random seed
+            now: Epoch seconds the histories end at (default: the current
+                 minute, so velocity features see recent activity)
+        """
+        self.seed = seed
+        self.now = float(now if now is not None else int(time.time()) // 60 * 60)
+
+    def _rng(self, *key):
+        # Strings by crc32 rather than hash(), which differs between processes
+        return np.random.default_rng(
+            [self.seed] + [zlib.crc32(k.encode()) if isinstance(k, str) else int(k) for k in key]
+        )
+
+    def history_columns(self, rows, account=0, days=None, fraud_rate=DEFAULT_FRAUD_RATE):
+        """
+        One account's history as parallel arrays, newest first
+
+        Args:
+            rows: Number of transactions
+            account: Account number (each has its own spending level and pay day)
+            days: Days the history spans (default: about 5 per day, 30..365)
+            fraud_rate: Share of rows in fraud bursts (0 disables them)
+
+        Returns:
+            Dict of 'amount', 'ts' (epoch seconds), 'kind' ('transfer',
+            'salary', 'deposit') and 'is_fraud' arrays
+        """
+        rng = self._rng('history', account, rows)
+        days = days or int(min(max(30, rows // 5), 365))
+        start = self.now - days * 86400
+        scale = float(np.exp(rng.normal(np.log(60), 0.5)))   # the account's typical transfer
+        pay_weekday = int(rng.integers(0, 5))
+
+        # Salary every week on the pay weekday, about 9:00
+        first_day = int(start // 86400)
+        pay_days = np.arange(first_day, first_day + days + 1)
+        pay_days = pay_days[(pay_days + EPOCH_WEEKDAY) % 7 == pay_weekday]
+        n_salary = min(len(pay_days), max(1, rows // 10)) if rows > 1 else 0
+        salary_ts = pay_days[len(pay_days) - n_salary:] * 86400.0 + 9 * 3600 + rng.normal(0, 600, n_salary)
+        salary = scale * 25 * rng.normal(1, 0.03, n_salary)
+
+        # Fraud bursts: 3-8 large transfers a few minutes apart, 1:00-4:00
+        n_fraud = 0
+        burst_ts, burst_amount = [], []
+        while fraud_rate > 0 and n_fraud + 3 <= rows * fraud_rate:
+            size = int(rng.integers(3, 9))
+            day = first_day + int(rng.integers(0, days))
+            t0 = day * 86400.0 + rng.uniform(1, 4) * 3600
+            burst_ts.append(t0 + np.cumsum(rng.uniform(30, 300, size)))
+            burst_amount.append(scale * rng.uniform(5, 20, size))
+            n_fraud += size
+        fraud_ts = np.concatenate(burst_ts) if burst_ts else np.empty(0)
+        fraud = np.concatenate(burst_amount) if burst_amount else np.empty(0)
+
+        # Everything else: transfers, with an irregular deposit now and then
+        n_normal = max(rows - n_salary - n_fraud, 0)
+        day_weights = WEEKDAY_WEIGHTS[(np.arange(first_day, first_day + days) + EPOCH_WEEKDAY) % 7]
+        day = rng.choice(days, n_normal, p=day_weights / day_weights.sum()) + first_day
+        hour = rng.choice(24, n_normal, p=HOURLY_WEIGHTS / HOURLY_WEIGHTS.sum())
+        normal_ts = day * 86400.0 + hour * 3600 + rng.uniform(0, 3600, n_normal)
+        normal = np.round(np.exp(rng.normal(np.log(scale), 0.9, n_normal)), 2)
+        deposit = rng.random(n_normal) < 0.05
+
+        ts = np.concatenate([normal_ts, salary_ts, fraud_ts])
+        amount = np.concatenate([normal, np.round(salary, 2), np.round(fraud, 2)])
+        kind = np.concatenate([
+            np.where(deposit, 'deposit', 'transfer'),
+            np.full(n_salary, 'salary'), np.full(len(fraud), 'transfer'),
+        ])
+        is_fraud = np.concatenate([np.zeros(n_normal + n_salary, dtype=bool), np.ones(len(fraud), dtype=bool)])
+
+        # Nothing in the future; newest first, trimmed to exactly `rows`
+        ts = np.minimum(ts, self.now - 1)
+        order = np.argsort(-ts, kind='stable')[:rows]
+        return {'amount': amount[order], 'ts': ts[order], 'kind': kind[order], 'is_fraud': is_fraud[order]}
+
+    def history(self, rows, account=0, days=None, fraud_rate=DEFAULT_FRAUD_RATE):
+        """One account's history as rows, in the form server.js sends (see history_columns)"""
+        columns = self.history_columns(rows, account, days, fraud_rate)
+        created = np.datetime_as_string(columns['ts'].astype('datetime64[s]'), unit='s').tolist()
+        return [
+            {'amount': amount, 'createdAt': created_at, 'description': kind}
+            for amount, created_at, kind in zip(columns['amount'].tolist(), created, columns['kind'].tolist())
+        ]
+
+    def transaction(self, account=0, index=0):
+        """A new outgoing transfer to score, as server.js builds it"""
+        rng = self._rng('transaction', account, index)
+        amount = round(float(np.exp(rng.normal(np.log(80), 1.2))), 2)
+        return {
+            'amount': amount,
+            'toRib': f'TN59{int(rng.integers(10 ** 15, 10 ** 16)):016d}',
+            'createdAt': str(np.datetime_as_string(np.datetime64(int(self.now), 's'), unit='s')),
+        }
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+Columnar transaction payloads shared by the AI modules
+
+A list of transactions can be sent in three equivalent forms:
+
+    rows:    [{"amount": 500, "createdAt": "2025-01-06T10:00:00"}, ...]
+    columns: {"amount": [500, ...], "ts": [1736157600, ...]}
+    binary:  over stdin, see read_binary_request
+
+All of them become a Columns object: parallel float64 arrays of amounts and
+epoch-second timestamps (NaN where a timestamp is missing or unparseable).
+Timestamps without a timezone are read as UTC, which is what server.js sends.
+"""
+
+import json
+import warnings
+from datetime import datetime, timezone
+
+import numpy as np
+
+
+def parse_timestamp(value):
+    """Parse an ISO-8601 / MySQL timestamp string as sent by server.js"""
+    return datetime.fromisoformat(str(value).replace('Z', ''))
+
+
+def to_epoch(value):
+    """Epoch seconds for a createdAt value, or None if it cannot be parsed"""
+    if value is None or value == '':
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        dt = parse_timestamp(value)
+    except ValueError:
+        return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.timestamp()
+
+
+def to_epochs(values):
+    """
+    Vectorized to_epoch over a sequence of createdAt values (NaN where missing)
+
+    Lists of plain ISO strings - what server.js sends - are parsed in one
+    numpy datetime64 conversion. Anything else (numbers, None, explicit UTC
+    offsets, unparseable strings) goes through to_epoch row by row, so the
+    result is the same either way.
+    """
+    if all(type(v) is str for v in values):
+        text = np.char.replace(np.asarray(values, dtype=str), 'Z', '')
+        try:
+            with warnings.catch_warnings():
+                # numpy only warns about UTC offsets; those need the exact path
+                warnings.simplefilter('error')
+                parsed = np.asarray(text, dtype='datetime64[us]')
+        except (ValueError, UserWarning, DeprecationWarning):
+            pass
+        else:
+            ts = parsed.astype(np.int64) / 1e6
+            ts[np.isnat(parsed)] = np.nan
+            return ts
+
+    epochs = (to_epoch(v) for v in values)
+    return np.fromiter((np.nan if e is None else e for e in epochs), dtype=float, count=len(values))
+
+
+class Columns:
+    """Parallel amount / epoch-second arrays for a list of transactions"""
+
+    __slots__ = ('amount', 'ts')
+
+    def __init__(self, amount, ts):
+        self.amount = amount
+        self.ts = ts
+
+    def __len__(self):
+        return len(self.amount)
+
+    @classmethod
+    def empty(cls):
+        return cls(np.empty(0), np.empty(0))
+
+    @classmethod
+    def from_records(cls, records):
+        """Build from a list of {'amount', 'createdAt'} dicts"""
+        amounts = [tx.get('amount', 0) or 0 for tx in records]
+        try:
+            amount = np.asarray(amounts, dtype=float)
+        except (TypeError, ValueError):
+            amount = np.fromiter((_to_float(a) for a in amounts), dtype=float, count=len(amounts))
+        ts = to_epochs([tx.get('createdAt') for tx in records])
+        return cls(amount, ts)
+
+    @classmethod
+    def from_dict(cls, columns):
+        """Build from {'amount': [...], 'ts': [...]} (ts optional)"""
+        amount = np.asarray(columns.get('amount', []), dtype=float)
+        if 'ts' in columns:
+            ts = np.asarray(columns['ts'], dtype=float)
+        else:
+            ts = np.full(len(amount), np.nan)
+        if len(ts) != len(amount):
+            raise ValueError('Columnar payload: amount and ts must have the same length')
+        return cls(amount, ts)
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def as_columns(value):
+    """Normalise rows, a column dict or Columns into Columns"""
+    if isinstance(value, Columns):
+        return value
+    if not value:
+        return Columns.empty()
+    if isinstance(value, dict):
+        return Columns.from_dict(value)
+    return Columns.from_records(value)
+
+
+def read_binary_request(stream):
+    """
+    Read a request sent as a JSON header line followed by raw column data
+
+    The header is the usual request object plus a "binary" list naming the
+    fields whose data follows, in order:
+
+        {"transaction": {...}, "binary": [{"field": "userHistory", "rows": 1000}]}\\n
+        <1000 little-endian float64 amounts><1000 little-endian float64 epoch seconds>
+
+    The arrays are wrapped with np.frombuffer, without copying.
+
+    Args:
+        stream: Binary stream (e.g. sys.stdin.buffer)
+
+    Returns:
+        Request dict with each binary field set to a Columns object
+    """
+    request = json.loads(stream.readline())
+    for spec in request.pop('binary', []):
+        rows = int(spec['rows'])
+        size = rows * 8
+        buf = stream.read(2 * size)
+        if len(buf) != 2 * size:
+            raise ValueError(f"Binary payload for {spec['field']} is truncated")
+        amount = np.frombuffer(buf, dtype='<f8', count=rows, offset=0)
+        ts = np.frombuffer(buf, dtype='<f8', count=rows, offset=size)
+        request[spec['field']] = Columns(amount, ts)
+    return request
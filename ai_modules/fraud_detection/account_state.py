@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+"""
+Per-account rolling statistics for fraud features
+
+Keeps a constant-size summary per account (Welford mean/variance, running
+max/min, last timestamp) plus a bounded velocity ring of recent transactions
+in a local SQLite file, so the detector can score a new transaction without
+re-reading and re-reducing the account's history. The same file holds the
+recipient index (see recipient_index.py).
+"""
+
+import math
+import sqlite3
+import threading
+
+from velocity import VelocityRing
+from recipient_index import BloomFilter, PAYEE_MAP_CAPACITY, payee_features
+
+
+class AccountStats:
+    """Running amount statistics for one account, updated in O(1)"""
+
+    __slots__ = ('count', 'mean', 'm2', 'max_amount', 'min_amount', 'last_ts')
+
+    def __init__(self, count=0, mean=0.0, m2=0.0, max_amount=0.0, min_amount=0.0, last_ts=None):
+        self.count = count
+        self.mean = mean
+        self.m2 = m2
+        self.max_amount = max_amount
+        self.min_amount = min_amount
+        self.last_ts = last_ts
+
+    def update(self, amount, ts=None):
+        """
+        Fold one transaction into the statistics (Welford's algorithm)
+
+        Args:
+            amount: Transaction amount
+            ts: Epoch seconds of the transaction, or None if unknown
+        """
+        self.count += 1
+        delta = amount - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (amount - self.mean)
+
+        if self.count == 1:
+            self.max_amount = amount
+            self.min_amount = amount
+        else:
+            self.max_amount = max(self.max_amount, amount)
+            self.min_amount = min(self.min_amount, amount)
+
+        if ts is not None and (self.last_ts is None or ts > self.last_ts):
+            self.last_ts = ts
+
+    @property
+    def std(self):
+        """Population standard deviation (same as np.std over the history)"""
+        if self.count < 2:
+            return 0.0
+        return math.sqrt(self.m2 / self.count)
+
+    def as_row(self):
+        return (self.count, self.mean, self.m2, self.max_amount, self.min_amount, self.last_ts)
+
+
+class AccountStateStore:
+    """
+    SQLite-backed map of account id -> (AccountStats, VelocityRing)
+
+    Safe to share between threads of one process; WAL mode lets several
+    worker processes read while one writes.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute(
+            '''CREATE TABLE IF NOT EXISTS account_stats (
+                account_id TEXT PRIMARY KEY,
+                count INTEGER NOT NULL,
+                mean REAL NOT NULL,
+                m2 REAL NOT NULL,
+                max_amount REAL NOT NULL,
+                min_amount REAL NOT NULL,
+                last_ts REAL
+            )'''
+        )
+        self.conn.execute(
+            '''CREATE TABLE IF NOT EXISTS account_velocity (
+                account_id TEXT PRIMARY KEY,
+                ts BLOB NOT NULL,
+                amounts BLOB NOT NULL
+            )'''
+        )
+        # Recipient index: per-account Bloom filter of payees and distinct
+        # payee count, bounded payee counts, distinct senders per recipient
+        self.conn.execute(
+            '''CREATE TABLE IF NOT EXISTS account_payees (
+                account_id TEXT PRIMARY KEY,
+                bloom BLOB NOT NULL,
+                distinct_payees INTEGER NOT NULL
+            )'''
+        )
+        self.conn.execute(
+            '''CREATE TABLE IF NOT EXISTS payee_counts (
+                account_id TEXT NOT NULL,
+                recipient TEXT NOT NULL,
+                count INTEGER NOT NULL,
+                last_ts REAL,
+                PRIMARY KEY (account_id, recipient)
+            ) WITHOUT ROWID'''
+        )
+        self.conn.execute(
+            '''CREATE TABLE IF NOT EXISTS recipient_senders (
+                recipient TEXT NOT NULL,
+                account_id TEXT NOT NULL,
+                PRIMARY KEY (recipient, account_id)
+            ) WITHOUT ROWID'''
+        )
+        self.conn.execute(
+            '''CREATE TABLE IF NOT EXISTS recipient_fan_in (
+                recipient TEXT PRIMARY KEY,
+                senders INTEGER NOT NULL
+            )'''
+        )
+
+    def get(self, account_id):
+        """Return the AccountStats for an account, or None if it has no state"""
+        with self.lock:
+            row = self.conn.execute(
+                'SELECT count, mean, m2, max_amount, min_amount, last_ts '
+                'FROM account_stats WHERE account_id = ?',
+                (str(account_id),)
+            ).fetchone()
+        return AccountStats(*row) if row else None
+
+    def load(self, account_id):
+        """
+        Return (AccountStats or None, VelocityRing) for an account
+
+        The ring is empty when the account has no recorded transactions.
+        """
+        key = str(account_id)
+        with self.lock:
+            row = self.conn.execute(
+                'SELECT count, mean, m2, max_amount, min_amount, last_ts '
+                'FROM account_stats WHERE account_id = ?',
+                (key,)
+            ).fetchone()
+            blobs = self.conn.execute(
+                'SELECT ts, amounts FROM account_velocity WHERE account_id = ?',
+                (key,)
+            ).fetchone()
+        stats = AccountStats(*row) if row else None
+        ring = VelocityRing.from_bytes(*blobs) if blobs else VelocityRing()
+        return stats, ring
+
+    def payee_features(self, account_id, recipient):
+        """
+        Recipient features for a transfer from an account (see recipient_index.py)
+
+        Three primary-key lookups: the account's Bloom filter, the payee count
+        only if the filter may contain the recipient, the recipient's fan-in.
+        """
+        key = str(account_id)
+        with self.lock:
+            row = self.conn.execute(
+                'SELECT bloom, distinct_payees FROM account_payees WHERE account_id = ?', (key,)
+            ).fetchone()
+            fan_in = self.conn.execute(
+                'SELECT senders FROM recipient_fan_in WHERE recipient = ?', (recipient,)
+            ).fetchone()
+            count = 0
+            if row is not None and recipient in BloomFilter.from_bytes(row[0]):
+                found = self.conn.execute(
+                    'SELECT count FROM payee_counts WHERE account_id = ? AND recipient = ?',
+                    (key, recipient)
+                ).fetchone()
+                # Not in the map: evicted (or a filter false positive) - paid before
+                count = found[0] if found else 1
+        # An account with no recorded transfers has no known payees to be new among
+        return payee_features(count, row is not None, row[1] if row else 0, fan_in[0] if fan_in else 0)
+
+    def recipient_fan_in(self, recipient):
+        """Distinct recorded accounts that have paid a recipient"""
+        with self.lock:
+            row = self.conn.execute(
+                'SELECT senders FROM recipient_fan_in WHERE recipient = ?', (recipient,)
+            ).fetchone()
+        return row[0] if row else 0
+
+    def _record_payees(self, key, payees):
+        """Add (recipient, ts) transfers to the recipient index (inside record's transaction)"""
+        row = self.conn.execute(
+            'SELECT bloom, distinct_payees FROM account_payees WHERE account_id = ?', (key,)
+        ).fetchone()
+        bloom = BloomFilter.from_bytes(row[0]) if row else BloomFilter()
+        distinct = row[1] if row else 0
+
+        for recipient, ts in payees:
+            if recipient not in bloom:
+                bloom.add(recipient)
+                distinct += 1
+            self.conn.execute(
+                'INSERT INTO payee_counts (account_id, recipient, count, last_ts) VALUES (?, ?, 1, ?) '
+                'ON CONFLICT (account_id, recipient) DO UPDATE SET count = count + 1, '
+                'last_ts = max(coalesce(last_ts, excluded.last_ts), coalesce(excluded.last_ts, last_ts))',
+                (key, recipient, ts)
+            )
+            added = self.conn.execute(
+                'INSERT OR IGNORE INTO recipient_senders (recipient, account_id) VALUES (?, ?)',
+                (recipient, key)
+            ).rowcount
+            if added:
+                self.conn.execute(
+                    'INSERT INTO recipient_fan_in (recipient, senders) VALUES (?, 1) '
+                    'ON CONFLICT (recipient) DO UPDATE SET senders = senders + 1',
+                    (recipient,)
+                )
+
+        self.conn.execute(
+            'INSERT OR REPLACE INTO account_payees (account_id, bloom, distinct_payees) VALUES (?, ?, ?)',
+            (key, bloom.to_bytes(), distinct)
+        )
+        if distinct > PAYEE_MAP_CAPACITY:
+            # Keep the most recently paid; the Bloom filter remembers the rest
+            self.conn.execute(
+                'DELETE FROM payee_counts WHERE account_id = ? AND recipient IN ('
+                '  SELECT recipient FROM payee_counts WHERE account_id = ?'
+                '  ORDER BY coalesce(last_ts, 0) DESC LIMIT -1 OFFSET ?)',
+                (key, key, PAYEE_MAP_CAPACITY)
+            )
+
+    def record(self, account_id, transactions):
+        """
+        Fold new transactions into an account's state
+
+        Args:
+            account_id: Account identifier
+            transactions: Iterable of (amount, epoch_seconds_or_None) pairs,
+                or (amount, ts, recipient_or_None) to also index the payee
+
+        Returns:
+            Updated AccountStats
+        """
+        key = str(account_id)
+        with self.lock:
+            self.conn.execute('BEGIN IMMEDIATE')
+            try:
+                row = self.conn.execute(
+                    'SELECT count, mean, m2, max_amount, min_amount, last_ts '
+                    'FROM account_stats WHERE account_id = ?',
+                    (key,)
+                ).fetchone()
+                stats = AccountStats(*row) if row else AccountStats()
+
+                blobs = self.conn.execute(
+                    'SELECT ts, amounts FROM account_velocity WHERE account_id = ?',
+                    (key,)
+                ).fetchone()
+                ring = VelocityRing.from_bytes(*blobs) if blobs else VelocityRing()
+
+                payees = []
+                for tx in transactions:
+                    amount, ts = tx[0], tx[1]
+                    stats.update(amount, ts)
+                    if ts is not None:
+                        ring.add(ts, amount)
+                    if len(tx) > 2 and tx[2] is not None:
+                        payees.append((tx[2], ts))
+                if payees:
+                    self._record_payees(key, payees)
+
+                self.conn.execute(
+                    'INSERT OR REPLACE INTO account_stats '
+                    '(account_id, count, mean, m2, max_amount, min_amount, last_ts) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                    (key,) + stats.as_row()
+                )
+                self.conn.execute(
+                    'INSERT OR REPLACE INTO account_velocity (account_id, ts, amounts) '
+                    'VALUES (?, ?, ?)',
+                    (key,) + ring.to_bytes()
+                )
+                self.conn.execute('COMMIT')
+            except Exception:
+                self.conn.execute('ROLLBACK')
+                raise
+        return stats
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
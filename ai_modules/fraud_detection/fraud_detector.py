@@ -1,54 +1,320 @@
 #!/usr/bin/env python3
 """
 Fraud Detection Module
-Uses Isolation Forest and XGBoost for transaction fraud detection
+Scores transactions with weighted rules (rules.json) blended with a
+supervised or IsolationForest model - the customer segment's own model when
+it has one (see model_registry.py), else the global model
 """
 
 import sys
 import json
-import numpy as np
-import pandas as pd
+import time
 from datetime import datetime, timedelta
-import joblib
 import os
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from startup_timer import timed, report as startup_timings
+import metrics
+
+with timed('fraud_detector', 'import numpy'):
+    import numpy as np
+
+with timed('fraud_detector', 'import local modules'):
+    from columnar import as_columns, read_binary_request
+    from velocity import VelocityRing, VELOCITY_WINDOWS
+    from rules import RuleEngine
+    from model_loader import ModelHandle
+    from model_registry import SegmentModels, segment_of
+    from result_cache import ResultCache, history_fingerprint, result_key, velocity_change_at
+    from recipient_index import PAYEE_FEATURES, recipient_of, payee_features, payee_counts_from_history
+
+# Column order of the batch feature matrix
+FEATURE_NAMES = [
+    'amount', 'hour', 'day_of_week',
+    'avg_amount', 'std_amount', 'max_amount', 'min_amount',
+    'amount_zscore', 'recent_tx_count', 'hours_since_last_tx',
+    'amount_vs_avg_ratio', 'amount_vs_max_ratio', 'tx_count_total'
+] + [f'tx_{kind}_{window}' for window in VELOCITY_WINDOWS for kind in ('count', 'sum')] + PAYEE_FEATURES
+FEATURE_INDEX = {name: i for i, name in enumerate(FEATURE_NAMES)}
+
+# Features fed to the ML model, in training order
+MODEL_FEATURES = [
+    'amount', 'hour', 'day_of_week', 'amount_zscore',
+    'recent_tx_count', 'hours_since_last_tx', 'amount_vs_avg_ratio'
+]
+MODEL_FEATURE_COLUMNS = [FEATURE_INDEX[name] for name in MODEL_FEATURES]
+
+DEFAULT_MODEL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fraud_model.pkl')
+# Flat-array export of the same model (tree_export.py), preferred when present
+DEFAULT_FLAT_MODEL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fraud_model.npz')
+
+# Per-account rolling state (see account_state.py)
+DEFAULT_STATE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fraud_state.db')
+
+# hours_since_last_tx is capped at one week
+MAX_HOURS_SINCE_LAST = 168
+# Cached results expire this long before hours_since_last_tx reaches a rule
+# or model threshold (thresholds are compared in float32)
+THRESHOLD_MARGIN_S = 1.0
+# Models that don't expose their split points: how far hours_since_last_tx
+# may drift under a cached result (the precision the API reports it with)
+HOURS_SINCE_LAST_TOLERANCE_S = 36.0
+
+# Risk score = RULE_WEIGHT * rule score + ML_WEIGHT * model score
+RULE_WEIGHT = 0.6
+ML_WEIGHT = 0.4
+# Risk scores above this are reported as fraud
+FRAUD_THRESHOLD = 0.8
+# Cascade mode skips the model when every score it could give keeps the
+# blend at least this far from FRAUD_THRESHOLD (FRAUD_CASCADE_BAND)
+DEFAULT_CASCADE_BAND = 0.05
+
+def default_model_path():
+    """FRAUD_MODEL_PATH, else the flat export if it exists, else fraud_model.pkl"""
+    if os.environ.get('FRAUD_MODEL_PATH'):
+        return os.environ['FRAUD_MODEL_PATH']
+    if os.path.exists(DEFAULT_FLAT_MODEL_PATH):
+        return DEFAULT_FLAT_MODEL_PATH
+    return DEFAULT_MODEL_PATH
+
+def score_bounds(rule_scores):
+    """Lowest and highest blended risk score any model score (0..1) can give"""
+    low = RULE_WEIGHT * rule_scores
+    return low, low + ML_WEIGHT
+
+def model_needed(low, high, band):
+    """
+    Whether a model score could still bring a blend bounded by low..high
+    within `band` of FRAUD_THRESHOLD (elementwise on arrays)
+    """
+    return (low <= FRAUD_THRESHOLD + band) & (high >= FRAUD_THRESHOLD - band)
 
 class FraudDetector:
-    def __init__(self):
-        model_path = os.path.join(os.path.dirname(__file__), 'fraud_model.pkl')
-        try:
-            self.model = joblib.load(model_path)
-            self.model_loaded = True
-        except:
-            self.model_loaded = False
-            self.model = None
+    def __init__(self, state_path=None, rules_path=None, model_path=None):
+        self.rules = RuleEngine(rules_path, features=FEATURE_NAMES)
+        self.state_path = state_path or os.environ.get('FRAUD_STATE_DB', DEFAULT_STATE_PATH)
+        self._state_store = None
+        self._state_lock = threading.Lock()
+        
+        # Model arrays are memory-mapped so worker processes share one copy;
+        # FRAUD_MODEL_MMAP=0 loads into private memory instead
+        mmap_mode = None if os.environ.get('FRAUD_MODEL_MMAP') == '0' else 'r'
+        self.model_handle = ModelHandle(
+            model_path or default_model_path(),
+            mmap_mode=mmap_mode
+        )
+        # Per-segment models, loaded on first use into a bounded LRU
+        self.segment_models = SegmentModels(
+            os.environ.get('FRAUD_SEGMENT_MODEL_DIR'),
+            max_models=int(os.environ.get('FRAUD_SEGMENT_MODELS_MAX', 8)),
+            max_bytes=int(float(os.environ.get('FRAUD_SEGMENT_MODELS_MB', 256)) * 1024 * 1024),
+            mmap_mode=mmap_mode
+        )
+        
+        # Recent results for repeated scoring of the same transaction;
+        # FRAUD_RESULT_CACHE_SIZE=0 disables the cache
+        cache_size = int(os.environ.get('FRAUD_RESULT_CACHE_SIZE', 4096))
+        cache_ttl = float(os.environ.get('FRAUD_RESULT_CACHE_TTL', 60))
+        self.result_cache = ResultCache(cache_size, cache_ttl) if cache_size > 0 else None
+        
+        # Cascade mode (FRAUD_CASCADE=1): rules first, the model only when
+        # its score could still change is_fraud
+        self.cascade = os.environ.get('FRAUD_CASCADE') == '1'
+        self.cascade_band = float(os.environ.get('FRAUD_CASCADE_BAND', DEFAULT_CASCADE_BAND))
+    
+    @property
+    def model(self):
+        """Currently active model (hot-reloaded when the file changes)"""
+        return self.model_handle.current()
+    
+    @property
+    def model_loaded(self):
+        return self.model_handle.loaded
+    
+    def route_model(self, segment=None):
+        """
+        Model to score a segment with: its own model if it has one, else the
+        global model
+        
+        Returns:
+            (model or None, version identifying it for result caching)
+        """
+        model, version = self.segment_models.route(segment)
+        if model is None:
+            return self.model, ('global', self.model_handle.version)
+        return model, version
+    
+    @property
+    def state_store(self):
+        """Account state store, opened on first use"""
+        if self._state_store is None:
+            with self._state_lock:
+                if self._state_store is None:
+                    from account_state import AccountStateStore
+                    self._state_store = AccountStateStore(self.state_path)
+        return self._state_store
+    
+    def record_transactions(self, account_id, transactions):
+        """
+        Fold transactions into an account's rolling state
+        
+        Args:
+            account_id: Account identifier
+            transactions: Transactions as rows or columns (see columnar.py);
+                rows with a toRib also go into the recipient index
+        
+        Returns:
+            Number of transactions recorded
+        """
+        cols = as_columns(transactions)
+        if isinstance(transactions, list):
+            recipients = [recipient_of(tx) if isinstance(tx, dict) else None for tx in transactions]
+        else:
+            recipients = [None] * len(cols)
+        rows = [
+            (amount, None if ts != ts else ts, recipient)   # NaN -> unknown timestamp
+            for amount, ts, recipient in zip(cols.amount.tolist(), cols.ts.tolist(), recipients)
+        ]
+        self.state_store.record(account_id, rows)
+        return len(rows)
     
-    def extract_features(self, transaction, user_history):
+    def recipient_fan_in(self, recipient):
+        """Distinct senders of a recipient from the recipient index (0 if no state was ever recorded)"""
+        if self._state_store is None and not os.path.exists(self.state_path):
+            return 0
+        return self.state_store.recipient_fan_in(recipient)
+    
+    def lifetime_tx_count(self, account_id, history_count):
+        """
+        Transactions known for an account, for segment routing
+        
+        The history a caller sends is a recent window (30 days / 50 rows in
+        server.js), so a long-standing but quiet account would look new; the
+        state store's lifetime count is used when it has the account.
+        """
+        if account_id is None or (self._state_store is None and not os.path.exists(self.state_path)):
+            return history_count
+        stats = self.state_store.get(account_id)
+        return max(stats.count, history_count) if stats is not None else history_count
+    
+    def payee_features(self, transaction, user_history=None, account_id=None):
+        """
+        New-payee and fan-in/fan-out features (see recipient_index.py)
+        
+        Args:
+            transaction: Transaction dict being scored
+            user_history: History rows to count payees in, or None to use
+                the recipient index of account_id
+            account_id: Account whose recorded state to use
+        
+        Returns:
+            Dict of the PAYEE_FEATURES
+        """
+        recipient = recipient_of(transaction)
+        if recipient is None:
+            return payee_features(0, False, 0, 0)
+        if user_history is None:
+            return self.state_store.payee_features(account_id, recipient)
+        
+        counts = payee_counts_from_history(user_history, recipient)
+        count, fan_out = counts if counts is not None else (0, 0)
+        return payee_features(count, counts is not None, fan_out, self.recipient_fan_in(recipient))
+    
+    def add_velocity_features(self, features, ring, now_ts):
+        """
+        Fill time-windowed velocity features from an account's VelocityRing
+        
+        recent_tx_count is the exact count over the last 24h and
+        hours_since_last_tx uses the newest transaction, whatever order the
+        history arrived in.
+        """
+        features.update(ring.features(now_ts))
+        features['recent_tx_count'] = features['tx_count_24h']
+        
+        if ring.last_ts is not None:
+            hours_since_last = (now_ts - ring.last_ts) / 3600
+            features['hours_since_last_tx'] = min(hours_since_last, 168)  # Cap at 1 week
+        else:
+            features['hours_since_last_tx'] = 24
+    
+    def extract_features_from_state(self, transaction, stats, ring, now=None, payee=None):
+        """
+        Extract the same features as extract_features from an account's
+        rolling state instead of its history list
+        
+        Args:
+            transaction: Current transaction dict
+            stats: AccountStats for the account, or None if it has no state
+            ring: VelocityRing of the account's recent transactions
+            now: Scoring time (defaults to the current time; set by replay)
+            payee: Payee features from the recipient index (default: unknown payee)
+        
+        Returns:
+            Feature dict
+        """
+        payee = payee or payee_features(0, False, 0, 0)
+        if stats is None or stats.count == 0:
+            return self.extract_features(transaction, [], now=now, payee=payee)
+        
+        features = dict(payee)
+        now = now or datetime.now()
+        
+        features['amount'] = float(transaction.get('amount', 0))
+        features['hour'] = now.hour
+        features['day_of_week'] = now.weekday()
+        
+        features['avg_amount'] = stats.mean
+        features['std_amount'] = stats.std
+        features['max_amount'] = stats.max_amount
+        features['min_amount'] = stats.min_amount
+        
+        if features['std_amount'] > 0:
+            features['amount_zscore'] = (features['amount'] - features['avg_amount']) / features['std_amount']
+        else:
+            features['amount_zscore'] = 0
+        
+        features['tx_count_total'] = stats.count
+        self.add_velocity_features(features, ring, now.timestamp())
+        
+        features['amount_vs_avg_ratio'] = features['amount'] / features['avg_amount'] if features['avg_amount'] > 0 else 1
+        features['amount_vs_max_ratio'] = features['amount'] / features['max_amount'] if features['max_amount'] > 0 else 1
+        
+        return features
+    
+    def extract_features(self, transaction, user_history, now=None, payee=None):
         """
         Extract features from transaction for fraud detection
         
         Args:
             transaction: Current transaction dict
-            user_history: List of past transactions
+            user_history: Past transactions as rows or columns (see columnar.py)
+            now: Scoring time (defaults to the current time; set by replay)
+            payee: Payee features, if already looked up (see payee_features)
         
         Returns:
             Feature vector for ML model
         """
-        features = {}
+        features = dict(payee or self.payee_features(transaction, user_history))
+        now = now or datetime.now()
         
         # Current transaction features
         features['amount'] = float(transaction.get('amount', 0))
-        features['hour'] = datetime.now().hour
-        features['day_of_week'] = datetime.now().weekday()
+        features['hour'] = now.hour
+        features['day_of_week'] = now.weekday()
+        
+        history = as_columns(user_history)
         
         # User history features
-        if user_history and len(user_history) > 0:
-            amounts = [float(t.get('amount', 0)) for t in user_history]
+        if len(history) > 0:
+            amounts = history.amount
             
             # Statistical features
-            features['avg_amount'] = np.mean(amounts)
-            features['std_amount'] = np.std(amounts) if len(amounts) > 1 else 0
-            features['max_amount'] = np.max(amounts)
-            features['min_amount'] = np.min(amounts)
+            features['avg_amount'] = amounts.mean()
+            features['std_amount'] = amounts.std() if len(amounts) > 1 else 0
+            features['max_amount'] = amounts.max()
+            features['min_amount'] = amounts.min()
             
             # Amount deviation
             if features['std_amount'] > 0:
@@ -56,20 +322,12 @@ class FraudDetector:
             else:
                 features['amount_zscore'] = 0
             
-            # Transaction frequency (last 24h)
-            recent_count = len([t for t in user_history[-20:]])
-            features['recent_tx_count'] = recent_count
-            
-            # Time since last transaction (in hours)
-            if len(user_history) > 0:
-                try:
-                    last_tx_time = datetime.fromisoformat(user_history[-1].get('createdAt', '').replace('Z', ''))
-                    hours_since_last = (datetime.now() - last_tx_time).total_seconds() / 3600
-                    features['hours_since_last_tx'] = min(hours_since_last, 168)  # Cap at 1 week
-                except:
-                    features['hours_since_last_tx'] = 24
-            else:
-                features['hours_since_last_tx'] = 24
+            # Transaction frequency (10m / 1h / 24h windows) and time since
+            # the newest transaction
+            features['tx_count_total'] = len(history)
+            valid = ~np.isnan(history.ts)
+            ring = VelocityRing.from_pairs(zip(history.ts[valid].tolist(), amounts[valid].tolist()))
+            self.add_velocity_features(features, ring, now.timestamp())
             
             # Amount compared to history
             features['amount_vs_avg_ratio'] = features['amount'] / features['avg_amount'] if features['avg_amount'] > 0 else 1
@@ -82,6 +340,8 @@ class FraudDetector:
             features['max_amount'] = features['amount']
             features['min_amount'] = features['amount']
             features['amount_zscore'] = 0
+            features['tx_count_total'] = 0
+            features.update(VelocityRing().features(now.timestamp()))
             features['recent_tx_count'] = 0
             features['hours_since_last_tx'] = 0
             features['amount_vs_avg_ratio'] = 1
@@ -89,75 +349,54 @@ class FraudDetector:
         
         return features
     
-    def calculate_risk_score(self, features):
+    def calculate_risk_score(self, features, segment=None):
         """
-        Calculate fraud risk score using rule-based system + ML
+        Calculate fraud risk score using rule-based system + ML (the
+        segment's model, see route_model)
+        
+        In cascade mode the model is skipped when the rule score alone
+        decides is_fraud; the risk score is then the lower bound (a model
+        score of 0).
         
         Returns:
-            risk_score (0-1), reason, is_fraud
-        """
-        risk_score = 0.0
-        reasons = []
-        
-        # Rule 1: Unusually high amount (Z-score > 3)
-        if features['amount_zscore'] > 3:
-            risk_score += 0.3
-            reasons.append("Amount is significantly higher than usual")
-        
-        # Rule 2: Amount vs average ratio
-        if features['amount_vs_avg_ratio'] > 5:
-            risk_score += 0.25
-            reasons.append("Amount is 5x higher than average")
-        
-        # Rule 3: Too many transactions in short time
-        if features['recent_tx_count'] > 10:
-            risk_score += 0.2
-            reasons.append("High transaction frequency detected")
-        
-        # Rule 4: Very short time since last transaction
-        if features['hours_since_last_tx'] < 0.5:  # Less than 30 minutes
-            risk_score += 0.15
-            reasons.append("Multiple transactions in very short time")
-        
-        # Rule 5: Unusual time (late night)
-        if features['hour'] < 5 or features['hour'] > 23:
-            risk_score += 0.1
-            reasons.append("Transaction at unusual hour")
-        
-        # Rule 6: Very large amount (absolute threshold)
-        if features['amount'] > 5000:
-            risk_score += 0.2
-            reasons.append("Very large transaction amount")
-        
-        # Rule 7: First transaction is large
-        if features['recent_tx_count'] == 0 and features['amount'] > 1000:
-            risk_score += 0.3
-            reasons.append("First transaction with large amount")
-        
-        # Cap risk score at 1.0
-        risk_score = min(risk_score, 1.0)
-        
-        # Use ML model if available
-        if self.model_loaded and self.model:
-            try:
-                feature_vector = [
-                    features['amount'],
-                    features['hour'],
-                    features['day_of_week'],
-                    features['amount_zscore'],
-                    features['recent_tx_count'],
-                    features['hours_since_last_tx'],
-                    features['amount_vs_avg_ratio']
-                ]
-                
-                ml_score = self.model.predict_proba([feature_vector])[0][1]
-                # Combine rule-based and ML scores (weighted average)
-                risk_score = 0.6 * risk_score + 0.4 * ml_score
-            except Exception as e:
-                pass  # Fall back to rule-based only
+            risk_score (0-1), reason, is_fraud, fired_rules, and a cascade dict
+            ({'ml_used', 'score_bounds'}: the range the risk score could take)
+        """
+        # Rules from rules.json (see rules.py), compiled once and reloaded on change
+        with metrics.stage('rules'):
+            ruleset = self.rules.current()
+            risk_score, fired = ruleset.evaluate(features)
+            fired_rules = [ruleset.describe(i) for i in fired]
+            reasons = [rule['reason'] for rule in fired_rules if not rule['shadow']]
+        
+        # Use ML model if available (in cascade mode, if it can change the outcome)
+        model, _ = self.route_model(segment)
+        low = high = risk_score
+        ml_used = False
+        if model is not None:
+            band = self.cascade_band if self.cascade else float('inf')
+            blend_low, blend_high = score_bounds(risk_score)
+            if not model_needed(blend_low, blend_high, band):
+                risk_score, low, high = blend_low, blend_low, blend_high
+                metrics.fallback('fraud_detector', 'ml_cascade_skipped')
+            else:
+                try:
+                    with metrics.stage('model'):
+                        feature_vector = [features[name] for name in MODEL_FEATURES]
+                        
+                        ml_score = model.predict_proba([feature_vector])[0][1]
+                    # Combine rule-based and ML scores (weighted average)
+                    risk_score = blend_low + ML_WEIGHT * ml_score
+                    low, high, ml_used = blend_low, blend_high, True
+                except Exception as e:
+                    # Fall back to rule-based only
+                    metrics.fallback('fraud_detector', 'ml_skipped', e)
+        else:
+            # No model loaded (or none for the segment): rule-based only
+            metrics.fallback('fraud_detector', 'ml_no_model')
         
         # Determine if fraud
-        is_fraud = risk_score > 0.8
+        is_fraud = bool(risk_score > FRAUD_THRESHOLD)
         
         # Generate reason
         if not reasons:
@@ -165,33 +404,134 @@ class FraudDetector:
         
         reason = " | ".join(reasons)
         
-        return risk_score, reason, is_fraud
+        cascade = {'ml_used': ml_used, 'score_bounds': [round(float(low), 3), round(float(high), 3)]}
+        return float(risk_score), reason, is_fraud, fired_rules, cascade
+    
+    def result_expiry(self, features, now, history_ts, ruleset, model):
+        """
+        Earliest time a result scored from these features could change
+        
+        The history-derived features are fixed by the cache key; this bounds
+        the time-dependent ones: hour/day of week (next full hour), velocity
+        window counts (next time a transaction enters or leaves a window) and
+        hours_since_last_tx (next rule or model threshold it reaches).
+        
+        Args:
+            features: Feature dict the result was scored from
+            now: Scoring time
+            history_ts: Timestamps of the history the features came from
+            ruleset: RuleSet the result was scored with
+            model: Model the result was scored with, or None
+        
+        Returns:
+            Epoch seconds
+        """
+        now_ts = now.timestamp()
+        expires = (now.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)).timestamp()
+        expires = min(expires, velocity_change_at(history_ts, now_ts))
+        
+        # hours_since_last_tx only moves when there is a newest transaction
+        ts = np.asarray(history_ts, dtype=float)
+        ts = ts[~np.isnan(ts)]
+        hours = features['hours_since_last_tx']
+        if len(ts) == 0 or hours >= MAX_HOURS_SINCE_LAST:
+            return expires
+        
+        cuts = ruleset.cut_points('hours_since_last_tx')
+        split_points = getattr(model, 'split_points', None)
+        if model is not None and split_points is not None and cuts is not None:
+            cuts = cuts + split_points(MODEL_FEATURES.index('hours_since_last_tx'))
+        elif model is not None or cuts is None:
+            # Thresholds unknown: only allow a small drift
+            return min(expires, now_ts + HOURS_SINCE_LAST_TOLERANCE_S)
+        
+        crossing = min([c for c in cuts if c >= hours] + [MAX_HOURS_SINCE_LAST])
+        return min(expires, float(ts.max()) + crossing * 3600 - THRESHOLD_MARGIN_S)
     
     def analyze_transaction(self, transaction_data):
         
         try:
             current_tx = transaction_data.get('transaction', {})
-            user_history = transaction_data.get('userHistory', [])
+            account_id = transaction_data.get('accountId')
+            now = datetime.now()
+            
+            # History - rolling state when the caller sends only the new
+            # transaction, otherwise the history list
+            if account_id is not None and 'userHistory' not in transaction_data:
+                with metrics.stage('state_load'):
+                    stats, ring = self.state_store.load(account_id)
+                    payee = self.payee_features(current_tx, account_id=account_id)
+                history = None
+                fingerprint = stats.as_row() if stats is not None else None
+                history_ts = ring.ts[ring.head:] if stats is not None and stats.count else []
+                tx_count = stats.count if stats is not None else 0
+            else:
+                with metrics.stage('ingest'):
+                    rows = transaction_data.get('userHistory', [])
+                    payee = self.payee_features(current_tx, rows)
+                    history = as_columns(rows)
+                    fingerprint = history_fingerprint(history)
+                history_ts = history.ts
+                tx_count = self.lifetime_tx_count(account_id, len(history))
+            
+            segment = segment_of(transaction_data, tx_count)
+            model, model_version = self.route_model(segment)
+            
+            # Repeated scoring of the same transaction (retries, fraud-check
+            # followed by the transfer) is answered from the result cache
+            ruleset = self.rules.current()
+            cache = self.result_cache
+            if cache is not None:
+                key = result_key(
+                    account_id, current_tx, (fingerprint, tuple(payee.values())),
+                    ruleset, model_version
+                )
+                cached = cache.get(key, now.timestamp())
+                if cached is not None:
+                    if account_id is not None and transaction_data.get('record'):
+                        self.record_transactions(account_id, [current_tx])
+                    return dict(cached, cached=True)
             
             # Extract features
-            features = self.extract_features(current_tx, user_history)
+            with metrics.stage('features'):
+                if history is None:
+                    features = self.extract_features_from_state(current_tx, stats, ring, now=now, payee=payee)
+                else:
+                    features = self.extract_features(current_tx, history, now=now, payee=payee)
             
             # Calculate risk
-            risk_score, reason, is_fraud = self.calculate_risk_score(features)
+            risk_score, reason, is_fraud, fired_rules, cascade = self.calculate_risk_score(features, segment)
             
-            return {
+            # Optionally fold the scored transaction into the account state
+            if account_id is not None and transaction_data.get('record'):
+                self.record_transactions(account_id, [current_tx])
+            
+            result = {
                 'success': True,
                 'risk_score': round(risk_score, 3),
                 'is_fraud': is_fraud,
                 'reason': reason,
-                'confidence': 0.85 if self.model_loaded else 0.70,
+                'rules_fired': fired_rules,
+                'confidence': 0.85 if model is not None else 0.70,
+                'segment': segment,
                 'features': {
                     'amount': features['amount'],
                     'amount_zscore': round(features['amount_zscore'], 2),
                     'recent_tx_count': features['recent_tx_count'],
-                    'hours_since_last': round(features['hours_since_last_tx'], 2)
-                }
+                    'tx_count_10m': features['tx_count_10m'],
+                    'tx_count_1h': features['tx_count_1h'],
+                    'hours_since_last': round(features['hours_since_last_tx'], 2),
+                    'is_new_payee': features['is_new_payee'],
+                    'payee_fan_in': features['payee_fan_in']
+                },
+                'cached': False
             }
+            if self.cascade:
+                result['cascade'] = cascade
+            if cache is not None:
+                expires = self.result_expiry(features, now, history_ts, ruleset, model)
+                cache.put(key, result, now.timestamp(), expires)
+            return result
             
         except Exception as e:
             return {
@@ -202,12 +542,279 @@ class FraudDetector:
                 'reason': 'Error in analysis'
             }
 
+    def extract_feature_matrix(self, transactions, histories):
+        """
+        Vectorized equivalent of extract_features for N transactions
+        
+        History statistics are computed with segmented reductions over one
+        flat array of all history amounts instead of a Python loop per row.
+        
+        Args:
+            transactions: List of N transaction dicts
+            histories: List of N user histories, rows or columns (may be empty)
+        
+        Returns:
+            float64 array of shape (N, len(FEATURE_NAMES))
+        """
+        n = len(transactions)
+        X = np.zeros((n, len(FEATURE_NAMES)))
+        col = FEATURE_INDEX
+        
+        now = datetime.now()
+        amount = np.array([float(tx.get('amount', 0)) for tx in transactions], dtype=float)
+        X[:, col['amount']] = amount
+        X[:, col['hour']] = now.hour
+        X[:, col['day_of_week']] = now.weekday()
+        
+        for i, (tx, history) in enumerate(zip(transactions, histories)):
+            for name, value in self.payee_features(tx, history).items():
+                X[i, col[name]] = value
+        
+        histories = [as_columns(h) for h in histories]
+        lengths = np.array([len(h) for h in histories], dtype=np.int64)
+        has_history = lengths > 0
+        
+        # No history - first transaction (same defaults as extract_features)
+        X[:, col['avg_amount']] = amount
+        X[:, col['max_amount']] = amount
+        X[:, col['min_amount']] = amount
+        X[:, col['amount_vs_avg_ratio']] = 1
+        X[:, col['amount_vs_max_ratio']] = 1
+        
+        if not has_history.any():
+            return X
+        
+        rows = np.flatnonzero(has_history)
+        flat = np.concatenate([histories[i].amount for i in rows])
+        seg_len = lengths[rows]
+        starts = np.concatenate(([0], np.cumsum(seg_len)[:-1]))
+        
+        sums = np.add.reduceat(flat, starts)
+        means = sums / seg_len
+        # Population std, matching np.std over each history
+        sq_dev = (flat - np.repeat(means, seg_len)) ** 2
+        stds = np.sqrt(np.add.reduceat(sq_dev, starts) / seg_len)
+        stds[seg_len < 2] = 0
+        maxs = np.maximum.reduceat(flat, starts)
+        mins = np.minimum.reduceat(flat, starts)
+        
+        amt = amount[rows]
+        X[rows, col['avg_amount']] = means
+        X[rows, col['std_amount']] = stds
+        X[rows, col['max_amount']] = maxs
+        X[rows, col['min_amount']] = mins
+        
+        with np.errstate(divide='ignore', invalid='ignore'):
+            X[rows, col['amount_zscore']] = np.where(stds > 0, (amt - means) / stds, 0)
+            X[rows, col['amount_vs_avg_ratio']] = np.where(means > 0, amt / means, 1)
+            X[rows, col['amount_vs_max_ratio']] = np.where(maxs > 0, amt / maxs, 1)
+        
+        X[rows, col['tx_count_total']] = seg_len
+        
+        # Velocity windows as masked segment sums over the flat timestamps
+        now_ts = now.timestamp()
+        flat_ts = np.concatenate([histories[i].ts for i in rows])
+        valid = ~np.isnan(flat_ts)
+        for window, seconds in VELOCITY_WINDOWS.items():
+            in_window = valid & (flat_ts > now_ts - seconds) & (flat_ts <= now_ts)
+            X[rows, col[f'tx_count_{window}']] = np.add.reduceat(in_window.astype(float), starts)
+            X[rows, col[f'tx_sum_{window}']] = np.add.reduceat(np.where(in_window, flat, 0.0), starts)
+        X[rows, col['recent_tx_count']] = X[rows, col['tx_count_24h']]
+        
+        last_ts = np.maximum.reduceat(np.where(valid, flat_ts, -np.inf), starts)
+        X[rows, col['hours_since_last_tx']] = np.where(
+            np.isfinite(last_ts), np.minimum((now_ts - last_ts) / 3600, 168), 24
+        )
+        
+        return X
+    
+    def calculate_risk_scores(self, X, ruleset=None, cascade=False, segments=None):
+        """
+        Vectorized equivalent of calculate_risk_score over a feature matrix
+        
+        Args:
+            X: Feature matrix (FEATURE_NAMES columns)
+            ruleset: RuleSet to score with (default: the current one)
+            cascade: Run the model only on rows whose outcome it can change
+            segments: Segment of each row, to score each with its segment's
+                model (default: the global model for all)
+        
+        Returns:
+            (risk_scores, fired, ml_used, bounds) where fired is a boolean
+            (N, len(ruleset)) mask, ml_used a boolean (N,) mask and bounds a
+            (low, high) pair of (N,) arrays
+        """
+        with metrics.stage('rules'):
+            ruleset = ruleset or self.rules.current()
+            columns = {name: X[:, i] for name, i in FEATURE_INDEX.items()}
+            risk_scores, fired = ruleset.evaluate_batch(columns, len(X))
+        
+        rule_scores = risk_scores
+        risk_scores = rule_scores.copy()
+        low, high = rule_scores.copy(), rule_scores.copy()
+        ml_used = np.zeros(len(X), dtype=bool)
+        band = self.cascade_band if cascade else np.inf
+        
+        if segments is None:
+            groups = [(None, np.arange(len(X)))] if len(X) else []
+        else:
+            segments = np.asarray(segments)
+            groups = [(segment, np.flatnonzero(segments == segment)) for segment in np.unique(segments)]
+        
+        for segment, group in groups:
+            model, _ = self.route_model(segment)
+            if model is None:
+                metrics.fallback('fraud_detector', 'ml_no_model', count=len(group))
+                continue
+            group_low, group_high = score_bounds(rule_scores[group])
+            needed = model_needed(group_low, group_high, band)
+            rows = group[needed]
+            try:
+                ml_scores = np.zeros(len(group))   # a model score of 0 where skipped
+                if len(rows):
+                    with metrics.stage('model'):
+                        features = X if len(rows) == len(X) else X[rows]
+                        ml_scores[needed] = model.predict_proba(features[:, MODEL_FEATURE_COLUMNS])[:, 1]
+                risk_scores[group] = group_low + ML_WEIGHT * ml_scores
+                low[group], high[group] = group_low, group_high
+                ml_used[rows] = True
+                if len(rows) < len(group):
+                    metrics.fallback('fraud_detector', 'ml_cascade_skipped', count=len(group) - len(rows))
+            except Exception as e:
+                # Fall back to rule-based only
+                metrics.fallback('fraud_detector', 'ml_skipped', e, count=len(group))
+        
+        return risk_scores, fired, ml_used, (low, high)
+    
+    def analyze_batch(self, items):
+        """
+        Score many transactions with one feature matrix and one model call
+        
+        Args:
+            items: List of {'transaction': {...}, 'userHistory': [...]} dicts
+        
+        Returns:
+            List of results in the same format as analyze_transaction
+        """
+        try:
+            transactions = [item.get('transaction', {}) for item in items]
+            histories = [item.get('userHistory', []) for item in items]
+            
+            with metrics.stage('features'):
+                X = self.extract_feature_matrix(transactions, histories)
+            col = FEATURE_INDEX
+            segments = [
+                segment_of(item, self.lifetime_tx_count(item.get('accountId'), int(count)))
+                for item, count in zip(items, X[:, col['tx_count_total']])
+            ]
+            ruleset = self.rules.current()
+            risk_scores, fired, ml_used, (low, high) = self.calculate_risk_scores(
+                X, ruleset, self.cascade, segments
+            )
+            
+            confidence = {
+                segment: 0.85 if self.route_model(segment)[0] is not None else 0.70
+                for segment in set(segments)
+            }
+            results = []
+            for i in range(len(items)):
+                fired_rules = [ruleset.describe(j) for j in np.flatnonzero(fired[i])]
+                reasons = [rule['reason'] for rule in fired_rules if not rule['shadow']]
+                if not reasons:
+                    reasons.append("Normal transaction pattern")
+                risk_score = float(risk_scores[i])
+                
+                result = {
+                    'success': True,
+                    'risk_score': round(risk_score, 3),
+                    'is_fraud': bool(risk_score > FRAUD_THRESHOLD),
+                    'reason': " | ".join(reasons),
+                    'rules_fired': fired_rules,
+                    'confidence': confidence[segments[i]],
+                    'segment': segments[i],
+                    'features': {
+                        'amount': float(X[i, col['amount']]),
+                        'amount_zscore': round(float(X[i, col['amount_zscore']]), 2),
+                        'recent_tx_count': int(X[i, col['recent_tx_count']]),
+                        'tx_count_10m': int(X[i, col['tx_count_10m']]),
+                        'tx_count_1h': int(X[i, col['tx_count_1h']]),
+                        'hours_since_last': round(float(X[i, col['hours_since_last_tx']]), 2),
+                        'is_new_payee': int(X[i, col['is_new_payee']]),
+                        'payee_fan_in': int(X[i, col['payee_fan_in']])
+                    }
+                }
+                if self.cascade:
+                    result['cascade'] = {
+                        'ml_used': bool(ml_used[i]),
+                        'score_bounds': [round(float(low[i]), 3), round(float(high[i]), 3)]
+                    }
+                results.append(result)
+            
+            return results
+            
+        except Exception as e:
+            return [{
+                'success': False,
+                'error': str(e),
+                'risk_score': 0.5,
+                'is_fraud': False,
+                'reason': 'Error in analysis'
+            } for _ in items]
+
+def handle_request(detector, input_data):
+    """Dispatch a decoded request to single/batch scoring, a state update or a model/cache/metrics report"""
+    if input_data.get('modelInfo'):
+        return {'success': True, 'model': detector.model_handle.info, 'segments': detector.segment_models.stats()}
+    if input_data.get('metrics'):
+        return {'success': True, 'metrics': metrics.render()}
+    if input_data.get('cacheStats'):
+        cache = detector.result_cache
+        return {'success': True, 'cache': cache.stats() if cache is not None else None}
+    if 'recordTransactions' in input_data:
+        count = detector.record_transactions(input_data['accountId'], input_data['recordTransactions'])
+        return {'success': True, 'recorded': count}
+    if 'batch' in input_data:
+        return {'success': True, 'results': detector.analyze_batch(input_data['batch'])}
+    return detector.analyze_transaction(input_data)
+
+def serve(argv):
+    """
+    Persistent worker mode: load the model once and answer many requests
+    
+    Usage: fraud_detector.py --serve [--socket PATH] [--workers N]
+    """
+    from jsonl_worker import run_server
+    
+    detector = FraudDetector()
+    detector.model_handle.install_signal_handler()
+    # Open the state store up front so the first stateful request doesn't pay for it
+    detector.state_store
+    run_server(metrics.instrument('fraud_detector', lambda data: handle_request(detector, data)), argv)
+
+def startup_report():
+    """Import, rule-compile and model-load time per module, for --startup-report"""
+    with timed('fraud_detector', 'FraudDetector.__init__'):
+        detector = FraudDetector()
+    
+    result = startup_timings()
+    result['success'] = True
+    result['model'] = detector.model_handle.info
+    return result
+
 def main():
     """Main entry point when called from Node.js"""
     if len(sys.argv) < 2:
         print(json.dumps({'success': False, 'error': 'No input data provided'}))
         sys.exit(1)
     
+    if sys.argv[1] == '--serve':
+        serve(sys.argv[2:])
+        sys.exit(0)
+    
+    if sys.argv[1] == '--startup-report':
+        print(json.dumps(startup_report()))
+        sys.exit(0)
+    
     try:
         # Parse input JSON - handle different quote styles
         input_str = sys.argv[1]
@@ -217,17 +824,28 @@ def main():
         if input_str.startswith("'") and input_str.endswith("'"):
             input_str = input_str[1:-1]
         
-        # Parse JSON
-        input_data = json.loads(input_str)
-        
-        # Initialize detector
-        detector = FraudDetector()
+        # Parse JSON (from stdin for payloads too large for argv)
+        started = time.perf_counter()
+        if input_str == '--stdin':
+            input_data = json.load(sys.stdin)
+        elif input_str == '--stdin-binary':
+            input_data = read_binary_request(sys.stdin.buffer)
+        else:
+            input_data = json.loads(input_str)
+        parse_ms = (time.perf_counter() - started) * 1000
         
-        # Analyze
-        result = detector.analyze_transaction(input_data)
+        with metrics.request('fraud_detector', input_data.get('timings'), started=started) as timings:
+            metrics.add_stage('parse', parse_ms)
+            
+            # Initialize detector
+            with metrics.stage('init'):
+                detector = FraudDetector()
+            
+            # Analyze
+            result = handle_request(detector, input_data)
         
         # Output JSON result
-        print(json.dumps(result))
+        print(metrics.dumps(result, timings))
         sys.exit(0)
         
     except json.JSONDecodeError as e:
@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+"""
+Shared, hot-reloadable model loading for the fraud detector
+
+ModelHandle loads a joblib model - or a flat tree export (.npz, see
+tree_export.py) - with numpy arrays memory-mapped read-only, so worker
+processes loading the same file share one physical copy through the page
+cache. The file is watched by mtime (and SIGHUP forces a reload);
+a changed model is loaded on a background thread and swapped in with a
+single reference assignment, so requests keep being served by the old model
+until the new one is ready and nothing is dropped.
+
+Unsupervised anomaly detectors (an IsolationForest) have no predict_proba;
+they are wrapped in AnomalyScorer, which calibrates their scores to [0, 1],
+so the detector can blend them the same way.
+"""
+
+import os
+import sys
+import time
+import signal
+import threading
+from datetime import datetime
+
+import numpy as np
+
+from startup_timer import timed
+from tree_export import FlatEnsemble
+
+
+class AnomalyScorer:
+    """
+    Calibrated predict_proba for a model that only has score_samples (e.g.
+    IsolationForest)
+
+    Raw anomaly scores sit around 0.5 for normal points, which would add a
+    constant to every blended risk score. They are mapped linearly from a
+    threshold (0) to a ceiling (1) instead, so normal points score 0. Build
+    the scorer with `calibrated` on held-out normal data and save it with
+    joblib; a bare IsolationForest is wrapped with the threshold it was fitted
+    with (its offset_, from its contamination).
+    """
+
+    # Share of validation points scored above 0 by `calibrated`
+    DEFAULT_VALIDATION_FRACTION = 0.01
+
+    def __init__(self, model, threshold=None, ceiling=1.0):
+        """
+        Args:
+            model: Fitted model with score_samples (higher = more normal)
+            threshold: Anomaly score (-score_samples) mapped to 0
+            ceiling: Anomaly score mapped to 1
+        """
+        self.model = model
+        if threshold is None:
+            threshold = -float(getattr(model, 'offset_', -0.5))
+        self.threshold = float(threshold)
+        self.ceiling = max(float(ceiling), self.threshold + 1e-6)
+
+    @classmethod
+    def calibrated(cls, model, X_validation, fraction=DEFAULT_VALIDATION_FRACTION):
+        """
+        Scorer whose threshold is exceeded by `fraction` of the validation
+        rows, reaching 1 at the most anomalous validation row
+        """
+        anomaly = -np.asarray(model.score_samples(X_validation), dtype=float)
+        return cls(model, threshold=np.quantile(anomaly, 1 - fraction), ceiling=anomaly.max())
+
+    def predict_proba(self, X):
+        anomaly = -np.asarray(self.model.score_samples(X), dtype=float)
+        p = np.clip((anomaly - self.threshold) / (self.ceiling - self.threshold), 0.0, 1.0)
+        return np.column_stack([1 - p, p])
+
+
+class ModelHandle:
+    """Owns the currently loaded model and its load/version report"""
+
+    def __init__(self, path, mmap_mode='r', reload_interval=5.0):
+        """
+        Args:
+            path: Path to the joblib model file or flat .npz export
+            mmap_mode: joblib mmap_mode for numpy arrays (None loads into private memory)
+            reload_interval: Minimum seconds between mtime checks
+        """
+        self.path = path
+        self.mmap_mode = mmap_mode
+        self.reload_interval = reload_interval
+        self.lock = threading.Lock()
+        self.model = None
+        self.version = 0
+        self.info = {'path': path, 'loaded': False}
+        self._mtime = None
+        self._checked_at = time.monotonic()
+        self._reload_requested = False
+        self._reloading = False
+        self.load()
+
+    @property
+    def loaded(self):
+        return self.model is not None
+
+    def load(self):
+        """
+        Load the model file and swap it in if it loads cleanly
+
+        Returns:
+            True if a new model was installed
+        """
+        try:
+            stat = os.stat(self.path)
+        except OSError as e:
+            self._record_failure(e)
+            return False
+
+        started = time.perf_counter()
+        try:
+            if self.path.endswith('.npz'):
+                model = FlatEnsemble.load(self.path, mmap_mode=self.mmap_mode)
+            else:
+                # joblib (and sklearn/xgboost through unpickling) only when a pickle is used
+                with timed('model_loader', 'import joblib'):
+                    import joblib
+                with timed('model_loader', 'joblib.load'):
+                    model = joblib.load(self.path, mmap_mode=self.mmap_mode)
+                if not hasattr(model, 'predict_proba') and hasattr(model, 'score_samples'):
+                    model = AnomalyScorer(model)
+        except Exception as e:
+            self._mtime = stat.st_mtime
+            self._record_failure(e)
+            return False
+        load_ms = (time.perf_counter() - started) * 1000
+
+        with self.lock:
+            self.model = model
+            self.version += 1
+            self._mtime = stat.st_mtime
+            self.info = {
+                'path': self.path,
+                'loaded': True,
+                'version': self.version,
+                'model_type': type(model.model if isinstance(model, AnomalyScorer) else model).__name__,
+                'file_size': stat.st_size,
+                'file_mtime': datetime.fromtimestamp(stat.st_mtime).isoformat(),
+                'loaded_at': datetime.now().isoformat(),
+                'load_ms': round(load_ms, 2),
+                'mmap_mode': self.mmap_mode,
+            }
+
+        print(
+            f'Loaded fraud model {self.path} (v{self.version}, {type(model).__name__}) '
+            f'in {load_ms:.1f}ms',
+            file=sys.stderr
+        )
+        return True
+
+    def _record_failure(self, error):
+        # A missing model is the normal rules-only setup; anything else is worth a log line
+        if not isinstance(error, FileNotFoundError):
+            print(f'Fraud model load failed ({self.path}): {error}', file=sys.stderr)
+        with self.lock:
+            self.info = dict(self.info, last_error=str(error), last_error_at=datetime.now().isoformat())
+            self.info.setdefault('loaded', False)
+
+    def current(self):
+        """Return the active model (or None), starting a reload if the file changed"""
+        now = time.monotonic()
+        if self._reload_requested or now - self._checked_at >= self.reload_interval:
+            self._checked_at = now
+            force = self._reload_requested
+            self._reload_requested = False
+            try:
+                changed = os.stat(self.path).st_mtime != self._mtime
+            except OSError:
+                changed = False
+            if force or changed:
+                self._start_reload()
+        return self.model
+
+    def _start_reload(self):
+        with self.lock:
+            if self._reloading:
+                return
+            self._reloading = True
+
+        def run():
+            try:
+                self.load()
+            finally:
+                self._reloading = False
+
+        threading.Thread(target=run, name='fraud-model-reload', daemon=True).start()
+
+    def install_signal_handler(self, signum=getattr(signal, 'SIGHUP', None)):
+        """Make `signum` (SIGHUP by default) force a reload check on the next request"""
+        if signum is None or threading.current_thread() is not threading.main_thread():
+            return
+
+        def request_reload(signum, frame):
+            self._reload_requested = True
+
+        signal.signal(signum, request_reload)
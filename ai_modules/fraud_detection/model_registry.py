@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+"""
+Per-segment fraud models
+
+Customer segments - retail, merchant, new account - behave differently
+enough that one global model fits none of them well. A segment gets its own
+model by dropping `<segment>.npz` (flat tree export, see tree_export.py) or
+`<segment>.pkl` (any joblib model with predict_proba - for an
+IsolationForest, save an AnomalyScorer.calibrated on held-out data, see
+model_loader.py) into the segment model directory; segments without a file
+use the global model.
+
+Models are loaded on first use, each behind its own ModelHandle (so they hot
+reload like the global one), and kept in an LRU bounded by both the number of
+models and their memory - the arrays of the loaded object, measured again
+whenever a model reloads - so dozens of segment files never sit in memory at
+once. Routing is a dict lookup: the directory listing is cached
+and rescanned at most every reload interval.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from model_loader import ModelHandle
+
+DEFAULT_SEGMENT_MODEL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'models')
+
+# Segments routed to without the caller naming one
+RETAIL = 'retail'
+MERCHANT = 'merchant'
+NEW_ACCOUNT = 'new_account'
+
+# Accounts with fewer known transactions than this count as new
+NEW_ACCOUNT_MAX_TX = 5
+
+# accountType values (lower-cased) of merchant accounts
+MERCHANT_ACCOUNT_TYPES = ('merchant', 'business')
+
+DEFAULT_MAX_MODELS = 8
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+# Preferred file per segment, as for the global model
+MODEL_EXTENSIONS = ('.npz', '.pkl')
+
+
+def segment_of(transaction_data, tx_count):
+    """
+    Segment a scoring request belongs to
+
+    Args:
+        transaction_data: Request dict; an explicit 'segment' wins, else its
+            'accountType' picks the merchant segment
+        tx_count: Number of known transactions of the account over its
+            lifetime (see FraudDetector.lifetime_tx_count)
+
+    Returns:
+        Segment name
+    """
+    segment = transaction_data.get('segment')
+    if segment:
+        return str(segment)
+    if tx_count < NEW_ACCOUNT_MAX_TX:
+        return NEW_ACCOUNT
+    if str(transaction_data.get('accountType') or '').lower() in MERCHANT_ACCOUNT_TYPES:
+        return MERCHANT
+    return RETAIL
+
+
+# Most objects model_nbytes visits in one model
+MAX_VISITED_OBJECTS = 1000000
+
+_SCALARS = (type(None), bool, int, float, complex, str, bytes, np.generic)
+
+
+def model_nbytes(model, path):
+    """
+    Estimated memory of a loaded model
+
+    The NumPy arrays reachable from the model: a flat export's arrays
+    (memory-mapped ones included, as they occupy page cache once touched),
+    or a joblib model's fitted attributes - sklearn trees expose theirs
+    through their pickle state. The file size is the fallback when nothing
+    is found, since a compressed pickle can expand several-fold in memory.
+    """
+    total = 0
+    seen = {}   # id -> object, holding temporaries (pickle states) so ids aren't reused
+    stack = [model]
+    while stack and len(seen) < MAX_VISITED_OBJECTS:
+        obj = stack.pop()
+        if isinstance(obj, _SCALARS) or id(obj) in seen:
+            continue
+        seen[id(obj)] = obj
+        if isinstance(obj, np.ndarray):
+            total += obj.nbytes
+            if obj.dtype == object:
+                stack.extend(obj.ravel().tolist())
+        elif isinstance(obj, dict):
+            stack.extend(obj.values())
+        elif isinstance(obj, (list, tuple, set, frozenset)):
+            stack.extend(obj)
+        elif hasattr(obj, '__dict__'):
+            stack.extend(vars(obj).values())
+        else:
+            # Extension types (e.g. sklearn's Tree) keep their arrays in their pickle state
+            try:
+                state = obj.__reduce__()
+            except Exception:
+                continue
+            if isinstance(state, tuple) and len(state) > 2 and isinstance(state[2], dict):
+                stack.extend(state[2].values())
+    if total:
+        return int(total)
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+class SegmentModels:
+    """Bounded LRU of lazily loaded per-segment ModelHandles"""
+
+    def __init__(self, directory=None, max_models=DEFAULT_MAX_MODELS, max_bytes=DEFAULT_MAX_BYTES,
+                 mmap_mode='r', reload_interval=5.0):
+        """
+        Args:
+            directory: Directory of <segment>.npz / <segment>.pkl files
+            max_models: Most models kept loaded at once
+            max_bytes: Most estimated model memory kept loaded (see model_nbytes)
+            mmap_mode: Passed to each ModelHandle
+            reload_interval: Minimum seconds between directory rescans
+                (and per-model mtime checks)
+        """
+        self.directory = directory or DEFAULT_SEGMENT_MODEL_DIR
+        self.max_models = max_models
+        self.max_bytes = max_bytes
+        self.mmap_mode = mmap_mode
+        self.reload_interval = reload_interval
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()   # segment -> (handle, generation, nbytes, measured model version)
+        self.nbytes = 0
+        self.generation = 0
+        self.loads = 0
+        self.evictions = 0
+        self._paths = {}
+        self._scanned_at = None
+
+    def paths(self):
+        """Segment -> model file, from a directory listing cached for reload_interval"""
+        now = time.monotonic()
+        if self._scanned_at is not None and now - self._scanned_at < self.reload_interval:
+            return self._paths
+        paths = {}
+        try:
+            names = sorted(os.listdir(self.directory))
+        except OSError:
+            names = []
+        for ext in reversed(MODEL_EXTENSIONS):
+            for name in names:
+                if name.endswith(ext):
+                    paths[name[:-len(ext)]] = os.path.join(self.directory, name)
+        self._paths = paths
+        self._scanned_at = now
+        return paths
+
+    def route(self, segment):
+        """
+        Model for a segment, loading it on first use
+
+        Returns:
+            (model, version) - model is None when the segment has no model
+            file (or it failed to load); version identifies the model
+            instance for result caching
+        """
+        path = self.paths().get(segment)
+        if path is None:
+            return None, None
+
+        with self.lock:
+            entry = self.entries.get(segment)
+            if entry is not None and entry[0].path != path:
+                self._drop(segment)
+                entry = None
+            if entry is not None:
+                self.entries.move_to_end(segment)
+        if entry is None:
+            entry = self._load(segment, path)
+
+        handle, generation, _, measured = entry
+        model = handle.current()
+        if handle.version != measured:
+            # Hot reloaded since it was measured: the new model may be bigger
+            self._remeasure(segment, handle, generation)
+        return model, (segment, generation, handle.version)
+
+    def _load(self, segment, path):
+        # Loaded outside the lock; if two threads race, the second install wins
+        handle = ModelHandle(path, mmap_mode=self.mmap_mode, reload_interval=self.reload_interval)
+        version = handle.version
+        nbytes = model_nbytes(handle.model, path) if handle.model is not None else 0
+        with self.lock:
+            if segment in self.entries:
+                self._drop(segment)
+            self.generation += 1
+            entry = (handle, self.generation, nbytes, version)
+            self.entries[segment] = entry
+            self.nbytes += nbytes
+            self.loads += 1
+            self._evict(segment)
+        return entry
+
+    def _remeasure(self, segment, handle, generation):
+        version = handle.version
+        model = handle.model
+        nbytes = model_nbytes(model, handle.path) if model is not None else 0
+        with self.lock:
+            entry = self.entries.get(segment)
+            if entry is None or entry[1] != generation:
+                return   # evicted or replaced meanwhile
+            self.nbytes += nbytes - entry[2]
+            self.entries[segment] = (handle, generation, nbytes, version)
+            self._evict(segment)
+
+    def _evict(self, keep):
+        # Evict least recently used models, never `keep` (the one just loaded or measured)
+        while len(self.entries) > 1 and (
+            len(self.entries) > self.max_models or self.nbytes > self.max_bytes
+        ):
+            oldest = next(segment for segment in self.entries if segment != keep)
+            self._drop(oldest)
+            self.evictions += 1
+
+    def _drop(self, segment):
+        _, _, nbytes, _ = self.entries.pop(segment)
+        self.nbytes -= nbytes
+
+    def stats(self):
+        with self.lock:
+            return {
+                'directory': self.directory,
+                'available': sorted(self._paths),
+                'loaded': {
+                    segment: dict(handle.info, nbytes=nbytes)
+                    for segment, (handle, _, nbytes, _) in self.entries.items()
+                },
+                'loaded_bytes': self.nbytes,
+                'max_models': self.max_models,
+                'max_bytes': self.max_bytes,
+                'loads': self.loads,
+                'evictions': self.evictions,
+            }
@@ -0,0 +1,430 @@
+#!/usr/bin/env python3
+"""
+Offline replay / backtesting for FraudDetector
+
+Streams a historical transaction log (CSV, or Parquet when pyarrow is
+installed) in chunks and scores every transaction as of that moment, then
+rules + model, then folds it into the account's history.
+
+By default features come from the same window the transfer path sends as
+userHistory - the account's last 50 transactions within 30 days (see
+server.js) - so thresholds tuned on a replay carry over. The log only has
+each account's own (sent) transactions, so the window lacks the incoming
+transfers the live query also returns. --history state instead scores
+from the lifetime rolling state, as the stateful path (requests without
+userHistory) does. Rows without a timestamp cannot be placed in time and
+are skipped (counted in the report's skipped_undated).
+
+Rows are sharded by account across worker processes, so each account's
+state lives in exactly one worker and its transactions are scored in log
+order. The log must be sorted by time. Chunks are handed to workers over
+bounded queues, so memory stays bounded by the chunk size plus per-account
+state. If a worker dies the driver raises instead of waiting on it, and the
+other workers are terminated.
+
+With a recipient column, the payee features come from the window's
+recipients (or, with --history state, each account's lifetime payee counts,
+as the recipient index keeps them); a recipient's fan-in spans accounts, so
+the driver counts it in log order.
+
+Each row is scored with its segment's model (see model_registry.py), routed
+from the account's transaction count so far and, with an account type
+column, its account type.
+
+Usage:
+    python replay.py transactions.csv --label-column is_fraud --workers 8
+
+Output (JSON): confusion counts, precision/recall against the label column
+(when given) and a per-rule hit table.
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import multiprocessing as mp
+import zlib
+from collections import deque
+from datetime import datetime
+from queue import Empty, Full
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import numpy as np
+
+DEFAULT_CHUNKSIZE = 200000
+
+# History window of the live transfer path (server.js's userHistory query)
+HISTORY_WINDOW_ROWS = 50
+HISTORY_WINDOW_S = 30 * 86400
+
+# Feature sources: the live userHistory window, or the lifetime rolling state
+HISTORY_MODES = ('window', 'state')
+
+# Seconds between worker liveness checks while the driver waits on a queue
+WORKER_POLL_S = 1.0
+
+
+def iter_chunks(path, columns, chunksize):
+    """Yield DataFrame chunks of `columns` from a CSV or Parquet log"""
+    import pandas as pd
+
+    if path.endswith('.parquet'):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise SystemExit('Reading Parquet logs requires pyarrow')
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunksize, columns=columns):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(path, usecols=columns, chunksize=chunksize)
+
+
+def to_epoch_seconds(values):
+    """Vectorized createdAt -> epoch seconds (numbers pass through, naive strings are UTC)"""
+    import pandas as pd
+
+    if pd.api.types.is_numeric_dtype(values):
+        return values.to_numpy(dtype=float)
+    parsed = pd.to_datetime(values, utc=True, errors='coerce')
+    return ((parsed - pd.Timestamp(0, tz='UTC')) / pd.Timedelta(seconds=1)).to_numpy(dtype=float)
+
+
+def recipients_of(values):
+    """Recipient column as a list of strings, None where missing"""
+    return [None if value != value or value in (None, '') else str(value) for value in values.tolist()]
+
+
+def count_fan_in(accounts, recipients, senders):
+    """
+    Distinct earlier senders of each row's recipient, in log order
+
+    Args:
+        accounts: Sending account of each row
+        recipients: Recipient of each row (None if unknown)
+        senders: recipient -> set of accounts seen so far; updated in place
+
+    Returns:
+        int64 array of fan-in counts as of each row (before it is recorded)
+    """
+    fan_in = np.zeros(len(accounts), dtype=np.int64)
+    for i, (account, recipient) in enumerate(zip(accounts, recipients)):
+        if recipient is None:
+            continue
+        seen = senders.setdefault(recipient, set())
+        fan_in[i] = len(seen)
+        seen.add(account)
+    return fan_in
+
+
+def _put(queue, item, proc):
+    """Put onto a worker's bounded inbox, failing instead of blocking if the worker died"""
+    while True:
+        try:
+            queue.put(item, timeout=WORKER_POLL_S)
+            return
+        except Full:
+            if not proc.is_alive():
+                raise RuntimeError(f'Replay worker {proc.name} exited with code {proc.exitcode}')
+
+
+def _collect(outbox, procs, n_rules):
+    """Merge every worker's totals, failing instead of blocking if a worker died"""
+    totals = ReplayTotals(n_rules)
+    remaining = len(procs)
+    while remaining:
+        try:
+            totals.merge(outbox.get(timeout=WORKER_POLL_S))
+            remaining -= 1
+        except Empty:
+            # A worker that exited cleanly has already put its totals
+            dead = [proc for proc in procs if proc.exitcode not in (None, 0)]
+            if dead:
+                raise RuntimeError(f'Replay worker {dead[0].name} exited with code {dead[0].exitcode}')
+    return totals
+
+
+def shard_of(account, shards):
+    """Stable shard number for an account id (same in every process)"""
+    return zlib.crc32(str(account).encode()) % shards
+
+
+class ReplayTotals:
+    """Counts accumulated by one worker and merged by the driver"""
+
+    def __init__(self, n_rules):
+        self.rows = 0
+        self.flagged = 0
+        self.labelled = 0
+        self.tp = self.fp = self.fn = self.tn = 0
+        self.rule_hits = np.zeros(n_rules, dtype=np.int64)
+        self.rule_fraud_hits = np.zeros(n_rules, dtype=np.int64)
+
+    def merge(self, other):
+        for name in ('rows', 'flagged', 'labelled', 'tp', 'fp', 'fn', 'tn'):
+            setattr(self, name, getattr(self, name) + getattr(other, name))
+        self.rule_hits += other.rule_hits
+        self.rule_fraud_hits += other.rule_fraud_hits
+
+
+def _replay_worker(inbox, outbox, rules_path, model_path, threshold, history='window'):
+    """Worker process: owns the state of one account shard"""
+    from fraud_detector import FraudDetector, FEATURE_NAMES
+    from account_state import AccountStats
+    from velocity import VelocityRing
+    from recipient_index import payee_features, payee_counts_from_history
+    from model_registry import segment_of
+
+    detector = FraudDetector(rules_path=rules_path, model_path=model_path)
+    ruleset = detector.rules.ruleset
+    state = {}
+    windows = {}  # account -> deque of recent history rows (window mode)
+    payees = {}   # account -> {recipient: transfers}, as the recipient index keeps them
+    totals = ReplayTotals(len(ruleset))
+
+    while True:
+        chunk = inbox.get()
+        if chunk is None:
+            break
+        accounts, amounts, ts, labels, recipients, fan_in, account_types = chunk
+
+        X = np.empty((len(accounts), len(FEATURE_NAMES)))
+        segments = []
+        for i, (account, amount, epoch) in enumerate(zip(accounts, amounts.tolist(), ts.tolist())):
+            stats, ring = state.get(account, (None, None))
+            request = {'accountType': account_types[i]} if account_types is not None else {}
+            # Segments route on the lifetime count, as the live path does
+            segments.append(segment_of(request, stats.count if stats is not None else 0))
+            now = datetime.fromtimestamp(epoch)
+            recipient = recipients[i] if recipients is not None else None
+
+            if history == 'window':
+                window = windows.get(account)
+                if window is None:
+                    window = windows[account] = deque(maxlen=HISTORY_WINDOW_ROWS)
+                while window and window[0]['createdAt'] < epoch - HISTORY_WINDOW_S:
+                    window.popleft()
+                rows = list(window)
+                payee = None
+                if recipient is not None:
+                    counts = payee_counts_from_history(rows, recipient)
+                    count, fan_out = counts if counts is not None else (0, 0)
+                    payee = payee_features(count, counts is not None, fan_out, int(fan_in[i]))
+                features = detector.extract_features({'amount': amount}, rows, now=now, payee=payee)
+            else:
+                payee = None
+                if recipient is not None:
+                    counts = payees.get(account)
+                    payee = payee_features(
+                        counts.get(recipient, 0) if counts else 0, counts is not None,
+                        len(counts) if counts else 0, int(fan_in[i])
+                    )
+                features = detector.extract_features_from_state(
+                    {'amount': amount}, stats, ring or VelocityRing(), now=now, payee=payee
+                )
+            X[i] = [features[name] for name in FEATURE_NAMES]
+
+            # Fold the transaction in after scoring, as the live path does
+            if stats is None:
+                stats, ring = AccountStats(), VelocityRing()
+                state[account] = (stats, ring)
+            stats.update(amount, epoch)
+            if history == 'window':
+                row = {'amount': amount, 'createdAt': epoch}
+                if recipient is not None:
+                    row['toRib'] = recipient
+                window.append(row)
+            else:
+                ring.add(epoch, amount)
+                if recipient is not None:
+                    counts = payees.setdefault(account, {})
+                    counts[recipient] = counts.get(recipient, 0) + 1
+
+        scores, fired, _, _ = detector.calculate_risk_scores(X, ruleset, segments=segments)
+        flagged = scores > threshold
+
+        totals.rows += len(accounts)
+        totals.flagged += int(flagged.sum())
+        totals.rule_hits += fired.sum(axis=0)
+        if labels is not None:
+            truth = labels.astype(bool)
+            totals.labelled += len(truth)
+            totals.tp += int((flagged & truth).sum())
+            totals.fp += int((flagged & ~truth).sum())
+            totals.fn += int((~flagged & truth).sum())
+            totals.tn += int((~flagged & ~truth).sum())
+            totals.rule_fraud_hits += fired[truth].sum(axis=0)
+
+    outbox.put(totals)
+
+
+def replay(path, account_column='accountId', amount_column='amount', time_column='createdAt',
+           label_column=None, workers=None, chunksize=DEFAULT_CHUNKSIZE,
+           rules_path=None, model_path=None, threshold=0.8, recipient_column=None,
+           account_type_column=None, history='window'):
+    """
+    Replay a transaction log through FraudDetector
+
+    Without a recipient column the payee features keep their defaults
+    (no recipient), as for live transactions without a toRib.
+
+    Args:
+        history: 'window' (the live userHistory window) or 'state' (the
+            lifetime rolling state); see the module docstring
+
+    Returns:
+        Report dict (see module docstring)
+    """
+    from rules import RuleEngine
+    from fraud_detector import FEATURE_NAMES
+
+    if history not in HISTORY_MODES:
+        raise ValueError(f'history must be one of {HISTORY_MODES}, not {history!r}')
+    workers = workers or os.cpu_count() or 1
+    ruleset = RuleEngine(rules_path, features=FEATURE_NAMES).ruleset
+
+    columns = [account_column, amount_column, time_column]
+    if label_column:
+        columns.append(label_column)
+    if recipient_column:
+        columns.append(recipient_column)
+    if account_type_column:
+        columns.append(account_type_column)
+    senders = {}
+    skipped = 0
+
+    ctx = mp.get_context('spawn')
+    inboxes = [ctx.Queue(maxsize=2) for _ in range(workers)]
+    outbox = ctx.Queue()
+    procs = [
+        ctx.Process(target=_replay_worker, args=(inbox, outbox, rules_path, model_path, threshold, history))
+        for inbox in inboxes
+    ]
+    for proc in procs:
+        proc.start()
+
+    started = time.perf_counter()
+    try:
+        for chunk in iter_chunks(path, columns, chunksize):
+            ts = to_epoch_seconds(chunk[time_column])
+            # Undated rows can't be placed in time; scoring them at the
+            # wall-clock time would make the report depend on when it ran
+            dated = ~np.isnan(ts)
+            if not dated.all():
+                skipped += int((~dated).sum())
+                chunk, ts = chunk[dated], ts[dated]
+            accounts = chunk[account_column].astype(str).to_numpy()
+            amounts = chunk[amount_column].to_numpy(dtype=float)
+            labels = chunk[label_column].to_numpy() if label_column else None
+            recipients = fan_in = None
+            if recipient_column:
+                recipients = recipients_of(chunk[recipient_column])
+                fan_in = count_fan_in(accounts.tolist(), recipients, senders)
+            account_types = chunk[account_type_column].astype(str).to_numpy() if account_type_column else None
+
+            shard = np.fromiter((shard_of(a, workers) for a in accounts), dtype=np.int64, count=len(accounts))
+            for k, inbox in enumerate(inboxes):
+                idx = np.flatnonzero(shard == k)
+                if len(idx):
+                    _put(inbox, (
+                        accounts[idx].tolist(), amounts[idx], ts[idx],
+                        labels[idx] if labels is not None else None,
+                        [recipients[j] for j in idx] if recipients is not None else None,
+                        fan_in[idx] if fan_in is not None else None,
+                        account_types[idx].tolist() if account_types is not None else None
+                    ), procs[k])
+        for inbox, proc in zip(inboxes, procs):
+            _put(inbox, None, proc)
+        totals = _collect(outbox, procs, len(ruleset))
+    except BaseException:
+        for proc in procs:
+            proc.terminate()
+        raise
+    finally:
+        for proc in procs:
+            proc.join()
+    elapsed = time.perf_counter() - started
+
+    report = {
+        'success': True,
+        'rows': totals.rows,
+        'skipped_undated': skipped,
+        'history': history,
+        'flagged': totals.flagged,
+        'threshold': threshold,
+        'workers': workers,
+        'elapsed_s': round(elapsed, 2),
+        'rows_per_s': round(totals.rows / elapsed, 1) if elapsed > 0 else None,
+        'rules': [
+            {
+                'name': ruleset.names[i],
+                'shadow': bool(ruleset.shadow[i]),
+                'hits': int(totals.rule_hits[i]),
+                'hit_rate': round(totals.rule_hits[i] / totals.rows, 6) if totals.rows else 0,
+                'fraud_hits': int(totals.rule_fraud_hits[i]) if label_column else None,
+                'precision': (
+                    round(totals.rule_fraud_hits[i] / totals.rule_hits[i], 4)
+                    if label_column and totals.rule_hits[i] else None
+                ),
+            }
+            for i in range(len(ruleset))
+        ],
+    }
+
+    if label_column:
+        tp, fp, fn = totals.tp, totals.fp, totals.fn
+        report['labels'] = {
+            'tp': tp, 'fp': fp, 'fn': fn, 'tn': totals.tn,
+            'precision': round(tp / (tp + fp), 4) if tp + fp else None,
+            'recall': round(tp / (tp + fn), 4) if tp + fn else None,
+        }
+
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay a transaction log through FraudDetector')
+    parser.add_argument('path', help='CSV or Parquet transaction log, sorted by time')
+    parser.add_argument('--account-column', default='accountId')
+    parser.add_argument('--amount-column', default='amount')
+    parser.add_argument('--time-column', default='createdAt')
+    parser.add_argument('--label-column', help='Boolean/0-1 fraud label column')
+    parser.add_argument('--recipient-column', help='Recipient (toRib) column, for the payee features')
+    parser.add_argument('--account-type-column', help='Account type column, for routing to segment models')
+    parser.add_argument('--history', choices=HISTORY_MODES, default='window',
+                        help='Score from the live userHistory window (default) or the lifetime rolling state')
+    parser.add_argument('--workers', type=int, help='Worker processes (default: CPU count)')
+    parser.add_argument('--chunksize', type=int, default=DEFAULT_CHUNKSIZE)
+    parser.add_argument('--rules', help='Rule file to evaluate (default: rules.json)')
+    parser.add_argument('--model', help='Model file (default: as FraudDetector)')
+    parser.add_argument('--threshold', type=float, default=0.8, help='is_fraud threshold')
+    parser.add_argument('--out', help='Write the JSON report here instead of stdout')
+    args = parser.parse_args()
+
+    report = replay(
+        args.path,
+        account_column=args.account_column,
+        amount_column=args.amount_column,
+        time_column=args.time_column,
+        label_column=args.label_column,
+        workers=args.workers,
+        chunksize=args.chunksize,
+        rules_path=args.rules,
+        model_path=args.model,
+        threshold=args.threshold,
+        recipient_column=args.recipient_column,
+        account_type_column=args.account_type_column,
+        history=args.history,
+    )
+
+    output = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, 'w') as fh:
+            fh.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Short-lived cache of fraud scoring results
+
+The same transaction is often scored more than once within seconds: the
+fraud-check endpoint followed by the transfer itself, client retries and
+double submits. Results are cached under the transaction's amount and
+recipient plus a fingerprint of the account's history (or rolling state),
+so any new transaction on the account changes the key.
+
+Some features depend on the scoring time rather than on the history: the
+hour/day of week, the velocity window counts and hours_since_last_tx. Each
+entry therefore carries its own expiry - the earliest moment one of those
+features could change the result (see FraudDetector.result_expiry) - in
+addition to the cache-wide TTL. The cache is bounded and evicts the least
+recently used entry first.
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from velocity import VELOCITY_WINDOWS
+from recipient_index import recipient_of
+
+DEFAULT_MAX_ENTRIES = 4096
+DEFAULT_TTL_S = 60.0
+
+
+def history_fingerprint(history):
+    """
+    Fingerprint of a history in column form (see columnar.py)
+
+    Args:
+        history: Columns with float64 `amount` and `ts` arrays
+    """
+    digest = hashlib.sha1()
+    digest.update(np.ascontiguousarray(history.amount, dtype='<f8').tobytes())
+    digest.update(np.ascontiguousarray(history.ts, dtype='<f8').tobytes())
+    return digest.hexdigest()
+
+
+def result_key(account_id, transaction, fingerprint, *versions):
+    """
+    Cache key for scoring `transaction` against an account's history
+
+    Args:
+        account_id: Account identifier (or None)
+        transaction: Transaction dict; only its amount and recipient matter
+        fingerprint: History or state fingerprint
+        versions: Identity of the active rules/model, so a reload misses
+    """
+    return (account_id, float(transaction.get('amount', 0)), recipient_of(transaction), fingerprint) + versions
+
+
+def velocity_change_at(ts, now_ts):
+    """
+    Earliest time after now_ts at which a velocity window count changes
+
+    Args:
+        ts: Transaction timestamps (epoch seconds; NaN for unknown)
+        now_ts: Scoring time
+
+    Returns:
+        Epoch seconds, or inf if no window can change
+    """
+    ts = np.asarray(ts, dtype=float)
+    ts = ts[~np.isnan(ts)]
+    if len(ts) == 0:
+        return float('inf')
+
+    change = float('inf')
+    # A future-dated transaction enters every window once its time comes
+    future = ts[ts > now_ts]
+    if len(future):
+        change = float(future.min())
+    # The oldest transaction in each window leaves it `seconds` after its time
+    for seconds in VELOCITY_WINDOWS.values():
+        inside = ts[(ts > now_ts - seconds) & (ts <= now_ts)]
+        if len(inside):
+            change = min(change, float(inside.min()) + seconds)
+    return change
+
+
+class ResultCache:
+    """Thread-safe LRU of scoring results with a TTL and per-entry expiry"""
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, ttl_s=DEFAULT_TTL_S):
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key, now_ts):
+        """Cached result for key if it is still valid at now_ts, else None"""
+        with self.lock:
+            found = self.entries.get(key)
+            if found is not None and found[0] <= now_ts:
+                del self.entries[key]
+                self.expired += 1
+                found = None
+            if found is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return found[1]
+
+    def put(self, key, result, now_ts, expires_at=float('inf')):
+        """
+        Cache a result until the earlier of now_ts + TTL and expires_at
+
+        Results that would expire immediately are not stored.
+        """
+        expires_at = min(expires_at, now_ts + self.ttl_s)
+        if expires_at <= now_ts:
+            return
+        with self.lock:
+            self.entries[key] = (expires_at, result)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self.entries),
+                'max_entries': self.max_entries,
+                'ttl_s': self.ttl_s,
+                'hits': self.hits,
+                'misses': self.misses,
+                'expired': self.expired,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+            }
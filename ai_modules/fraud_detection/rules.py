@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+"""
+Declarative fraud rule engine
+
+Rules live in a JSON file (see rules.json), each with a name, a predicate
+over feature names, a weight and a reason:
+
+    {"name": "large_amount", "when": "amount > 5000", "weight": 0.2,
+     "reason": "Very large transaction amount"}
+
+Predicates are a small expression language (comparisons, and/or/not,
+arithmetic on features and numbers). The whole rule file is compiled once
+into two Python functions: one over scalar feature dicts for the single
+transaction path, and one over feature columns that returns boolean masks
+for a whole batch. Rules marked "shadow": true are evaluated and reported
+but do not contribute to the score. The file is re-read when it changes.
+"""
+
+import ast
+import os
+import sys
+import json
+import time
+import threading
+import numpy as np
+
+DEFAULT_RULES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'rules.json')
+
+_COMPARE_OPS = {
+    ast.Gt: '>', ast.GtE: '>=', ast.Lt: '<', ast.LtE: '<=', ast.Eq: '==', ast.NotEq: '!=',
+}
+_ARITH_OPS = {
+    ast.Add: '+', ast.Sub: '-', ast.Mult: '*', ast.Div: '/',
+}
+
+
+class RuleError(ValueError):
+    """Raised when a rule file cannot be parsed or compiled"""
+
+
+class _Emitter:
+    """Translate a predicate AST into scalar or vectorized Python source"""
+
+    def __init__(self, features, vector):
+        self.features = features
+        self.vector = vector
+
+    def emit(self, node):
+        if isinstance(node, ast.Expression):
+            return self.emit(node.body)
+
+        if isinstance(node, ast.BoolOp):
+            parts = [self.emit(v) for v in node.values]
+            return self.join(parts, 'and' if isinstance(node.op, ast.And) else 'or')
+
+        if isinstance(node, ast.UnaryOp):
+            if isinstance(node.op, ast.Not):
+                inner = self.emit(node.operand)
+                return f'np.logical_not({inner})' if self.vector else f'(not {inner})'
+            if isinstance(node.op, ast.USub):
+                return f'(-{self.emit(node.operand)})'
+            raise RuleError(f'Unsupported operator: {type(node.op).__name__}')
+
+        if isinstance(node, ast.Compare):
+            # Chained comparisons (a < b < c) become a conjunction of pairs
+            pairs = []
+            left = node.left
+            for op, right in zip(node.ops, node.comparators):
+                if type(op) not in _COMPARE_OPS:
+                    raise RuleError(f'Unsupported comparison: {type(op).__name__}')
+                pairs.append(f'({self.emit(left)} {_COMPARE_OPS[type(op)]} {self.emit(right)})')
+                left = right
+            if len(pairs) == 1:
+                return pairs[0]
+            return self.join(pairs, 'and')
+
+        if isinstance(node, ast.BinOp):
+            if type(node.op) not in _ARITH_OPS:
+                raise RuleError(f'Unsupported operator: {type(node.op).__name__}')
+            return f'({self.emit(node.left)} {_ARITH_OPS[type(node.op)]} {self.emit(node.right)})'
+
+        if isinstance(node, ast.Name):
+            if node.id not in self.features:
+                raise RuleError(f'Unknown feature: {node.id}')
+            return f'f[{node.id!r}]'
+
+        if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)) \
+                and not isinstance(node.value, bool):
+            return repr(node.value)
+
+        raise RuleError(f'Unsupported expression: {type(node).__name__}')
+
+    def join(self, parts, op):
+        """Combine sub-expressions with 'and' / 'or'"""
+        if self.vector:
+            expr = parts[0]
+            for part in parts[1:]:
+                expr = f'np.logical_{op}({expr}, {part})'
+            return expr
+        return '(' + f' {op} '.join(parts) + ')'
+
+
+def _number(node):
+    """Value of a numeric literal (optionally negated), else None"""
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.USub):
+        value = _number(node.operand)
+        return None if value is None else -value
+    if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)) \
+            and not isinstance(node.value, bool):
+        return float(node.value)
+    return None
+
+
+def _collect_cut_points(tree, cut_points, opaque):
+    """
+    Record the constants each feature is directly compared against
+
+    Features used in any other way (arithmetic, feature-to-feature
+    comparisons) are added to `opaque`: their cut points are unknown.
+    """
+    direct = set()
+    for node in ast.walk(tree):
+        if not isinstance(node, ast.Compare):
+            continue
+        operands = [node.left] + node.comparators
+        for left, right in zip(operands, operands[1:]):
+            for name, other in ((left, right), (right, left)):
+                value = _number(other)
+                if isinstance(name, ast.Name) and value is not None:
+                    cut_points.setdefault(name.id, set()).add(value)
+                    direct.add(id(name))
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name) and id(node) not in direct:
+            opaque.add(node.id)
+
+
+class RuleSet:
+    """An immutable, compiled set of rules"""
+
+    def __init__(self, spec, features):
+        """
+        Args:
+            spec: Parsed rule file ({'rules': [...], 'max_score': 1.0})
+            features: Names a predicate may reference
+        """
+        rules = spec.get('rules', [])
+        if not rules:
+            raise RuleError('Rule file defines no rules')
+
+        self.version = spec.get('version')
+        self.max_score = float(spec.get('max_score', 1.0))
+        self.names = []
+        self.reasons = []
+        self.expressions = []
+        weights = []
+        shadow = []
+
+        cut_points = {}
+        self.opaque_features = set()
+
+        scalar_src = []
+        vector_src = []
+        for rule in rules:
+            try:
+                name = rule['name']
+                when = rule['when']
+                tree = ast.parse(when, mode='eval')
+            except KeyError as e:
+                raise RuleError(f'Rule is missing field {e}: {rule}')
+            except SyntaxError as e:
+                raise RuleError(f'Rule {rule.get("name")}: invalid predicate: {e}')
+
+            try:
+                scalar_src.append(_Emitter(features, vector=False).emit(tree))
+                vector_src.append(f'np.broadcast_to({_Emitter(features, vector=True).emit(tree)}, (n,))')
+            except RuleError as e:
+                raise RuleError(f'Rule {name}: {e}')
+
+            _collect_cut_points(tree, cut_points, self.opaque_features)
+            self.names.append(name)
+            self.reasons.append(rule.get('reason', name))
+            self.expressions.append(when)
+            weights.append(float(rule.get('weight', 0)))
+            shadow.append(bool(rule.get('shadow', False)))
+
+        if len(set(self.names)) != len(self.names):
+            raise RuleError('Rule names must be unique')
+
+        self.weights = np.array(weights)
+        self.shadow = np.array(shadow, dtype=bool)
+        self.active_weights = np.where(self.shadow, 0.0, self.weights)
+        self._cut_points = {name: sorted(values) for name, values in cut_points.items()}
+
+        scope = {'np': np}
+        code = (
+            'def scalar(f):\n    return [' + ', '.join(scalar_src) + ']\n'
+            'def vector(f, n):\n    return [' + ', '.join(vector_src) + ']\n'
+        )
+        exec(compile(code, '<rules>', 'exec'), scope)
+        self._scalar = scope['scalar']
+        self._vector = scope['vector']
+
+    def __len__(self):
+        return len(self.names)
+
+    def cut_points(self, feature):
+        """
+        Sorted constants the rules compare a feature against
+
+        Rule outcomes can only change when the feature crosses one of them.
+
+        Returns:
+            List of values ([] if no rule uses the feature), or None if a
+            rule uses it in an expression, so no such values are known
+        """
+        if feature in self.opaque_features:
+            return None
+        return self._cut_points.get(feature, [])
+
+    def evaluate(self, features):
+        """
+        Evaluate every rule on one transaction
+
+        Args:
+            features: Feature dict
+
+        Returns:
+            (score, fired) where fired is a list of indexes of rules that matched
+        """
+        hits = self._scalar(features)
+        fired = [i for i, hit in enumerate(hits) if hit]
+        score = sum(self.active_weights[i] for i in fired)
+        return min(float(score), self.max_score), fired
+
+    def evaluate_batch(self, columns, n):
+        """
+        Evaluate every rule on a batch as vector masks
+
+        Args:
+            columns: Dict of feature name -> length-n array
+            n: Batch size
+
+        Returns:
+            (scores, mask) with mask a boolean (n, len(self)) array
+        """
+        mask = np.column_stack(self._vector(columns, n)).astype(bool)
+        scores = np.minimum(mask @ self.active_weights, self.max_score)
+        return scores, mask
+
+    def describe(self, index):
+        """Structured description of one rule, as reported to callers"""
+        return {
+            'name': self.names[index],
+            'weight': float(self.weights[index]),
+            'reason': self.reasons[index],
+            'shadow': bool(self.shadow[index]),
+        }
+
+
+class RuleEngine:
+    """
+    Loads a rule file and keeps its compiled RuleSet current
+
+    The file's mtime is checked at most every `reload_interval` seconds; a
+    changed file is compiled into a new RuleSet and swapped in. If the new
+    file fails to compile the previous rules stay active.
+    """
+
+    def __init__(self, path=None, features=(), reload_interval=1.0):
+        self.path = path or os.environ.get('FRAUD_RULES_PATH', DEFAULT_RULES_PATH)
+        self.features = set(features)
+        self.reload_interval = reload_interval
+        self.lock = threading.Lock()
+        self._mtime = os.stat(self.path).st_mtime
+        self._checked_at = 0.0
+        self.ruleset = self._load()
+
+    def _load(self):
+        with open(self.path) as fh:
+            spec = json.load(fh)
+        return RuleSet(spec, self.features)
+
+    def current(self):
+        """Return the active RuleSet, reloading the file if it changed"""
+        now = time.monotonic()
+        if now - self._checked_at < self.reload_interval:
+            return self.ruleset
+
+        with self.lock:
+            if now - self._checked_at < self.reload_interval:
+                return self.ruleset
+            self._checked_at = now
+            try:
+                mtime = os.stat(self.path).st_mtime
+                if mtime != self._mtime:
+                    # Record the mtime first so a broken file is reported once
+                    self._mtime = mtime
+                    self.ruleset = self._load()
+            except (OSError, ValueError) as e:
+                print(f'Rule reload failed, keeping previous rules: {e}', file=sys.stderr)
+        return self.ruleset
@@ -0,0 +1,397 @@
+#!/usr/bin/env python3
+"""
+Flat-array export and evaluator for the fraud tree ensemble
+
+Compiles a fitted tree ensemble (sklearn decision tree / random forest /
+extra trees / gradient boosting, or an XGBoost classifier) into flat NumPy
+arrays - feature index, threshold, child pointers and leaf values for every
+node of every tree - and evaluates them directly, skipping the estimator's
+input validation and per-call overhead.
+
+Usage:
+    python tree_export.py fraud_model.pkl [fraud_model.npz]
+
+The export is checked against the source model's predict_proba before the
+.npz file is written, uncompressed. FlatEnsemble.load memory-maps its
+arrays (see npz_mmap.py), so the exported model is shared between worker
+processes.
+"""
+
+import os
+import sys
+import json
+import math
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from npz_mmap import load_npz_mmap
+
+# How per-tree leaf values combine into P(fraud)
+KIND_MEAN_PROBA = 0   # average of per-tree probabilities (random forest)
+KIND_LOGIT_SUM = 1    # sigmoid(base + scale * sum of leaves) (boosting)
+
+# Maximum allowed |flat - predict_proba| when verifying an export
+DEFAULT_TOLERANCE = 1e-6
+
+
+class FlatEnsemble:
+    """
+    Tree ensemble stored as flat node arrays
+
+    Leaves point to themselves and compare against +inf, so every tree can
+    be advanced `max_depth` steps in lockstep without per-tree branching.
+    """
+
+    def __init__(self, feature, threshold, left, right, value, roots,
+                 kind, base, scale, max_depth, strict=False, n_features=None):
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.value = value
+        self.roots = roots
+        self.kind = int(kind)
+        self.base = float(base)
+        self.scale = float(scale)
+        self.max_depth = int(max_depth)
+        self.strict = bool(strict)   # XGBoost splits on x < t, sklearn on x <= t
+        self.n_features = n_features
+        # Nodes compared all at once when that is cheaper than walking the trees
+        self.precompare = len(feature) <= 4096
+        self._split_points = {}
+
+    @property
+    def n_trees(self):
+        return len(self.roots)
+
+    def split_points(self, index):
+        """
+        Sorted thresholds of every split on input column `index`
+
+        The model's output only changes when that input crosses one of them.
+        """
+        points = self._split_points.get(index)
+        if points is None:
+            thresholds = np.asarray(self.threshold)[np.asarray(self.feature) == index]
+            points = np.unique(thresholds[np.isfinite(thresholds)]).astype(float).tolist()
+            self._split_points[index] = points
+        return points
+
+    def _leaves(self, X):
+        """Leaf node index reached in every tree, shape (n_rows, n_trees)"""
+        # Both sklearn and XGBoost compare float32 inputs against the thresholds
+        X = X.astype(np.float32)
+        node = np.broadcast_to(self.roots, (len(X), self.n_trees)).copy()
+        rows = np.arange(len(X))[:, None]
+        for _ in range(self.max_depth):
+            x = X[rows, self.feature[node]]
+            if self.strict:
+                go_left = x < self.threshold[node]
+            else:
+                go_left = x <= self.threshold[node]
+            node = np.where(go_left, self.left[node], self.right[node])
+        return node
+
+    def _leaves_one(self, x):
+        """Leaf node index reached in every tree for a single row"""
+        x = x.astype(np.float32)
+        if self.precompare:
+            # Small ensembles: decide every split once, then just chase pointers
+            if self.strict:
+                go_right = ~(x[self.feature] < self.threshold)
+            else:
+                go_right = x[self.feature] > self.threshold
+            next_node = np.where(go_right, self.right, self.left)
+            node = self.roots
+            for _ in range(self.max_depth):
+                node = next_node[node]
+            return node
+
+        node = self.roots
+        for _ in range(self.max_depth):
+            if self.strict:
+                go_right = ~(x[self.feature[node]] < self.threshold[node])
+            else:
+                go_right = x[self.feature[node]] > self.threshold[node]
+            node = np.where(go_right, self.right[node], self.left[node])
+        return node
+
+    def predict_fraud(self, X):
+        """P(fraud) for each row of a 2-D feature array"""
+        leaf_values = self.value[self._leaves(X)]
+        if self.kind == KIND_MEAN_PROBA:
+            return leaf_values.mean(axis=1)
+        raw = self.base + self.scale * leaf_values.sum(axis=1)
+        return 1.0 / (1.0 + np.exp(-raw))
+
+    def predict_fraud_one(self, x):
+        """P(fraud) for one feature vector - the low-latency path"""
+        total = float(self.value[self._leaves_one(np.asarray(x, dtype=float))].sum())
+        if self.kind == KIND_MEAN_PROBA:
+            return total / len(self.roots)
+        return 1.0 / (1.0 + math.exp(-(self.base + self.scale * total)))
+
+    def predict_proba(self, X):
+        """sklearn-compatible (n_rows, 2) class probabilities"""
+        X = np.asarray(X, dtype=float)
+        if X.ndim == 1:
+            X = X[None, :]
+        if len(X) == 1:
+            p = np.array([self.predict_fraud_one(X[0])])
+        else:
+            p = self.predict_fraud(X)
+        return np.column_stack([1.0 - p, p])
+
+    def save(self, path):
+        # Uncompressed, so load can memory-map the members
+        np.savez(
+            path,
+            feature=self.feature, threshold=self.threshold,
+            left=self.left, right=self.right, value=self.value, roots=self.roots,
+            meta=np.array([self.kind, self.base, self.scale, self.max_depth,
+                           int(self.strict), self.n_features or -1], dtype=float)
+        )
+
+    @classmethod
+    def load(cls, path, mmap_mode='r'):
+        """
+        Load an export; with mmap_mode the arrays are read-only memory maps
+        of the file (np.load would copy .npz members into private memory)
+        """
+        data = load_npz_mmap(path) if mmap_mode else np.load(path)
+        kind, base, scale, max_depth, strict, n_features = data['meta']
+        return cls(
+            data['feature'], data['threshold'], data['left'], data['right'],
+            data['value'], data['roots'],
+            kind=kind, base=base, scale=scale, max_depth=max_depth,
+            strict=bool(strict), n_features=int(n_features) if n_features >= 0 else None
+        )
+
+
+class _Builder:
+    """Accumulates trees into shared flat arrays"""
+
+    def __init__(self):
+        self.feature = []
+        self.threshold = []
+        self.left = []
+        self.right = []
+        self.value = []
+        self.roots = []
+        self.max_depth = 0
+
+    def add_tree(self, feature, threshold, left, right, value, depth):
+        """
+        Append one tree given its local node arrays (children < 0 mark leaves)
+        """
+        offset = len(self.feature)
+        self.roots.append(offset)
+        self.max_depth = max(self.max_depth, depth)
+        for i in range(len(feature)):
+            if left[i] < 0:
+                self.feature.append(0)
+                self.threshold.append(np.inf)
+                self.left.append(offset + i)
+                self.right.append(offset + i)
+            else:
+                self.feature.append(int(feature[i]))
+                self.threshold.append(float(threshold[i]))
+                self.left.append(offset + int(left[i]))
+                self.right.append(offset + int(right[i]))
+            self.value.append(float(value[i]))
+
+    def build(self, kind, base=0.0, scale=1.0, strict=False, n_features=None):
+        threshold_dtype = np.float32 if strict else np.float64
+        return FlatEnsemble(
+            np.array(self.feature, dtype=np.int32),
+            np.array(self.threshold, dtype=threshold_dtype),
+            np.array(self.left, dtype=np.int32),
+            np.array(self.right, dtype=np.int32),
+            np.array(self.value, dtype=np.float64),
+            np.array(self.roots, dtype=np.int32),
+            kind=kind, base=base, scale=scale, max_depth=self.max_depth,
+            strict=strict, n_features=n_features
+        )
+
+
+def _add_sklearn_classifier_tree(builder, tree):
+    # Leaf value = fraction of the positive class (normalised, since older
+    # sklearn versions store weighted counts rather than fractions)
+    counts = tree.value[:, 0, :]
+    totals = counts.sum(axis=1)
+    totals[totals == 0] = 1
+    positive = counts[:, 1] / totals
+    builder.add_tree(
+        tree.feature, tree.threshold, tree.children_left, tree.children_right,
+        positive, int(tree.max_depth)
+    )
+
+
+def _compile_sklearn(model):
+    name = type(model).__name__
+    n_features = getattr(model, 'n_features_in_', None)
+
+    if len(getattr(model, 'classes_', [])) != 2:
+        raise ValueError(f'{name}: only binary classifiers can be exported')
+
+    if name == 'DecisionTreeClassifier':
+        builder = _Builder()
+        _add_sklearn_classifier_tree(builder, model.tree_)
+        return builder.build(KIND_MEAN_PROBA, n_features=n_features)
+
+    if name in ('RandomForestClassifier', 'ExtraTreesClassifier'):
+        builder = _Builder()
+        for estimator in model.estimators_:
+            _add_sklearn_classifier_tree(builder, estimator.tree_)
+        return builder.build(KIND_MEAN_PROBA, n_features=n_features)
+
+    if name == 'GradientBoostingClassifier':
+        builder = _Builder()
+        for estimator in model.estimators_[:, 0]:
+            tree = estimator.tree_
+            builder.add_tree(
+                tree.feature, tree.threshold, tree.children_left, tree.children_right,
+                tree.value[:, 0, 0], int(tree.max_depth)
+            )
+        flat = builder.build(KIND_LOGIT_SUM, scale=model.learning_rate, n_features=n_features)
+        # Recover the init estimator's raw score from one reference row
+        x0 = np.zeros((1, n_features))
+        leaves = flat.value[flat._leaves(x0)].sum()
+        flat.base = float(model.decision_function(x0)[0] - model.learning_rate * leaves)
+        return flat
+
+    raise ValueError(f'Unsupported model type for export: {name}')
+
+
+def _compile_xgboost(model):
+    booster = model.get_booster() if hasattr(model, 'get_booster') else model
+    feature_names = booster.feature_names or []
+    name_to_index = {n: i for i, n in enumerate(feature_names)}
+
+    def feature_index(split):
+        if split in name_to_index:
+            return name_to_index[split]
+        return int(split.lstrip('f'))
+
+    builder = _Builder()
+    for dump in booster.get_dump(dump_format='json'):
+        root = json.loads(dump)
+        nodes = {}
+        stack = [(root, 0)]
+        depth = 0
+        while stack:
+            node, d = stack.pop()
+            nodes[node['nodeid']] = node
+            depth = max(depth, d)
+            for child in node.get('children', []):
+                stack.append((child, d + 1))
+
+        # Renumber to a dense 0..n-1 order with the root first
+        order = sorted(nodes)
+        index = {nid: i for i, nid in enumerate(order)}
+        feature, threshold, left, right, value = [], [], [], [], []
+        for nid in order:
+            node = nodes[nid]
+            if 'leaf' in node:
+                feature.append(0)
+                threshold.append(0.0)
+                left.append(-1)
+                right.append(-1)
+                value.append(node['leaf'])
+            else:
+                feature.append(feature_index(node['split']))
+                threshold.append(node['split_condition'])
+                left.append(index[node['yes']])
+                right.append(index[node['no']])
+                value.append(0.0)
+        builder.add_tree(feature, threshold, left, right, value, depth)
+
+    config = json.loads(booster.save_config())
+    # Newer XGBoost versions write base_score as a one-element list string
+    base_score = float(str(config['learner']['learner_model_param']['base_score']).strip('[]'))
+    base = float(np.log(base_score / (1 - base_score)))
+    n_features = booster.num_features()
+    return builder.build(KIND_LOGIT_SUM, base=base, strict=True, n_features=n_features)
+
+
+def compile_ensemble(model):
+    """
+    Compile a fitted binary tree-ensemble classifier into a FlatEnsemble
+
+    Raises:
+        ValueError: The model type is not supported
+    """
+    module = type(model).__module__
+    if module.startswith('xgboost'):
+        return _compile_xgboost(model)
+    if module.startswith('sklearn'):
+        return _compile_sklearn(model)
+    raise ValueError(f'Unsupported model type for export: {type(model).__name__}')
+
+
+def verification_rows(flat, n=2000, seed=0):
+    """Random rows spanning the split thresholds of every feature"""
+    rng = np.random.default_rng(seed)
+    n_features = flat.n_features or int(flat.feature.max()) + 1
+    X = np.zeros((n, n_features))
+    split = np.isfinite(flat.threshold)
+    for f in range(n_features):
+        t = flat.threshold[split & (flat.feature == f)].astype(float)
+        if len(t):
+            span = max(t.max() - t.min(), 1.0)
+            X[:, f] = rng.uniform(t.min() - 0.1 * span, t.max() + 0.1 * span, n)
+            # Exact thresholds exercise the <= / < boundary
+            X[: n // 10, f] = rng.choice(t, n // 10)
+    return X
+
+
+def verify(model, flat, X=None, tolerance=DEFAULT_TOLERANCE):
+    """
+    Compare the flat evaluator with the model's own predict_proba
+
+    Returns:
+        Largest absolute difference in P(fraud)
+
+    Raises:
+        ValueError: The difference exceeds `tolerance`
+    """
+    if X is None:
+        X = verification_rows(flat)
+    expected = model.predict_proba(X)[:, 1]
+    actual = flat.predict_fraud(X)
+    max_diff = float(np.max(np.abs(expected - actual)))
+    if max_diff > tolerance:
+        raise ValueError(f'Flat export differs from predict_proba by {max_diff:.3g} (> {tolerance:g})')
+    return max_diff
+
+
+def main():
+    if len(sys.argv) < 2:
+        print('Usage: tree_export.py MODEL.pkl [OUT.npz]', file=sys.stderr)
+        sys.exit(1)
+
+    import joblib
+
+    model_path = sys.argv[1]
+    out_path = sys.argv[2] if len(sys.argv) > 2 else model_path.rsplit('.', 1)[0] + '.npz'
+
+    model = joblib.load(model_path)
+    flat = compile_ensemble(model)
+    # XGBoost evaluates in float32, so allow float32-level differences there
+    tolerance = 1e-5 if flat.strict else DEFAULT_TOLERANCE
+    max_diff = verify(model, flat, tolerance=tolerance)
+    flat.save(out_path)
+
+    print(json.dumps({
+        'success': True,
+        'output': out_path,
+        'trees': flat.n_trees,
+        'nodes': int(len(flat.feature)),
+        'max_depth': flat.max_depth,
+        'max_abs_diff': max_diff,
+    }))
+
+
+if __name__ == '__main__':
+    main()
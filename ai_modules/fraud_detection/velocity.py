@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Time-windowed transaction velocity per account
+
+A VelocityRing holds an account's recent (timestamp, amount) pairs in time
+order with running amount totals, so the count and sum over any trailing
+window is two bisects and a subtraction.
+"""
+
+from array import array
+from bisect import bisect_left, bisect_right, insort
+
+# Trailing windows exposed as features, in seconds
+VELOCITY_WINDOWS = {
+    '10m': 600,
+    '1h': 3600,
+    '24h': 86400,
+}
+
+# Nothing older than the longest window is ever needed
+MAX_WINDOW = max(VELOCITY_WINDOWS.values())
+
+
+class VelocityRing:
+    """
+    Bounded, time-ordered buffer of recent transactions for one account
+
+    Entries older than MAX_WINDOW (relative to the newest entry) or beyond
+    `capacity` are dropped from the front. Dropping only advances a head
+    index; the backing lists are compacted once the dead prefix is large.
+    """
+
+    def __init__(self, capacity=4096):
+        self.capacity = capacity
+        self.ts = []
+        self.cum = []   # cum[i] = sum of amounts[0..i] over the backing list
+        self.head = 0
+
+    def __len__(self):
+        return len(self.ts) - self.head
+
+    @property
+    def last_ts(self):
+        return self.ts[-1] if len(self) else None
+
+    def add(self, ts, amount):
+        """Insert one transaction (out-of-order inserts are allowed)"""
+        if not self.ts or ts >= self.ts[-1]:
+            self.ts.append(ts)
+            self.cum.append((self.cum[-1] if self.cum else 0.0) + amount)
+        else:
+            # Late arrival: insert in order and rebuild totals from that point
+            amounts = self._amounts(0)
+            pos = bisect_right(self.ts, ts)
+            insort(self.ts, ts)
+            amounts.insert(pos, amount)
+            self._rebuild(amounts, pos)
+        self._evict()
+
+    def window(self, seconds, now):
+        """
+        Count and amount sum of transactions in (now - seconds, now]
+
+        Returns:
+            (count, total)
+        """
+        lo = max(bisect_right(self.ts, now - seconds), self.head)
+        hi = bisect_right(self.ts, now)
+        if hi <= lo:
+            return 0, 0.0
+        total = self.cum[hi - 1] - (self.cum[lo - 1] if lo > 0 else 0.0)
+        return hi - lo, total
+
+    def features(self, now):
+        """Count/sum features for every window in VELOCITY_WINDOWS"""
+        features = {}
+        for name, seconds in VELOCITY_WINDOWS.items():
+            count, total = self.window(seconds, now)
+            features[f'tx_count_{name}'] = count
+            features[f'tx_sum_{name}'] = total
+        return features
+
+    def _amounts(self, start):
+        return [
+            self.cum[i] - (self.cum[i - 1] if i > 0 else 0.0)
+            for i in range(start, len(self.cum))
+        ]
+
+    def _rebuild(self, amounts, start):
+        running = self.cum[start - 1] if start > 0 else 0.0
+        del self.cum[start:]
+        for amount in amounts[start:]:
+            running += amount
+            self.cum.append(running)
+
+    def _evict(self):
+        cutoff = self.ts[-1] - MAX_WINDOW
+        self.head = max(self.head, bisect_left(self.ts, cutoff), len(self.ts) - self.capacity)
+
+        # Compact when more than half of the backing list is dead
+        if self.head > len(self.ts) // 2 and self.head > 64:
+            self.ts = self.ts[self.head:]
+            self.cum = self.cum[self.head:]
+            self.head = 0
+
+    def to_bytes(self):
+        """Serialise live entries as two packed float64 arrays (ts, amounts)"""
+        ts = array('d', self.ts[self.head:])
+        amounts = array('d', self._amounts(self.head))
+        return ts.tobytes(), amounts.tobytes()
+
+    @classmethod
+    def from_bytes(cls, ts_blob, amounts_blob, capacity=4096):
+        ring = cls(capacity)
+        ts = array('d')
+        ts.frombytes(ts_blob)
+        amounts = array('d')
+        amounts.frombytes(amounts_blob)
+        ring.ts = ts.tolist()
+        running = 0.0
+        for amount in amounts:
+            running += amount
+            ring.cum.append(running)
+        return ring
+
+    @classmethod
+    def from_pairs(cls, pairs, capacity=4096):
+        """Build a ring from unordered (ts, amount) pairs, skipping missing timestamps"""
+        ring = cls(capacity)
+        running = 0.0
+        for ts, amount in sorted(p for p in pairs if p[0] is not None):
+            ring.ts.append(ts)
+            running += amount
+            ring.cum.append(running)
+        if ring.ts:
+            ring._evict()
+        return ring
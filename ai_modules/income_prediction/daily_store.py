@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""
+Incremental per-account daily income series
+
+Each account owns one row of a memory-mapped float64 array holding a
+366-day ring of daily income totals and transaction counts, indexed by UTC
+day number modulo 366. Recording a transaction updates one bucket; reading
+an account's recent series touches only the requested window, so a
+prediction costs the same however many transactions the account has.
+
+A small SQLite index maps account ids to rows and records the newest day
+each ring has seen (older buckets are cleared lazily as the ring advances).
+SQLite's write lock also serialises updates from several worker processes.
+"""
+
+import os
+import sqlite3
+import threading
+from datetime import datetime, timezone
+
+import numpy as np
+
+RING_DAYS = 366
+
+# Rows are added to the data file in blocks of this many accounts
+GROW_ROWS = 1024
+
+
+def utc_day(ts):
+    """UTC day number (days since the epoch) for epoch seconds"""
+    return int(ts // 86400)
+
+
+class DailyIncomeStore:
+    """Account id -> 366-day ring of (income total, transaction count) per day"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.data_path = os.path.join(directory, 'series.f8')
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(
+            os.path.join(directory, 'index.db'), check_same_thread=False, isolation_level=None
+        )
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute(
+            '''CREATE TABLE IF NOT EXISTS accounts (
+                account_id TEXT PRIMARY KEY,
+                slot INTEGER NOT NULL UNIQUE,
+                last_day INTEGER NOT NULL,
+                recorded INTEGER NOT NULL DEFAULT 0
+            )'''
+        )
+        self.data = None
+        self._map()
+
+    def _map(self, min_rows=0):
+        """(Re)map the data file, growing it to at least `min_rows` rows"""
+        row_bytes = 2 * RING_DAYS * 8
+        if not os.path.exists(self.data_path):
+            open(self.data_path, 'ab').close()
+        rows = os.path.getsize(self.data_path) // row_bytes
+        if rows < min_rows:
+            rows = (min_rows // GROW_ROWS + 1) * GROW_ROWS
+            with open(self.data_path, 'r+b') as fh:
+                fh.truncate(rows * row_bytes)
+        if rows == 0:
+            self.data = np.zeros((0, 2, RING_DAYS))
+            return
+        # data[slot, 0] = daily income totals, data[slot, 1] = transaction counts
+        self.data = np.memmap(self.data_path, dtype='<f8', mode='r+', shape=(rows, 2, RING_DAYS))
+
+    def _row(self, slot):
+        if slot >= len(self.data):
+            # Grown by this or another process since we mapped it
+            self._map(slot + 1)
+        return self.data[slot]
+
+    def record(self, account_id, days, amounts):
+        """
+        Add income to an account's daily buckets
+
+        Args:
+            account_id: Account identifier
+            days: UTC day numbers of the transactions
+            amounts: Income amounts (only positive amounts are stored)
+
+        Returns:
+            Number of transactions stored (too old or non-income ones are dropped)
+        """
+        days = np.asarray(days, dtype=np.int64)
+        amounts = np.asarray(amounts, dtype=float)
+        keep = amounts > 0
+        days, amounts = days[keep], amounts[keep]
+        if len(days) == 0:
+            return 0
+
+        key = str(account_id)
+        with self.lock:
+            self.conn.execute('BEGIN IMMEDIATE')
+            try:
+                found = self.conn.execute(
+                    'SELECT slot, last_day, recorded FROM accounts WHERE account_id = ?', (key,)
+                ).fetchone()
+                if found:
+                    slot, last_day, recorded = found
+                else:
+                    slot = self.conn.execute(
+                        'SELECT COALESCE(MAX(slot) + 1, 0) FROM accounts'
+                    ).fetchone()[0]
+                    last_day, recorded = None, 0
+
+                row = self._row(slot)
+                new_last = int(days.max()) if last_day is None else max(last_day, int(days.max()))
+
+                # Clear the buckets the ring advances over before reusing them
+                if last_day is None:
+                    row[:] = 0.0
+                elif new_last > last_day:
+                    stale = np.arange(last_day + 1, min(new_last, last_day + RING_DAYS) + 1)
+                    row[:, stale % RING_DAYS] = 0.0
+
+                in_ring = days > new_last - RING_DAYS
+                bucket = days[in_ring] % RING_DAYS
+                np.add.at(row[0], bucket, amounts[in_ring])
+                np.add.at(row[1], bucket, 1.0)
+
+                stored = int(in_ring.sum())
+                self.conn.execute(
+                    'INSERT OR REPLACE INTO accounts (account_id, slot, last_day, recorded) '
+                    'VALUES (?, ?, ?, ?)',
+                    (key, int(slot), new_last, recorded + stored)
+                )
+                self.conn.execute('COMMIT')
+            except Exception:
+                self.conn.execute('ROLLBACK')
+                raise
+        return stored
+
+    def accounts(self):
+        """
+        All stored accounts
+
+        Returns:
+            List of (account_id, recorded) with `recorded` the number of
+            transactions stored for the account so far
+        """
+        with self.lock:
+            return self.conn.execute('SELECT account_id, recorded FROM accounts').fetchall()
+
+    def series(self, account_id, window_days=90, today=None):
+        """
+        An account's daily income over the last `window_days` days
+
+        Args:
+            account_id: Account identifier
+            window_days: Days up to and including today (at most 366)
+            today: UTC day number to end the window at (default: today)
+
+        Returns:
+            (days, totals, counts) for the days in the window with income;
+            empty arrays for an unknown account
+        """
+        if today is None:
+            today = utc_day(datetime.now(timezone.utc).timestamp())
+        with self.lock:
+            found = self.conn.execute(
+                'SELECT slot, last_day FROM accounts WHERE account_id = ?', (str(account_id),)
+            ).fetchone()
+            if not found:
+                return np.empty(0, dtype=np.int64), np.empty(0), np.empty(0)
+            slot, last_day = found
+            row = np.array(self._row(slot))
+
+        window = np.arange(today - min(window_days, RING_DAYS) + 1, today + 1)
+        # Buckets past the newest recorded day still hold the previous lap's data
+        window = window[(window <= last_day) & (window > last_day - RING_DAYS)]
+        bucket = window % RING_DAYS
+        counts = row[1, bucket]
+        has_income = counts > 0
+        return window[has_income], row[0, bucket][has_income], counts[has_income]
+
+    def close(self):
+        with self.lock:
+            if isinstance(self.data, np.memmap):
+                self.data.flush()
+            self.conn.close()
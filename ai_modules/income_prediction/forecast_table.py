@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+"""
+Materialized income forecasts
+
+A refresh job (income_predictor.py --refresh-forecasts) recomputes the
+forecasts of accounts whose entry is older than a maximum age or that have
+recorded enough new transactions since, and writes the whole table to one
+uncompressed .npz of column arrays sorted by account id. Readers (ForecastTable) memory-map the
+columns and look an account up with a binary search, so serving a forecast
+is a memory read instead of a model fit. The file is replaced atomically and
+readers pick up a new version by mtime.
+
+Besides the scalar fields, each entry keeps its dailyForecast curve and
+horizon intervals as fixed-width array columns, so a table hit answers with
+the same fields as a live prediction. The curve is the one the refresh job
+computed (30 days); entries without one come back without those fields.
+"""
+
+import os
+import sys
+import time
+import tempfile
+import threading
+
+import numpy as np
+
+from npz_mmap import load_npz_mmap
+
+DEFAULT_TABLE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'forecast_table.npz')
+
+# Refresh an entry once it is this old, or after this many new transactions
+DEFAULT_MAX_AGE_S = 6 * 3600
+DEFAULT_NEW_TRANSACTIONS = 20
+
+FLOAT_FIELDS = ('currentIncome', 'next7Days', 'next14Days', 'next30Days', 'averageMonthlyIncome')
+INT_FIELDS = ('transactionCount', 'confidence')
+LABEL_FIELDS = ('pattern', 'method')
+CURVE_FIELDS = ('yhat', 'lower', 'upper')
+INTERVAL_FIELDS = ('next7Days', 'next14Days', 'next30Days')
+
+
+def write_table(path, entries):
+    """
+    Write forecast entries as a sorted, uncompressed column table
+
+    Args:
+        path: Destination .npz
+        entries: Dict of account id -> entry (a predict_income result plus
+                 'computedAt' epoch seconds and 'recorded' transaction count)
+    """
+    accounts = sorted(entries)
+    columns = {
+        'account': np.array(accounts, dtype=str),
+        'computed_at': np.array([entries[a]['computedAt'] for a in accounts], dtype=float),
+        'recorded': np.array([entries[a].get('recorded', 0) for a in accounts], dtype=np.int64),
+    }
+    for field in FLOAT_FIELDS:
+        columns[field] = np.array([entries[a].get(field, 0) for a in accounts], dtype=float)
+    for field in INT_FIELDS:
+        columns[field] = np.array([entries[a].get(field, 0) for a in accounts], dtype=np.int64)
+    for field in LABEL_FIELDS:
+        # Small label sets: store codes plus the label list
+        labels, codes = np.unique(
+            np.array([entries[a].get(field, '') for a in accounts], dtype=str), return_inverse=True
+        )
+        columns[field] = codes.astype(np.int16)
+        columns[field + '_labels'] = labels
+    columns.update(_vector_columns([entries[a] for a in accounts]))
+
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp = tempfile.mkstemp(dir=directory, suffix='.npz')
+    os.close(fd)
+    try:
+        np.savez(tmp, **columns)
+        os.replace(tmp, path)
+    except Exception:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+
+
+def _vector_columns(entries):
+    """dailyForecast / intervals of each entry as NaN-padded array columns"""
+    curves = [entry.get('dailyForecast') or {} for entry in entries]
+    width = max((len(curve.get('yhat', ())) for curve in curves), default=0)
+    columns = {
+        'daily_start': np.array(
+            [np.datetime64(curve['start'], 'D').astype(np.int64) if 'start' in curve else 0 for curve in curves],
+            dtype=np.int64
+        ),
+    }
+    for field in CURVE_FIELDS:
+        column = np.full((len(curves), width), np.nan)
+        for i, curve in enumerate(curves):
+            values = curve.get(field, ())
+            column[i, :len(values)] = values
+        columns['daily_' + field] = column
+
+    intervals = [entry.get('intervals') or {} for entry in entries]
+    columns['interval_level'] = np.array([iv.get('level', np.nan) for iv in intervals], dtype=float)
+    for field in INTERVAL_FIELDS:
+        columns['interval_' + field] = np.array(
+            [iv.get(field, (np.nan, np.nan)) for iv in intervals], dtype=float
+        ).reshape(len(intervals), 2)
+    return columns
+
+
+def _entry(columns, i):
+    """Row i as a predict_income-style dict (without computedAt / recorded)"""
+    entry = {}
+    for field in FLOAT_FIELDS:
+        entry[field] = float(columns[field][i])
+    for field in INT_FIELDS:
+        entry[field] = int(columns[field][i])
+    for field in LABEL_FIELDS:
+        entry[field] = str(columns[field + '_labels'][columns[field][i]])
+
+    # Tables written before the curves were stored have no array columns
+    if 'daily_yhat' in columns:
+        yhat = columns['daily_yhat'][i]
+        length = int(np.count_nonzero(~np.isnan(yhat)))
+        if length:
+            start = np.datetime64(int(columns['daily_start'][i]), 'D')
+            entry['dailyForecast'] = {'start': str(start)}
+            for field in CURVE_FIELDS:
+                entry['dailyForecast'][field] = columns['daily_' + field][i, :length].tolist()
+        level = float(columns['interval_level'][i])
+        if level == level:
+            entry['intervals'] = {'level': level}
+            for field in INTERVAL_FIELDS:
+                entry['intervals'][field] = columns['interval_' + field][i].tolist()
+    return entry
+
+
+class ForecastTable:
+    """Read side of the materialized forecast table, reloaded when the file changes"""
+
+    def __init__(self, path=None, reload_interval=1.0):
+        self.path = path or os.environ.get('INCOME_FORECAST_TABLE', DEFAULT_TABLE_PATH)
+        self.reload_interval = reload_interval
+        self.lock = threading.Lock()
+        self.columns = None
+        self._mtime = None
+        self._checked_at = 0.0
+
+    def _current(self):
+        now = time.monotonic()
+        if now - self._checked_at >= self.reload_interval:
+            self._checked_at = now
+            try:
+                mtime = os.stat(self.path).st_mtime
+            except OSError:
+                mtime = None
+            if mtime != self._mtime:
+                with self.lock:
+                    self._mtime = mtime
+                    try:
+                        self.columns = load_npz_mmap(self.path) if mtime is not None else None
+                    except Exception as e:
+                        print(f'Forecast table load failed ({self.path}): {e}', file=sys.stderr)
+                        self.columns = None
+        return self.columns
+
+    def __len__(self):
+        columns = self._current()
+        return 0 if columns is None else len(columns['account'])
+
+    def _index(self, columns, account_id):
+        accounts = columns['account']
+        key = str(account_id)
+        i = int(np.searchsorted(accounts, key))
+        if i < len(accounts) and accounts[i] == key:
+            return i
+        return None
+
+    def lookup(self, account_id):
+        """
+        Materialized forecast for an account
+
+        Returns:
+            predict_income-style result (see the module docstring for
+            dailyForecast / intervals) plus 'computedAt' and 'ageSeconds',
+            or None if the account has no entry
+        """
+        columns = self._current()
+        if columns is None:
+            return None
+        i = self._index(columns, account_id)
+        if i is None:
+            return None
+
+        result = {'success': True}
+        result.update(_entry(columns, i))
+        computed_at = float(columns['computed_at'][i])
+        result['computedAt'] = computed_at
+        result['ageSeconds'] = round(time.time() - computed_at, 1)
+        return result
+
+    def release(self):
+        """Drop the mapping (so the file can be replaced on platforms that lock mapped files)"""
+        with self.lock:
+            self.columns = None
+            self._mtime = None
+
+    def entries(self):
+        """All entries as a dict of account id -> entry (for the refresh job)"""
+        columns = self._current()
+        if columns is None:
+            return {}
+        entries = {}
+        for i, account in enumerate(columns['account'].tolist()):
+            entry = _entry(columns, i)
+            entry['computedAt'] = float(columns['computed_at'][i])
+            entry['recorded'] = int(columns['recorded'][i])
+            entries[account] = entry
+        return entries
+
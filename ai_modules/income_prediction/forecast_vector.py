@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Daily forecast vectors
+
+Every forecasting engine produces one ForecastVector: the point forecast for
+each future day plus a lower/upper prediction interval per day and for the
+running total. Horizon totals (next 7/14/30 days, or any other horizon) are
+read off its cumulative sum, so no engine is run once per horizon.
+"""
+
+from datetime import datetime, timezone
+from statistics import NormalDist
+
+import numpy as np
+
+# Central interval reported as lower/upper (Prophet's default interval_width)
+INTERVAL_LEVEL = 0.8
+Z = NormalDist().inv_cdf(0.5 + INTERVAL_LEVEL / 2)
+
+
+class ForecastVector:
+    """Point forecast and interval bounds for consecutive future days"""
+
+    def __init__(self, yhat, lower, upper, total_lower, total_upper, cumulative=None, total_se=None):
+        """
+        Args:
+            yhat, lower, upper: Per-day forecast and interval bounds
+            total_lower, total_upper: Interval bounds of the running total
+                (element h-1 bounds the total of the first h days)
+            cumulative: Running total, when the engine computes it directly
+                (default: cumulative sum of yhat)
+            total_se: Standard error of the running total, when known
+        """
+        self.yhat = np.asarray(yhat, dtype=float)
+        self.lower = np.asarray(lower, dtype=float)
+        self.upper = np.asarray(upper, dtype=float)
+        self.total_lower = np.asarray(total_lower, dtype=float)
+        self.total_upper = np.asarray(total_upper, dtype=float)
+        self.cumulative = np.cumsum(self.yhat) if cumulative is None else np.asarray(cumulative, dtype=float)
+        self.total_se = total_se
+
+    def __len__(self):
+        return len(self.yhat)
+
+    @classmethod
+    def from_normal(cls, yhat, se, total, total_se):
+        """Vector with intervals from per-day and running-total standard errors"""
+        total_se = np.asarray(total_se, dtype=float)
+        half, total_half = Z * np.asarray(se), Z * total_se
+        return cls(
+            yhat, np.maximum(yhat - half, 0.0), np.maximum(yhat + half, 0.0),
+            np.maximum(total - total_half, 0.0), np.maximum(total + total_half, 0.0),
+            cumulative=total, total_se=total_se
+        )
+
+    def total(self, days):
+        """Forecast total over the next `days` days (never negative)"""
+        return max(0.0, float(self.cumulative[days - 1]))
+
+    def total_interval(self, days):
+        return float(self.total_lower[days - 1]), float(self.total_upper[days - 1])
+
+    def to_json(self, start_day, horizon):
+        """
+        Daily curve for the API
+
+        Args:
+            start_day: UTC day number of the first forecast day
+            horizon: Number of days to include
+        """
+        horizon = min(horizon, len(self))
+        return {
+            'start': datetime.fromtimestamp(start_day * 86400, timezone.utc).strftime('%Y-%m-%d'),
+            'yhat': np.round(self.yhat[:horizon], 2).tolist(),
+            'lower': np.round(self.lower[:horizon], 2).tolist(),
+            'upper': np.round(self.upper[:horizon], 2).tolist(),
+        }
+
+    def as_dict(self):
+        """Plain-list form for caching (see from_dict)"""
+        return {
+            'yhat': self.yhat.tolist(), 'lower': self.lower.tolist(), 'upper': self.upper.tolist(),
+            'total_lower': self.total_lower.tolist(), 'total_upper': self.total_upper.tolist(),
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['yhat'], data['lower'], data['upper'], data['total_lower'], data['total_upper'])
@@ -6,97 +6,296 @@ Uses time series analysis to predict future income
 
 import sys
 import json
-import numpy as np
-import pandas as pd
-from datetime import datetime, timedelta
+from datetime import datetime, timezone
+import os
+import time
+import threading
 import warnings
 warnings.filterwarnings('ignore')
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from startup_timer import timed, report as startup_timings
+import metrics
+
+with timed('income_predictor', 'import numpy'):
+    import numpy as np
+
+from columnar import as_columns, read_binary_request
+from seasonal import fit_seasonal, MIN_SPAN_DAYS as SEASONAL_MIN_SPAN_DAYS
+from forecast_vector import ForecastVector, INTERVAL_LEVEL
+
+# Prophet is used only for series with at least this many days of income and
+# requests whose latency budget (latencyBudgetMs, or INCOME_LATENCY_BUDGET_MS;
+# unset means no limit) covers a fit
+PROPHET_MIN_DAYS = 30
+PROPHET_BUDGET_MS = 3000
+DEFAULT_SERIES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'income_series')
+
+# Days of history a stored-series prediction looks at (as the server's query does)
+STORED_WINDOW_DAYS = 90
+
+# Longest daily forecast curve a request can ask for (horizonDays)
+MAX_HORIZON_DAYS = 90
+
+# Tiered mode stops waiting for Prophet this long before the deadline
+TIERED_RESERVE_S = 0.02
+
+DEFAULT_LATENCY_BUDGET_MS = (
+    float(os.environ['INCOME_LATENCY_BUDGET_MS']) if os.environ.get('INCOME_LATENCY_BUDGET_MS') else None
+)
+
+# Heavy dependencies are imported on first use (see load_pandas/load_prophet)
+pd = None
+_prophet_class = None
+_prophet_checked = False
+
+def load_pandas():
+    """Import pandas on first use"""
+    global pd
+    if pd is None:
+        with timed('income_predictor', 'import pandas'):
+            import pandas
+        pd = pandas
+    return pd
+
+def load_prophet():
+    """
+    Prophet class, or None when it is not installed
+    
+    The import is attempted once per process; a failed import is not retried
+    on every request.
+    """
+    global _prophet_class, _prophet_checked
+    if not _prophet_checked:
+        with timed('income_predictor', 'import prophet'):
+            try:
+                from prophet import Prophet
+                _prophet_class = Prophet
+            except ImportError:
+                _prophet_class = None
+        _prophet_checked = True
+    return _prophet_class
+
+class DailySeries:
+    """
+    Daily income series: UTC day numbers (days since the epoch) and income
+    totals of the days that had income
+    
+    Kept as NumPy arrays so only Prophet, through frame(), needs pandas.
+    """
+    __slots__ = ('days', 'y')
+    
+    def __init__(self, days=(), y=()):
+        self.days = np.asarray(days, dtype=np.int64)
+        self.y = np.asarray(y, dtype=float)
+    
+    def __len__(self):
+        return len(self.days)
+    
+    def frame(self):
+        """Daily income DataFrame (ds, y), as Prophet takes it"""
+        pd = load_pandas()
+        return pd.DataFrame({
+            'ds': pd.to_datetime(self.days, unit='D'),
+            'y': self.y
+        })
+
+def vector_fields(vector, start_day, horizon):
+    """Response fields for a forecast vector: the daily curve and horizon intervals"""
+    return {
+        'dailyForecast': vector.to_json(start_day, horizon),
+        'intervals': {
+            'level': INTERVAL_LEVEL,
+            'next7Days': [round(v, 2) for v in vector.total_interval(7)],
+            'next14Days': [round(v, 2) for v in vector.total_interval(14)],
+            'next30Days': [round(v, 2) for v in vector.total_interval(30)]
+        }
+    }
+
 class IncomePredictor:
     def __init__(self):
         self.min_data_points = 5  # Minimum transactions needed for prediction
+        self._model_cache = None
+        self.series_dir = os.environ.get('INCOME_SERIES_DIR', DEFAULT_SERIES_DIR)
+        self._daily_store = None
+        self._store_lock = threading.Lock()
+        self._forecast_table = None
+        self._refiner = None
     
-    def prepare_income_data(self, transactions):
+    @property
+    def daily_store(self):
+        """Incremental daily income store, opened on first use"""
+        if self._daily_store is None:
+            with self._store_lock:
+                if self._daily_store is None:
+                    from daily_store import DailyIncomeStore
+                    self._daily_store = DailyIncomeStore(self.series_dir)
+        return self._daily_store
+    
+    def record_transactions(self, account_id, transactions):
         """
-        Convert transactions to time series data for incoming money
+        Fold transactions into an account's stored daily income series
         
         Args:
-            transactions: List of transaction dicts with amount, createdAt
+            account_id: Account identifier
+            transactions: Transactions as rows or columns (see columnar.py)
         
         Returns:
-            DataFrame with date and income
+            Number of income transactions stored
         """
-        if not transactions or len(transactions) == 0:
-            return pd.DataFrame(columns=['ds', 'y'])
+        columns = as_columns(transactions)
+        # Undated transactions have no day bucket and are not stored
+        dated = ~np.isnan(columns.ts)
+        days = np.floor(columns.ts[dated] / 86400).astype(np.int64)
+        return self.daily_store.record(account_id, days, columns.amount[dated])
+    
+    def stored_series(self, account_id, window_days=STORED_WINDOW_DAYS):
+        """
+        An account's stored daily series and statistics
         
-        # Filter only incoming transactions (positive amounts)
-        incoming = []
-        for tx in transactions:
-            try:
-                amount = float(tx.get('amount', 0))
-                if amount > 0:  # Only incoming
-                    date_str = tx.get('createdAt', '')
-                    # Parse date
-                    if 'T' in date_str:
-                        date = datetime.fromisoformat(date_str.replace('Z', ''))
-                    else:
-                        date = datetime.strptime(date_str, '%Y-%m-%d %H:%M:%S')
-                    
-                    incoming.append({
-                        'ds': date.date(),
-                        'y': amount
-                    })
-            except Exception as e:
-                continue
+        Costs O(window_days), independent of the number of transactions.
         
-        if not incoming:
-            return pd.DataFrame(columns=['ds', 'y'])
+        Returns:
+            (days, totals, stats) with days/totals the days that had income
+        """
+        days, totals, counts = self.daily_store.series(account_id, window_days)
         
-        # Convert to DataFrame and aggregate by day
-        df = pd.DataFrame(incoming)
-        df = df.groupby('ds')['y'].sum().reset_index()
-        df['ds'] = pd.to_datetime(df['ds'])
+        now = datetime.now(timezone.utc)
+        month_start_day = int(datetime(now.year, now.month, 1, tzinfo=timezone.utc).timestamp() // 86400)
+        stats = self.summarize(
+            float(totals.sum()), int(counts.sum()), float(totals[days >= month_start_day].sum())
+        )
+        return days, totals, stats
+    
+    def ingest_stored(self, account_id, window_days=STORED_WINDOW_DAYS):
+        """
+        Daily series and statistics from the stored series instead of raw transactions
         
-        return df
+        Returns:
+            (series, stats) as ingest
+        """
+        days, totals, stats = self.stored_series(account_id, window_days)
+        return DailySeries(days, totals), stats
     
-    def calculate_statistics(self, transactions):
-        """Calculate income statistics"""
-        if not transactions or len(transactions) == 0:
-            return {
-                'current_month_income': 0,
-                'transaction_count': 0,
-                'avg_transaction': 0,
-                'avg_daily_income': 0,
-                'avg_monthly_income': 0
-            }
+    def cached_forecast(self, account_id, max_age_s=None):
+        """
+        Materialized forecast for an account (see forecast_table.py)
+        
+        Args:
+            account_id: Account identifier
+            max_age_s: Ignore entries older than this many seconds
+        
+        Returns:
+            Result with 'computedAt' and 'ageSeconds', or None if there is no
+            usable entry
+        """
+        if self._forecast_table is None:
+            from forecast_table import ForecastTable
+            self._forecast_table = ForecastTable()
+        result = self._forecast_table.lookup(account_id)
+        if result is None or (max_age_s is not None and result['ageSeconds'] > max_age_s):
+            return None
+        return result
+    
+    @property
+    def model_cache(self):
+        """Fitted-Prophet cache (created on first use; INCOME_MODEL_CACHE=0 disables it)"""
+        if self._model_cache is None and os.environ.get('INCOME_MODEL_CACHE', '1') != '0':
+            from prophet_cache import ProphetCache
+            self._model_cache = ProphetCache()
+        return self._model_cache
+    
+    def ingest(self, transactions):
+        """
+        Single vectorized pass over the transactions
+        
+        Produces both the daily income series and the summary statistics, so
+        amounts and dates are converted and filtered once per request.
+        
+        Args:
+            transactions: Transactions as rows or columns (see columnar.py)
+        
+        Returns:
+            (series, stats): DailySeries and statistics dict
+        """
+        columns = as_columns(transactions)
+        
+        # Filter only incoming transactions (positive amounts)
+        incoming = columns.amount > 0
+        amounts = columns.amount[incoming]
+        ts = columns.ts[incoming]
+        dated = ~np.isnan(ts)
+        
+        # Aggregate dated income by (UTC) day
+        if dated.any():
+            days = np.floor(ts[dated] / 86400).astype(np.int64)
+            unique_days, day_index = np.unique(days, return_inverse=True)
+            series = DailySeries(unique_days, np.bincount(day_index, weights=amounts[dated]))
+        else:
+            series = DailySeries()
         
         # Current month income
-        now = datetime.now()
-        month_start = datetime(now.year, now.month, 1)
+        now = datetime.now(timezone.utc)
+        month_start = datetime(now.year, now.month, 1, tzinfo=timezone.utc).timestamp()
+        # NaN timestamps compare False, so undated rows count as income but not this month
+        current_month = float(amounts[ts >= month_start].sum())
+        
+        stats = self.summarize(float(amounts.sum()), len(amounts), current_month)
+        return series, stats
+    
+    def ingest_many(self, account_ids, columns):
+        """
+        Vectorized ingest of many accounts' transactions at once
         
-        current_month = 0
-        all_amounts = []
+        Groups by (account, UTC day) with one sort-free np.unique over a
+        combined key, and computes every account's statistics with bincount.
         
-        for tx in transactions:
-            try:
-                amount = float(tx.get('amount', 0))
-                if amount > 0:
-                    all_amounts.append(amount)
-                    
-                    date_str = tx.get('createdAt', '')
-                    if 'T' in date_str:
-                        tx_date = datetime.fromisoformat(date_str.replace('Z', ''))
-                    else:
-                        tx_date = datetime.strptime(date_str, '%Y-%m-%d %H:%M:%S')
-                    
-                    if tx_date >= month_start:
-                        current_month += amount
-            except:
-                continue
-        
-        # Calculate averages
-        total_income = sum(all_amounts)
-        tx_count = len(all_amounts)
+        Args:
+            account_ids: Array of account ids, one per transaction
+            columns: Columns with the transactions' amounts and timestamps
+        
+        Returns:
+            List of (account_id, days, totals, stats) per account, with days
+            and totals the account's daily income series
+        """
+        accounts, account_index = np.unique(np.asarray(account_ids).astype(str), return_inverse=True)
+        n_accounts = len(accounts)
+        
+        # Filter only incoming transactions (positive amounts)
+        incoming = columns.amount > 0
+        amounts = columns.amount[incoming]
+        ts = columns.ts[incoming]
+        owner = account_index[incoming]
+        
+        # Current month income and averages per account
+        now = datetime.now(timezone.utc)
+        month_start = datetime(now.year, now.month, 1, tzinfo=timezone.utc).timestamp()
+        totals_by_account = np.bincount(owner, weights=amounts, minlength=n_accounts)
+        counts = np.bincount(owner, minlength=n_accounts)
+        this_month = ts >= month_start
+        current_month = np.bincount(owner[this_month], weights=amounts[this_month], minlength=n_accounts)
+        
+        # Aggregate dated income by (account, UTC day)
+        dated = ~np.isnan(ts)
+        days = np.floor(ts[dated] / 86400).astype(np.int64)
+        first_day = days.min() if len(days) else 0
+        key = (owner[dated].astype(np.int64) << 32) | (days - first_day)
+        unique_keys, key_index = np.unique(key, return_inverse=True)
+        day_totals = np.bincount(key_index, weights=amounts[dated])
+        key_owner = unique_keys >> 32
+        key_days = (unique_keys & 0xFFFFFFFF) + first_day
+        bounds = np.searchsorted(key_owner, np.arange(n_accounts + 1))
+        
+        results = []
+        for i, account in enumerate(accounts):
+            lo, hi = bounds[i], bounds[i + 1]
+            stats = self.summarize(float(totals_by_account[i]), int(counts[i]), float(current_month[i]))
+            results.append((account, key_days[lo:hi], day_totals[lo:hi], stats))
+        return results
+    
+    def summarize(self, total_income, tx_count, current_month):
+        """Statistics dict from an account's income totals"""
         avg_tx = total_income / tx_count if tx_count > 0 else 0
         
         # Estimate daily and monthly averages
@@ -117,19 +316,60 @@ class IncomePredictor:
             'avg_monthly_income': round(avg_monthly, 2)
         }
     
-    def simple_moving_average_prediction(self, df, days_ahead):
+    def prepare_income_data(self, transactions):
+        """
+        Convert transactions to time series data for incoming money
+        
+        Returns:
+            DataFrame with date and income
+        """
+        return self.ingest(transactions)[0].frame()
+    
+    def calculate_statistics(self, transactions):
+        """Calculate income statistics"""
+        return self.ingest(transactions)[1]
+    
+    def simple_moving_average_prediction(self, series, days_ahead):
         """
         Simple moving average prediction (fallback method)
         """
-        if len(df) == 0:
+        if len(series) == 0:
             return 0
+        return self.moving_average_forecast(series, days_ahead).total(days_ahead)
+    
+    def moving_average_forecast(self, series, horizon=30):
+        """
+        Moving-average forecast for every day up to `horizon` in one pass
         
-        # Use last 7 days average
-        recent_avg = df['y'].tail(min(7, len(df))).mean()
+        The series only has days with income, so the daily rate is the
+        recent average per income day times the share of calendar days that
+        had income, scaled by a capped growth trend:
+        rate * (1 + growth * d / 7) on day d. The running totals are its
+        cumulative sum. Intervals use the spread of the calendar-day income
+        (zero on days without income).
+        
+        Returns:
+            ForecastVector
+        """
+        horizon = max(horizon, 30)
+        if len(series) == 0:
+            zeros = np.zeros(horizon)
+            return ForecastVector(zeros, zeros, zeros, zeros, zeros)
+        
+        y = series.y
+        days = series.days
+        
+        # Income per calendar day over the observed span
+        calendar = np.zeros(int(days[-1] - days[0]) + 1)
+        calendar[days - days[0]] = y
+        income_share = len(y) / len(calendar)
+        
+        # Use last 7 income days average
+        recent_avg = y[-7:].mean()
         
         # Apply slight growth trend if data available
-        if len(df) > 7:
-            old_avg = df['y'].head(7).mean()
+        if len(y) > 7:
+            old_avg = y[:7].mean()
             if old_avg > 0:
                 growth_rate = (recent_avg - old_avg) / old_avg
                 growth_rate = max(-0.2, min(0.2, growth_rate))  # Cap at ±20%
@@ -138,20 +378,165 @@ class IncomePredictor:
         else:
             growth_rate = 0
         
-        # Predict
-        prediction = recent_avg * (1 + growth_rate * (days_ahead / 7))
-        return max(0, prediction)
+        # Predict every horizon at once
+        ahead = np.arange(1, horizon + 1)
+        daily = np.maximum(recent_avg * income_share * (1 + growth_rate * (ahead / 7)), 0.0)
+        total = np.cumsum(daily)
+        
+        sigma = calendar.std(ddof=1) if len(calendar) > 1 else 0.0
+        return ForecastVector.from_normal(daily, np.full(horizon, sigma), total, sigma * np.sqrt(ahead))
     
-    def detect_pattern(self, df):
+    def prophet_forecast(self, Prophet, series, account_id=None):
+        """
+        Prophet daily income forecast, through the fitted-model cache
+        
+        An unchanged series is a cache hit; a series with new days appended
+        is refitted warm-started from the account's previous fit. Only the
+        future dates are predicted, always MAX_HORIZON_DAYS of them, so a
+        cached fit serves any horizon.
+        
+        Args:
+            Prophet: Prophet class (see load_prophet)
+            series: DailySeries
+            account_id: Cache key; None keys the cache by the series itself
+        
+        Returns:
+            ForecastVector starting the day after the last observed day
+        """
+        from prophet_cache import stan_init
+        pd = load_pandas()
+        df = series.frame()
+        
+        def fit(init):
+            model = Prophet(
+                daily_seasonality=False,
+                weekly_seasonality=True,
+                yearly_seasonality=False,
+                changepoint_prior_scale=0.05
+            )
+            if init is not None:
+                model.fit(df, init=init)
+            else:
+                model.fit(df)
+            
+            # Predict the future dates only
+            future = pd.DataFrame({
+                'ds': pd.date_range(df['ds'].iloc[-1] + pd.Timedelta(days=1), periods=MAX_HORIZON_DAYS, freq='D')
+            })
+            forecast = model.predict(future)
+            
+            yhat = forecast['yhat'].to_numpy(dtype=float)
+            lower = forecast['yhat_lower'].to_numpy(dtype=float)
+            upper = forecast['yhat_upper'].to_numpy(dtype=float)
+            # Running-total interval treating the days' errors as independent
+            total = np.cumsum(yhat)
+            total_half = np.sqrt(np.cumsum(((upper - lower) / 2) ** 2))
+            vector = ForecastVector(
+                yhat, np.maximum(lower, 0.0), np.maximum(upper, 0.0),
+                np.maximum(total - total_half, 0.0), np.maximum(total + total_half, 0.0)
+            )
+            return vector.as_dict(), stan_init(model)
+        
+        cache = self.model_cache
+        if cache is None:
+            return ForecastVector.from_dict(fit(None)[0])
+        
+        return ForecastVector.from_dict(
+            cache.forecast(account_id, series.days, series.y, fit)
+        )
+    
+    @property
+    def refiner(self):
+        """Background Prophet fits for tiered requests, started on first use"""
+        if self._refiner is None:
+            with self._store_lock:
+                if self._refiner is None:
+                    from refiner import Refiner
+                    self._refiner = Refiner()
+        return self._refiner
+    
+    def tiered_prophet(self, Prophet, series, account_id, deadline):
+        """
+        Prophet forecast if one is ready by `deadline`, without ever waiting past it
+        
+        A finished background fit or a cached fit of the same series is
+        returned at once; otherwise a fit is started (or joined) in the
+        background and awaited until shortly before the deadline.
+        
+        Returns:
+            (ForecastVector or None, RefineJob or None)
+        """
+        from prophet_cache import series_fingerprint
+        
+        days = series.days
+        values = series.y
+        fingerprint = series_fingerprint(days, values)
+        key = fingerprint if account_id is None else str(account_id)
+        
+        vector = self.refiner.completed(key, fingerprint)
+        if vector is None and self.model_cache is not None:
+            cached = self.model_cache.peek(account_id, days, values)
+            if cached is not None:
+                vector = ForecastVector.from_dict(cached)
+        if vector is not None:
+            return vector, None
+        
+        job = self.refiner.submit(key, fingerprint, lambda: self.prophet_forecast(Prophet, series, account_id))
+        # Leave time to build the fast answer if the fit isn't done
+        return job.wait(deadline - time.monotonic() - TIERED_RESERVE_S), job
+    
+    def seasonal_forecast(self, series, horizon=30):
+        """
+        NumPy trend + day-of-week forecast (see seasonal.py)
+        
+        Returns:
+            (ForecastVector, error estimates by horizon), or None when the
+            series is too short to estimate the weekly pattern
+        """
+        fit = fit_seasonal(series.days, series.y)
+        if fit is None:
+            return None
+        vector = fit.vector(max(horizon, 30))
+        forecast_error = {
+            'next7Days': round(float(vector.total_se[6]), 2),
+            'next14Days': round(float(vector.total_se[13]), 2),
+            'next30Days': round(float(vector.total_se[29]), 2),
+            'dailyRmse': round(fit.sigma, 2)
+        }
+        return vector, forecast_error
+    
+    def choose_method(self, series, budget_ms, prophet_available):
+        """
+        Forecasting engine for a series
+        
+        Prophet only when it is installed, the series is long enough for its
+        changepoints to matter and the request can afford a fit; otherwise the
+        NumPy seasonal model when the series covers two weeks, otherwise the
+        moving average.
+        
+        Args:
+            series: DailySeries
+            budget_ms: Latency budget for the request, or None for no limit
+            prophet_available: Whether Prophet could be imported
+        """
+        if (prophet_available and len(series) >= PROPHET_MIN_DAYS
+                and (budget_ms is None or budget_ms >= PROPHET_BUDGET_MS)):
+            return 'prophet'
+        days = series.days
+        if days[-1] - days[0] + 1 >= SEASONAL_MIN_SPAN_DAYS:
+            return 'seasonal'
+        return 'moving_average'
+    
+    def detect_pattern(self, series):
         """
         Detect income pattern
         """
-        if len(df) < 5:
+        if len(series) < 5:
             return 'insufficient_data'
         
         # Calculate trend
-        recent = df['y'].tail(5).mean()
-        older = df['y'].head(5).mean()
+        recent = series.y[-5:].mean()
+        older = series.y[:5].mean()
         
         if older == 0:
             return 'irregular'
@@ -167,16 +552,16 @@ class IncomePredictor:
         else:
             return 'stable'
     
-    def calculate_confidence(self, df, pattern):
+    def calculate_confidence(self, series, pattern):
         """
         Calculate prediction confidence
         """
-        if len(df) < 5:
+        if len(series) < 5:
             return 40
         
         # Calculate coefficient of variation
-        mean_val = df['y'].mean()
-        std_val = df['y'].std()
+        mean_val = series.y.mean()
+        std_val = series.y.std(ddof=1)
         
         if mean_val == 0:
             return 50
@@ -194,7 +579,7 @@ class IncomePredictor:
             base_confidence = 55
         
         # Adjust based on data points
-        data_bonus = min(10, len(df))
+        data_bonus = min(10, len(series))
         
         # Adjust based on pattern
         pattern_bonus = {
@@ -208,110 +593,186 @@ class IncomePredictor:
         confidence = base_confidence + data_bonus + pattern_bonus
         return max(40, min(95, confidence))
     
-    def predict_income(self, transaction_data):
+    def forecast(self, series, stats, account_id=None, budget_ms=None, deadline=None, on_refined=None,
+                 horizon_days=None):
         """
-        Main prediction function
+        Forecast from an already aggregated daily series
         
         Args:
-            transaction_data: Dict with 'transactions' list
+            series: DailySeries
+            stats: Statistics dict (see summarize)
+            account_id: Account id, for the fitted-model cache
+            budget_ms: Latency budget for engine selection, or None for no limit
+            deadline: time.monotonic() by which to answer; enables tiered mode
+                (the fast estimate now, Prophet in the background)
+            on_refined: Tiered mode: callable(result) given the Prophet result
+                when a background fit finishes
+            horizon_days: Length of the returned daily forecast curve
+                (default 30, at most MAX_HORIZON_DAYS)
         
         Returns:
             Prediction results JSON
         """
-        try:
-            transactions = transaction_data.get('transactions', [])
-            
-            # Calculate current statistics
-            stats = self.calculate_statistics(transactions)
-            
-            # Prepare time series data
-            df = self.prepare_income_data(transactions)
-            
-            # Check if enough data
-            if len(df) < self.min_data_points:
-                # Not enough data - use simple estimates
-                avg_daily = stats['avg_daily_income']
-                
-                return {
-                    'success': True,
-                    'currentIncome': stats['current_month_income'],
-                    'transactionCount': stats['transaction_count'],
-                    'next7Days': round(avg_daily * 7, 2),
-                    'next14Days': round(avg_daily * 14, 2),
-                    'next30Days': round(avg_daily * 30, 2),
-                    'confidence': 50,
-                    'pattern': 'insufficient_data',
-                    'averageMonthlyIncome': stats['avg_monthly_income'],
-                    'method': 'simple_average'
-                }
-            
-            # Try Prophet for better predictions
-            use_prophet = False
-            try:
-                from prophet import Prophet
-                use_prophet = True
-            except ImportError:
-                use_prophet = False
-            
-            if use_prophet and len(df) >= 10:
-                try:
-                    # Use Prophet
-                    model = Prophet(
-                        daily_seasonality=False,
-                        weekly_seasonality=True,
-                        yearly_seasonality=False,
-                        changepoint_prior_scale=0.05
-                    )
-                    model.fit(df)
-                    
-                    # Make predictions
-                    future = model.make_future_dataframe(periods=30)
-                    forecast = model.predict(future)
-                    
-                    # Extract predictions
-                    today_idx = len(df)
-                    pred_7 = forecast['yhat'].iloc[today_idx:today_idx+7].sum()
-                    pred_14 = forecast['yhat'].iloc[today_idx:today_idx+14].sum()
-                    pred_30 = forecast['yhat'].iloc[today_idx:today_idx+30].sum()
-                    
-                    # Ensure non-negative
-                    pred_7 = max(0, pred_7)
-                    pred_14 = max(0, pred_14)
-                    pred_30 = max(0, pred_30)
-                    
-                    method = 'prophet'
-                    
-                except Exception as e:
-                    # Fall back to simple method
-                    pred_7 = self.simple_moving_average_prediction(df, 7)
-                    pred_14 = self.simple_moving_average_prediction(df, 14)
-                    pred_30 = self.simple_moving_average_prediction(df, 30)
-                    method = 'moving_average'
-            else:
-                # Use simple moving average
-                pred_7 = self.simple_moving_average_prediction(df, 7)
-                pred_14 = self.simple_moving_average_prediction(df, 14)
-                pred_30 = self.simple_moving_average_prediction(df, 30)
-                method = 'moving_average'
-            
-            # Detect pattern
-            pattern = self.detect_pattern(df)
-            
-            # Calculate confidence
-            confidence = self.calculate_confidence(df, pattern)
+        # Check if enough data
+        if len(series) < self.min_data_points:
+            # Not enough data - use simple estimates
+            avg_daily = stats['avg_daily_income']
             
             return {
                 'success': True,
                 'currentIncome': stats['current_month_income'],
                 'transactionCount': stats['transaction_count'],
-                'next7Days': round(pred_7, 2),
-                'next14Days': round(pred_14, 2),
-                'next30Days': round(pred_30, 2),
-                'confidence': confidence,
-                'pattern': pattern,
+                'next7Days': round(avg_daily * 7, 2),
+                'next14Days': round(avg_daily * 14, 2),
+                'next30Days': round(avg_daily * 30, 2),
+                'confidence': 50,
+                'pattern': 'insufficient_data',
                 'averageMonthlyIncome': stats['avg_monthly_income'],
-                'method': method
+                'method': 'simple_average'
             }
+        
+        # Import Prophet only when choose_method could pick it: the series is
+        # long enough and the request can afford a fit (tiered mode always can)
+        within_budget = deadline is not None or budget_ms is None or budget_ms >= PROPHET_BUDGET_MS
+        Prophet = load_prophet() if len(series) >= PROPHET_MIN_DAYS and within_budget else None
+        horizon = min(max(int(horizon_days or 30), 1), MAX_HORIZON_DAYS)
+        forecast_error = None
+        refine_job = None
+        vector = None
+        
+        if deadline is not None:
+            # Tiered: Prophet only if it is ready by the deadline, the fast engines otherwise
+            method = self.choose_method(series, None, Prophet is not None)
+            if method == 'prophet':
+                with metrics.stage('prophet_wait'):
+                    vector, refine_job = self.tiered_prophet(Prophet, series, account_id, deadline)
+                if vector is not None:
+                    refine_job = None
+                else:
+                    if refine_job is not None and refine_job.done.is_set():
+                        refine_job = None  # the fit failed; nothing is coming
+                    metrics.fallback('income_predictor', 'prophet_deadline')
+                    method = 'seasonal'
+        else:
+            # Pick the best engine the data and latency budget allow
+            method = self.choose_method(series, budget_ms, Prophet is not None)
+            if method == 'prophet':
+                try:
+                    with metrics.stage('prophet_fit'):
+                        vector = self.prophet_forecast(Prophet, series, account_id)
+                except Exception as e:
+                    # Fall back to the NumPy engines
+                    metrics.fallback('income_predictor', 'prophet_error', e)
+                    method = 'seasonal'
+            elif len(series) >= PROPHET_MIN_DAYS:
+                # Long enough for Prophet, but it is missing or over budget
+                kind = 'prophet_over_budget' if not within_budget else 'prophet_unavailable'
+                metrics.fallback('income_predictor', kind)
+        
+        if method == 'seasonal':
+            with metrics.stage('seasonal'):
+                seasonal = self.seasonal_forecast(series, horizon)
+            if seasonal is not None:
+                vector, forecast_error = seasonal
+            else:
+                metrics.fallback('income_predictor', 'seasonal_too_short')
+                method = 'moving_average'
+        
+        if method == 'moving_average':
+            # Use simple moving average
+            with metrics.stage('moving_average'):
+                vector = self.moving_average_forecast(series, horizon)
+        
+        # Horizon totals are running totals of the daily vector
+        pred_7, pred_14, pred_30 = vector.total(7), vector.total(14), vector.total(30)
+        start_day = int(series.days[-1]) + 1
+        
+        # Detect pattern
+        pattern = self.detect_pattern(series)
+        
+        # Calculate confidence
+        confidence = self.calculate_confidence(series, pattern)
+        
+        result = {
+            'success': True,
+            'currentIncome': stats['current_month_income'],
+            'transactionCount': stats['transaction_count'],
+            'next7Days': round(pred_7, 2),
+            'next14Days': round(pred_14, 2),
+            'next30Days': round(pred_30, 2),
+            'confidence': confidence,
+            'pattern': pattern,
+            'averageMonthlyIncome': stats['avg_monthly_income'],
+            'method': method
+        }
+        result.update(vector_fields(vector, start_day, horizon))
+        if forecast_error is not None:
+            result['forecastError'] = forecast_error
+        
+        if refine_job is not None:
+            # Prophet is still fitting: later requests get its result, and so does on_refined
+            result['refining'] = True
+            if on_refined is not None:
+                fast_result = result
+                
+                def deliver(refined_vector):
+                    refined = {k: v for k, v in fast_result.items() if k not in ('refining', 'forecastError')}
+                    refined.update({
+                        'next7Days': round(refined_vector.total(7), 2),
+                        'next14Days': round(refined_vector.total(14), 2),
+                        'next30Days': round(refined_vector.total(30), 2),
+                        'method': 'prophet',
+                        'refined': True
+                    })
+                    refined.update(vector_fields(refined_vector, start_day, horizon))
+                    on_refined(refined)
+                
+                refine_job.add_callback(deliver)
+        return result
+    
+    def predict_income(self, transaction_data, on_refined=None):
+        """
+        Main prediction function
+        
+        Args:
+            transaction_data: Dict with 'transactions' list, or just
+                'accountId' to use the account's stored daily series.
+                'deadlineMs' selects tiered mode: the answer comes within the
+                deadline and a Prophet fit that doesn't finish in time keeps
+                running in the background ('refining': true); its result is
+                returned by later requests, passed to on_refined and POSTed
+                to 'callbackUrl' if given.
+            on_refined: Tiered mode: callable(result) for the refined result
+        
+        Returns:
+            Prediction results JSON
+        """
+        deadline = None
+        if transaction_data.get('deadlineMs') is not None:
+            deadline = time.monotonic() + float(transaction_data['deadlineMs']) / 1000
+            callback_url = transaction_data.get('callbackUrl')
+            if callback_url and on_refined is None:
+                from refiner import post_callback
+                account_id = transaction_data.get('accountId')
+                on_refined = lambda result: post_callback(callback_url, dict(result, accountId=account_id))
+        
+        try:
+            with metrics.stage('ingest'):
+                if 'transactions' not in transaction_data and transaction_data.get('accountId') is not None:
+                    # No transactions sent: predict from the account's stored series
+                    series, stats = self.ingest_stored(transaction_data['accountId'])
+                else:
+                    # Daily series and current statistics in one pass
+                    series, stats = self.ingest(transaction_data.get('transactions', []))
+            
+            return self.forecast(
+                series, stats,
+                account_id=transaction_data.get('accountId'),
+                budget_ms=transaction_data.get('latencyBudgetMs', DEFAULT_LATENCY_BUDGET_MS),
+                deadline=deadline,
+                on_refined=on_refined,
+                horizon_days=transaction_data.get('horizonDays')
+            )
             
         except Exception as e:
             return {
@@ -327,24 +788,290 @@ class IncomePredictor:
                 'averageMonthlyIncome': 0
             }
 
+def handle_request(predictor, input_data):
+    """Dispatch a decoded request to a prediction, a table lookup, a stored-series update or a metrics report"""
+    if input_data.get('metrics'):
+        return {'success': True, 'metrics': metrics.render()}
+    if 'recordTransactions' in input_data:
+        count = predictor.record_transactions(input_data['accountId'], input_data['recordTransactions'])
+        return {'success': True, 'recorded': count}
+    if input_data.get('cached') and input_data.get('accountId') is not None:
+        # Materialized forecast if there is a fresh enough one, else predict now
+        with metrics.stage('table_lookup'):
+            result = predictor.cached_forecast(input_data['accountId'], input_data.get('maxAgeSeconds'))
+        if result is not None:
+            return dict(result, cached=True)
+        return dict(predictor.predict_income(input_data), cached=False)
+    return predictor.predict_income(input_data)
+
+# Per-process predictor for predict_income_many pool workers
+_pool_predictor = None
+
+def _forecast_account(item):
+    """Pool task: forecast one account from its aggregated daily series"""
+    global _pool_predictor
+    if _pool_predictor is None:
+        _pool_predictor = IncomePredictor()
+    account_id, days, totals, stats, budget_ms = item
+    try:
+        result = _pool_predictor.forecast(
+            DailySeries(days, totals), stats, account_id=account_id, budget_ms=budget_ms
+        )
+    except Exception as e:
+        result = {'success': False, 'error': str(e)}
+    return dict(result, accountId=account_id)
+
+def read_account_records(lines):
+    """
+    Collect NDJSON records into flat account / amount / timestamp columns
+    
+    Each line is either {"accountId": ..., "transactions": [...]} (rows or
+    columns, see columnar.py) or a single transaction
+    {"accountId": ..., "amount": ..., "createdAt": ...}. An account may
+    appear on any number of lines.
+    
+    Returns:
+        (account_ids, Columns)
+    """
+    from columnar import Columns
+    
+    owners, amounts, timestamps = [], [], []
+    single_accounts, single_rows = [], []
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        record = json.loads(line)
+        account_id = str(record.get('accountId'))
+        if 'transactions' in record:
+            columns = as_columns(record['transactions'])
+            owners.append(np.full(len(columns), account_id, dtype=object))
+            amounts.append(columns.amount)
+            timestamps.append(columns.ts)
+        else:
+            single_accounts.append(account_id)
+            single_rows.append(record)
+    
+    if single_rows:
+        columns = Columns.from_records(single_rows)
+        owners.append(np.array(single_accounts, dtype=object))
+        amounts.append(columns.amount)
+        timestamps.append(columns.ts)
+    
+    if not owners:
+        return np.empty(0, dtype=object), Columns.empty()
+    return np.concatenate(owners), Columns(np.concatenate(amounts), np.concatenate(timestamps))
+
+def predict_income_many(account_ids, columns, workers=None, budget_ms=DEFAULT_LATENCY_BUDGET_MS):
+    """
+    Forecast many accounts, in parallel across processes
+    
+    Transactions are grouped and aggregated to daily series in one
+    vectorized pass (IncomePredictor.ingest_many); the per-account forecasts
+    are then spread over a process pool.
+    
+    Args:
+        account_ids: Account id per transaction
+        columns: Columns of the transactions
+        workers: Pool size (default: CPU count; 1 runs in this process)
+        budget_ms: Latency budget per account for engine selection
+    
+    Yields:
+        Result dicts (predict_income format plus accountId), in account order
+    """
+    groups = IncomePredictor().ingest_many(account_ids, columns)
+    yield from forecast_many(groups, workers, budget_ms)
+
+def forecast_many(groups, workers=None, budget_ms=DEFAULT_LATENCY_BUDGET_MS):
+    """
+    Forecast aggregated account series across a process pool
+    
+    Args:
+        groups: List of (account_id, days, totals, stats)
+        workers: Pool size (default: CPU count; 1 runs in this process)
+        budget_ms: Latency budget per account for engine selection
+    
+    Yields:
+        Result dicts (predict_income format plus accountId), in input order
+    """
+    items = ((account, days, totals, stats, budget_ms) for account, days, totals, stats in groups)
+    
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(groups) < 2:
+        yield from map(_forecast_account, items)
+        return
+    
+    from concurrent.futures import ProcessPoolExecutor
+    chunksize = max(1, min(64, len(groups) // (workers * 4)))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        yield from pool.map(_forecast_account, items, chunksize=chunksize)
+
+def refresh_forecast_table(predictor, path=None, max_age_s=None, new_transactions=None, workers=None):
+    """
+    Recompute stale forecasts from the daily income store and rewrite the table
+    
+    An account is stale when it has no entry, its entry is older than
+    `max_age_s`, or it has recorded at least `new_transactions` transactions
+    since the entry was computed.
+    
+    Returns:
+        Summary dict: accounts, refreshed, elapsed_s
+    """
+    from forecast_table import ForecastTable, write_table, DEFAULT_MAX_AGE_S, DEFAULT_NEW_TRANSACTIONS
+    
+    max_age_s = DEFAULT_MAX_AGE_S if max_age_s is None else max_age_s
+    new_transactions = DEFAULT_NEW_TRANSACTIONS if new_transactions is None else new_transactions
+    
+    table = ForecastTable(path)
+    started = time.time()
+    entries = table.entries()
+    
+    stale, recorded_now = [], {}
+    for account_id, recorded in predictor.daily_store.accounts():
+        recorded_now[account_id] = recorded
+        entry = entries.get(account_id)
+        if (entry is None or started - entry['computedAt'] >= max_age_s
+                or recorded - entry['recorded'] >= new_transactions):
+            stale.append(account_id)
+    
+    groups = [(account_id,) + predictor.stored_series(account_id) for account_id in stale]
+    for result in forecast_many(groups, workers):
+        account_id = result.pop('accountId')
+        if not result.get('success'):
+            print(f'Forecast refresh failed for {account_id}: {result.get("error")}', file=sys.stderr)
+            continue
+        result['computedAt'] = started
+        result['recorded'] = recorded_now[account_id]
+        entries[account_id] = result
+    
+    table.release()
+    write_table(table.path, entries)
+    return {
+        'success': True,
+        'accounts': len(entries),
+        'refreshed': len(stale),
+        'elapsed_s': round(time.time() - started, 2)
+    }
+
+def run_refresh(argv):
+    """
+    Refresh the materialized forecast table, once or every --every seconds
+    
+    Usage: income_predictor.py --refresh-forecasts [--max-age S] [--new-transactions N]
+                               [--workers N] [--every S]
+    """
+    import argparse
+    
+    parser = argparse.ArgumentParser(prog='income_predictor.py --refresh-forecasts')
+    parser.add_argument('--max-age', type=float, help='Refresh entries older than this (seconds)')
+    parser.add_argument('--new-transactions', type=int, help='Refresh after this many new transactions')
+    parser.add_argument('--workers', type=int, help='Forecast processes (default: CPU count)')
+    parser.add_argument('--every', type=float, help='Keep running, refreshing every N seconds')
+    args = parser.parse_args(argv)
+    
+    predictor = IncomePredictor()
+    while True:
+        summary = refresh_forecast_table(
+            predictor, max_age_s=args.max_age, new_transactions=args.new_transactions, workers=args.workers
+        )
+        print(json.dumps(summary))
+        sys.stdout.flush()
+        if not args.every:
+            return
+        time.sleep(args.every)
+
+def run_batch(argv):
+    """
+    Batch mode: NDJSON account records on stdin, one NDJSON result per account on stdout
+    
+    Usage: income_predictor.py --batch [--workers N] [--budget-ms MS]
+    """
+    import argparse
+    
+    parser = argparse.ArgumentParser(prog='income_predictor.py --batch')
+    parser.add_argument('--workers', type=int, help='Forecast processes (default: CPU count)')
+    parser.add_argument('--budget-ms', type=float, default=DEFAULT_LATENCY_BUDGET_MS,
+                        help='Per-account latency budget used to pick the engine')
+    args = parser.parse_args(argv)
+    
+    account_ids, columns = read_account_records(sys.stdin)
+    for result in predict_income_many(account_ids, columns, args.workers, args.budget_ms):
+        sys.stdout.write(json.dumps(result) + '\n')
+        sys.stdout.flush()
+
+def serve(argv):
+    """
+    Persistent worker mode: keep imports warm and answer many requests
+    
+    Usage: income_predictor.py --serve [--socket PATH] [--workers N]
+    """
+    from jsonl_worker import run_server
+    
+    # Pay the lazy imports before the first request rather than during it
+    # (pandas is only needed by Prophet)
+    if load_prophet() is not None:
+        load_pandas()
+    
+    predictor = IncomePredictor()
+    run_server(metrics.instrument('income_predictor', lambda data: handle_request(predictor, data)), argv)
+
+def startup_report():
+    """Import and initialisation time per module, for --startup-report"""
+    with timed('income_predictor', 'IncomePredictor.__init__'):
+        IncomePredictor()
+    if load_prophet() is not None:
+        load_pandas()
+    
+    result = startup_timings()
+    result['success'] = True
+    result['prophet_available'] = _prophet_class is not None
+    return result
+
 def main():
     """Main entry point when called from Node.js"""
     if len(sys.argv) < 2:
         print(json.dumps({'success': False, 'error': 'No input data provided'}))
         sys.exit(1)
     
+    if sys.argv[1] == '--serve':
+        serve(sys.argv[2:])
+        sys.exit(0)
+    
+    if sys.argv[1] == '--startup-report':
+        print(json.dumps(startup_report()))
+        sys.exit(0)
+    
+    if sys.argv[1] == '--batch':
+        run_batch(sys.argv[2:])
+        sys.exit(0)
+    
+    if sys.argv[1] == '--refresh-forecasts':
+        run_refresh(sys.argv[2:])
+        sys.exit(0)
+    
     try:
-        # Parse input JSON
-        input_data = json.loads(sys.argv[1])
-        
-        # Initialize predictor
-        predictor = IncomePredictor()
+        # Parse input JSON (from stdin for payloads too large for argv)
+        started = time.perf_counter()
+        if sys.argv[1] == '--stdin':
+            input_data = json.load(sys.stdin)
+        elif sys.argv[1] == '--stdin-binary':
+            input_data = read_binary_request(sys.stdin.buffer)
+        else:
+            input_data = json.loads(sys.argv[1])
+        parse_ms = (time.perf_counter() - started) * 1000
         
-        # Predict
-        result = predictor.predict_income(input_data)
+        with metrics.request('income_predictor', input_data.get('timings'), started=started) as timings:
+            metrics.add_stage('parse', parse_ms)
+            
+            # Initialize predictor
+            with metrics.stage('init'):
+                predictor = IncomePredictor()
+            
+            # Predict (or update the stored series)
+            result = handle_request(predictor, input_data)
         
         # Output JSON result
-        print(json.dumps(result))
+        print(metrics.dumps(result, timings))
         sys.exit(0)
         
     except Exception as e:
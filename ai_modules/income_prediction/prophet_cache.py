@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+On-disk cache of fitted Prophet models for the income predictor
+
+One small JSON file per account holds the daily series the model was fitted
+on (as a fingerprint plus the raw days/values), the fitted Stan parameters
+and the resulting daily forecast vector:
+
+- same series as last time: the cached forecast is returned, no fit at all
+- series extended with new days: the refit is warm-started from the previous
+  parameters (Prophet's `fit(df, init=...)`), which converges in a fraction
+  of the iterations of a cold fit
+- anything else: a normal cold fit
+
+Files are written atomically (temp file + rename), so concurrent workers
+never read a torn entry. The directory is kept to `max_entries` files by
+evicting the least recently used ones (by mtime, refreshed on every hit).
+"""
+
+import os
+import sys
+import json
+import hashlib
+import tempfile
+import threading
+
+import numpy as np
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'prophet_cache')
+DEFAULT_MAX_ENTRIES = 256
+
+# Bump when the Prophet configuration or the cached forecast format in
+# income_predictor.py changes, so old fits are neither reused nor used as warm starts
+MODEL_CONFIG = 'weekly-cp0.05-v2'
+
+
+def series_fingerprint(days, values):
+    """
+    Fingerprint of a daily series
+
+    Args:
+        days: int64 array of UTC day numbers (days since the epoch)
+        values: float64 array of daily totals
+    """
+    digest = hashlib.sha1(MODEL_CONFIG.encode())
+    digest.update(np.ascontiguousarray(days, dtype='<i8').tobytes())
+    digest.update(np.ascontiguousarray(values, dtype='<f8').tobytes())
+    return digest.hexdigest()
+
+
+def is_extension(old_days, old_values, days, values):
+    """
+    True if (days, values) is the cached series with only new days appended
+
+    Days that fell out of the front of the query window are ignored, and the
+    last cached day may have grown (more income arrived that day).
+    """
+    old_days = np.asarray(old_days, dtype=np.int64)
+    old_values = np.asarray(old_values, dtype=float)
+    if len(days) == 0 or len(old_days) == 0:
+        return False
+
+    keep = old_days >= days[0]
+    old_days, old_values = old_days[keep], old_values[keep]
+    n = len(old_days)
+    if n == 0 or n > len(days):
+        return False
+    return bool(
+        np.array_equal(days[:n], old_days)
+        and np.allclose(values[:n - 1], old_values[:-1])
+    )
+
+
+def stan_init(model):
+    """Fitted parameters of a Prophet model, in the form fit(init=...) takes"""
+    params = {}
+    for name in ('k', 'm', 'sigma_obs'):
+        params[name] = float(model.params[name][0][0])
+    for name in ('delta', 'beta'):
+        params[name] = [float(v) for v in model.params[name][0]]
+    return params
+
+
+class ProphetCache:
+    """Per-account fitted-model cache in a directory of JSON files"""
+
+    def __init__(self, directory=None, max_entries=None):
+        """
+        Args:
+            directory: Cache directory (default: INCOME_MODEL_CACHE_DIR or ./prophet_cache)
+            max_entries: Files kept before LRU eviction (default: INCOME_MODEL_CACHE_SIZE or 256)
+        """
+        self.directory = directory or os.environ.get('INCOME_MODEL_CACHE_DIR', DEFAULT_CACHE_DIR)
+        self.max_entries = int(max_entries or os.environ.get('INCOME_MODEL_CACHE_SIZE', DEFAULT_MAX_ENTRIES))
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.warm_starts = 0
+        self.misses = 0
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, key):
+        name = hashlib.sha1(str(key).encode()).hexdigest()
+        return os.path.join(self.directory, name + '.json')
+
+    def get(self, key):
+        """Cached entry for a key (account id), or None"""
+        path = self._path(key)
+        try:
+            with open(path) as fh:
+                entry = json.load(fh)
+        except (OSError, ValueError):
+            return None
+        try:
+            os.utime(path)  # mark as recently used
+        except OSError:
+            pass
+        return entry
+
+    def put(self, key, entry):
+        """Store an entry atomically and evict least recently used files"""
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as fh:
+                json.dump(entry, fh)
+            os.replace(tmp, self._path(key))
+        except OSError as e:
+            print(f'Prophet cache write failed: {e}', file=sys.stderr)
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+            return
+        self._evict()
+
+    def _evict(self):
+        with self.lock:
+            entries = []
+            for name in os.listdir(self.directory):
+                if not name.endswith('.json'):
+                    continue
+                path = os.path.join(self.directory, name)
+                try:
+                    entries.append((os.stat(path).st_mtime, path))
+                except OSError:
+                    pass
+            if len(entries) <= self.max_entries:
+                return
+            entries.sort()
+            for _, path in entries[:len(entries) - self.max_entries]:
+                try:
+                    os.unlink(path)
+                except OSError:
+                    pass
+
+    def peek(self, key, days, values):
+        """Cached forecast for exactly this series, without fitting (None if there is none)"""
+        fingerprint = series_fingerprint(days, values)
+        entry = self.get(fingerprint if key is None else key)
+        if entry is not None and entry.get('fingerprint') == fingerprint:
+            self.hits += 1
+            return entry['forecast']
+        return None
+
+    def forecast(self, key, days, values, fit):
+        """
+        Cached forecast for a series, fitting only when it changed
+
+        Args:
+            key: Cache key (account id, or None to key by the series itself)
+            days: int64 array of UTC day numbers
+            values: float64 array of daily totals
+            fit: Callable fit(init) -> (forecast, params); init is a stan_init
+                 dict to warm-start from, or None for a cold fit
+
+        Returns:
+            The forecast returned by `fit` (or cached from an earlier call)
+        """
+        fingerprint = series_fingerprint(days, values)
+        key = fingerprint if key is None else key
+        entry = self.get(key)
+
+        if entry is not None and entry.get('fingerprint') == fingerprint:
+            self.hits += 1
+            return entry['forecast']
+
+        init = None
+        if (entry is not None and entry.get('config') == MODEL_CONFIG
+                and is_extension(entry['days'], entry['values'], days, values)):
+            init = entry['params']
+
+        forecast, params = None, None
+        if init is not None:
+            try:
+                forecast, params = fit(init)
+                self.warm_starts += 1
+            except Exception as e:
+                # e.g. a different number of changepoints than the cached fit
+                print(f'Prophet warm start failed, refitting cold: {e}', file=sys.stderr)
+        if forecast is None:
+            forecast, params = fit(None)
+            self.misses += 1
+
+        self.put(key, {
+            'config': MODEL_CONFIG,
+            'fingerprint': fingerprint,
+            'days': [int(d) for d in days],
+            'values': [float(v) for v in values],
+            'params': params,
+            'forecast': forecast,
+        })
+        return forecast
+
+    def stats(self):
+        return {'hits': self.hits, 'warm_starts': self.warm_starts, 'misses': self.misses}
@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+"""
+Background refinement for tiered income predictions
+
+A deadline-bound request answers with the fast estimate and hands the
+expensive fit to a Refiner. Fits run one at a time on a single daemon worker
+thread, fed by a bounded queue:
+
+- a series already queued or being fitted is not fitted twice: later
+  requests for it join that job;
+- a newer series for a queued account replaces the queued one (its job fails
+  as superseded), so an account has at most one fit waiting;
+- when the queue is full the oldest waiting job is dropped;
+- a fit running past `fit_timeout` seconds is abandoned - its job fails and
+  the worker moves on; the fit's thread cannot be killed, so it finishes in
+  the background and its result is discarded;
+- while `max_stuck` abandoned fits are still running, no new fit starts:
+  jobs fail at once (and the caller keeps its fast estimate) until one of
+  them ends, so stuck fits can't pile up.
+
+Finished results are kept per key so the next request for the same series
+gets the refined forecast immediately. Result callbacks (e.g. post_callback
+to a callbackUrl) run on their own daemon thread, fed by a bounded queue, so
+a slow consumer never holds up the fits; when that queue is full further
+callbacks are dropped.
+"""
+
+import os
+import sys
+import json
+import queue
+import threading
+import urllib.request
+from collections import OrderedDict
+
+DEFAULT_MAX_PENDING = 64
+DEFAULT_FIT_TIMEOUT_S = 60.0
+DEFAULT_MAX_STUCK = 2
+DEFAULT_MAX_CALLBACKS = 256
+
+
+class RefineSkipped(Exception):
+    """A job that was superseded, dropped, timed out or refused while fits are stuck"""
+
+
+class RefineJob:
+    """One background fit; waiters block on `done`, callbacks run when it finishes"""
+
+    def __init__(self, key, fingerprint, dispatch=None):
+        """
+        Args:
+            key: Series key
+            fingerprint: Series fingerprint
+            dispatch: dispatch(callback, result) runs a callback; default inline
+        """
+        self.key = key
+        self.fingerprint = fingerprint
+        self.dispatch = dispatch or _run_callback
+        self.lock = threading.Lock()
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.callbacks = []
+
+    def add_callback(self, callback):
+        """Run callback(result) when the fit succeeds (now, if it already has)"""
+        with self.lock:
+            if not self.done.is_set():
+                self.callbacks.append(callback)
+                return
+        if self.error is None:
+            self.dispatch(callback, self.result)
+
+    def wait(self, timeout):
+        """Result if the fit finishes within `timeout` seconds, else None"""
+        if self.done.wait(max(timeout, 0)) and self.error is None:
+            return self.result
+        return None
+
+    def finish(self, result=None, error=None):
+        """Record the outcome, wake waiters and run callbacks (on success)"""
+        with self.lock:
+            if self.done.is_set():
+                return
+            self.result, self.error = result, error
+            self.done.set()
+            callbacks, self.callbacks = self.callbacks, []
+        if error is None:
+            for callback in callbacks:
+                self.dispatch(callback, result)
+
+
+class Refiner:
+    """Runs expensive forecasts in the background and remembers their results"""
+
+    def __init__(self, max_pending=None, max_results=1024, fit_timeout=None, max_stuck=None):
+        """
+        Args:
+            max_pending: Most jobs waiting for the worker (INCOME_REFINE_QUEUE)
+            max_results: Most finished results kept
+            fit_timeout: Seconds before a running fit is abandoned (INCOME_REFINE_TIMEOUT_S)
+            max_stuck: Abandoned fits still running at which new fits are
+                refused (INCOME_REFINE_MAX_STUCK)
+        """
+        self.lock = threading.Lock()
+        self.queued = threading.Condition(self.lock)
+        self.max_pending = int(max_pending or os.environ.get('INCOME_REFINE_QUEUE', DEFAULT_MAX_PENDING))
+        self.max_results = max_results
+        self.fit_timeout = float(fit_timeout or os.environ.get('INCOME_REFINE_TIMEOUT_S', DEFAULT_FIT_TIMEOUT_S))
+        self.max_stuck = int(max_stuck or os.environ.get('INCOME_REFINE_MAX_STUCK', DEFAULT_MAX_STUCK))
+        self.pending = OrderedDict()   # key -> (job, fit), oldest first
+        self.running = None
+        self.results = OrderedDict()
+        self.dropped = 0
+        self.timeouts = 0
+        self.refused = 0
+        self.stuck = []   # threads of abandoned fits
+        self.callback_queue = queue.Queue(DEFAULT_MAX_CALLBACKS)
+        self.dropped_callbacks = 0
+        self._worker = None
+        self._callback_worker = None
+
+    def completed(self, key, fingerprint):
+        """Finished result for this exact series, or None"""
+        with self.lock:
+            found = self.results.get(key)
+            if found is None or found[0] != fingerprint:
+                return None
+            self.results.move_to_end(key)
+            return found[1]
+
+    def submit(self, key, fingerprint, fit):
+        """
+        Queue fit() for the background worker unless the same series is
+        already queued or running
+
+        Args:
+            key: Series key (account id or fingerprint)
+            fingerprint: Series fingerprint; a new one for the same key replaces the queued job
+            fit: Callable returning the refined result
+
+        Returns:
+            RefineJob
+        """
+        with self.lock:
+            refuse = self._stuck_full()
+            if refuse:
+                self.refused += 1
+        if refuse:
+            job = RefineJob(key, fingerprint, self._dispatch)
+            job.finish(error=RefineSkipped('too many timed-out fits still running'))
+            return job
+
+        skipped = []
+        with self.lock:
+            running = self.running
+            if running is not None and running.key == key and running.fingerprint == fingerprint:
+                return running
+            queued = self.pending.pop(key, None)
+            if queued is not None:
+                if queued[0].fingerprint == fingerprint:
+                    self.pending[key] = queued
+                    return queued[0]
+                skipped.append((queued[0], 'superseded by a newer series'))
+
+            job = RefineJob(key, fingerprint, self._dispatch)
+            self.pending[key] = (job, fit)
+            while len(self.pending) > self.max_pending:
+                _, (oldest, _) = self.pending.popitem(last=False)
+                self.dropped += 1
+                skipped.append((oldest, 'dropped from a full queue'))
+
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._work, name='income-refine', daemon=True)
+                self._worker.start()
+            self.queued.notify()
+
+        for stale, reason in skipped:
+            stale.finish(error=RefineSkipped(reason))
+        return job
+
+    def _work(self):
+        while True:
+            with self.lock:
+                while not self.pending:
+                    self.queued.wait()
+                _, (job, fit) = self.pending.popitem(last=False)
+                refuse = self._stuck_full()
+                if refuse:
+                    self.refused += 1
+                else:
+                    self.running = job
+            if refuse:
+                job.finish(error=RefineSkipped('too many timed-out fits still running'))
+                continue
+            try:
+                result, error = self._fit(fit), None
+            except Exception as e:
+                result, error = None, e
+                print(f'Background income refinement failed: {e}', file=sys.stderr)
+
+            with self.lock:
+                self.running = None
+                if error is None:
+                    self.results[job.key] = (job.fingerprint, result)
+                    self.results.move_to_end(job.key)
+                    while len(self.results) > self.max_results:
+                        self.results.popitem(last=False)
+            job.finish(result, error)
+
+    def _dispatch(self, callback, result):
+        """Hand a callback to the callback thread (dropped if its queue is full)"""
+        with self.lock:
+            if self._callback_worker is None:
+                self._callback_worker = threading.Thread(
+                    target=self._run_callbacks, name='income-refine-callbacks', daemon=True
+                )
+                self._callback_worker.start()
+        try:
+            self.callback_queue.put_nowait((callback, result))
+        except queue.Full:
+            with self.lock:
+                self.dropped_callbacks += 1
+            print('Income refinement callback dropped: callback queue is full', file=sys.stderr)
+
+    def _run_callbacks(self):
+        while True:
+            callback, result = self.callback_queue.get()
+            _run_callback(callback, result)
+
+    def _stuck_full(self):
+        """Whether max_stuck abandoned fits are still running (call with the lock held)"""
+        self.stuck = [thread for thread in self.stuck if thread.is_alive()]
+        return len(self.stuck) >= self.max_stuck
+
+    def _fit(self, fit):
+        """Run fit() on its own thread, giving up after fit_timeout seconds"""
+        outcome = {}
+
+        def run():
+            try:
+                outcome['result'] = fit()
+            except Exception as e:
+                outcome['error'] = e
+
+        thread = threading.Thread(target=run, name='income-refine-fit', daemon=True)
+        thread.start()
+        thread.join(self.fit_timeout)
+        if thread.is_alive():
+            with self.lock:
+                self.timeouts += 1
+                self.stuck.append(thread)
+            raise RefineSkipped(f'fit timed out after {self.fit_timeout:g}s')
+        if 'error' in outcome:
+            raise outcome['error']
+        return outcome['result']
+
+
+def _run_callback(callback, result):
+    try:
+        callback(result)
+    except Exception as e:
+        print(f'Income refinement callback failed: {e}', file=sys.stderr)
+
+
+def post_callback(url, payload, timeout=5.0):
+    """POST a JSON payload to a callback URL (best effort)"""
+    request = urllib.request.Request(
+        url, data=json.dumps(payload).encode(), headers={'Content-Type': 'application/json'}
+    )
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        response.read()
@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+"""
+Persistent JSON-lines worker shared by the AI modules
+
+Keeps one interpreter (and whatever the handler has loaded) warm and serves
+many requests over stdin/stdout or a Unix socket.
+
+Protocol (one JSON object per line):
+    request:  {"id": "42", "data": {...}}
+    response: {"id": "42", "result": {...}}
+
+Requests are handled on a thread pool, so responses can come back in a
+different order than the requests were sent; callers match them by id.
+At most `max_pending` requests are queued or running at once; past that the
+worker stops reading, so a burst backs up in the pipe instead of in memory.
+Every request line gets a response, an error one if building it failed.
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+import socketserver
+from concurrent.futures import ThreadPoolExecutor
+
+# Requests queued or running at once, per worker thread
+PENDING_PER_WORKER = 4
+
+
+def handle_line(handler, line):
+    """
+    Decode one request line, run the handler and serialize the response
+
+    A handler wrapped by metrics.instrument is called through its `serve`
+    method, which also times the request's JSON parsing and the result's
+    serialization (the 'parse' and 'serialize' stages).
+
+    Args:
+        handler: Callable taking the request's 'data' dict and returning a result dict
+        line: Raw request line
+
+    Returns:
+        Response line (JSON, without the newline), or None for blank lines
+    """
+    line = line.strip()
+    if not line:
+        return None
+
+    started = time.perf_counter()
+    try:
+        request = json.loads(line)
+    except json.JSONDecodeError as e:
+        return _response(None, {'success': False, 'error': f'JSON parsing error: {str(e)}'})
+    if not isinstance(request, dict):
+        return _response(None, {'success': False, 'error': 'Request must be a JSON object'})
+    parse_ms = (time.perf_counter() - started) * 1000
+
+    request_id = request.get('id')
+
+    if request.get('op') == 'ping':
+        return _response(request_id, {'success': True, 'pong': True})
+
+    data = request.get('data', {})
+    serve = getattr(handler, 'serve', None)
+    try:
+        if serve is not None:
+            body = serve(data, started=started, parse_ms=parse_ms)
+        else:
+            body = json.dumps(handler(data))
+    except Exception as e:
+        body = json.dumps({'success': False, 'error': str(e)})
+
+    return '{"id": ' + json.dumps(request_id) + ', "result": ' + body + '}'
+
+
+def _response(request_id, result):
+    return json.dumps({'id': request_id, 'result': result})
+
+
+class _LineWriter:
+    """Serialises whole response lines onto a shared text stream"""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.lock = threading.Lock()
+
+    def write(self, line):
+        payload = line + '\n'
+        with self.lock:
+            self.stream.write(payload)
+            self.stream.flush()
+
+
+def _request_id(line):
+    """Id of a request line, or None if it has none (or is not a JSON object)"""
+    try:
+        request = json.loads(line)
+    except ValueError:
+        return None
+    return request.get('id') if isinstance(request, dict) else None
+
+
+def _respond(writer, handler, line):
+    try:
+        response = handle_line(handler, line)
+        if response is not None:
+            writer.write(response)
+    except Exception as e:
+        # e.g. a result that is not JSON serializable: still answer, so the
+        # caller isn't left waiting for its timeout
+        error = _response(_request_id(line), {'success': False, 'error': f'Worker error: {e}'})
+        try:
+            writer.write(error)
+        except Exception as write_error:
+            print(f'Worker response failed: {write_error}', file=sys.stderr)
+
+
+class _BoundedPool:
+    """Thread pool whose submit blocks while `max_pending` tasks are queued or running"""
+
+    def __init__(self, workers, max_pending=None):
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+        self.slots = threading.BoundedSemaphore(max_pending or workers * PENDING_PER_WORKER)
+
+    def submit(self, fn, *args):
+        self.slots.acquire()
+        try:
+            future = self.pool.submit(fn, *args)
+        except BaseException:
+            self.slots.release()
+            raise
+        future.add_done_callback(lambda _: self.slots.release())
+        return future
+
+    def shutdown(self, wait=True):
+        self.pool.shutdown(wait=wait)
+
+
+def serve_stdio(handler, workers=4, stdin=None, stdout=None, max_pending=None):
+    """
+    Serve requests from stdin until EOF, writing responses to stdout
+
+    Args:
+        handler: Request handler (see handle_line)
+        workers: Number of requests processed concurrently
+        max_pending: Requests queued or running before reading pauses
+            (default workers * PENDING_PER_WORKER)
+    """
+    stdin = stdin or sys.stdin
+    writer = _LineWriter(stdout or sys.stdout)
+
+    pool = _BoundedPool(workers, max_pending)
+    try:
+        for line in stdin:
+            pool.submit(_respond, writer, handler, line)
+    finally:
+        pool.shutdown(wait=True)
+
+
+def serve_unix(handler, socket_path, workers=4, max_pending=None):
+    """
+    Serve JSON-lines requests on a Unix domain socket
+
+    Each connection is its own request stream; responses go back on the
+    connection they came from. max_pending bounds the requests queued or
+    running across all connections (see serve_stdio).
+    """
+    pool = _BoundedPool(workers, max_pending)
+
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            writer = _LineWriter(_SocketTextStream(self.wfile))
+            pending = []
+            for raw in self.rfile:
+                line = raw.decode('utf-8')
+                pending.append(pool.submit(_respond, writer, handler, line))
+            for future in pending:
+                future.result()
+
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+
+    with socketserver.ThreadingUnixStreamServer(socket_path, Handler) as server:
+        server.daemon_threads = True
+        try:
+            server.serve_forever()
+        finally:
+            pool.shutdown(wait=True)
+            if os.path.exists(socket_path):
+                os.unlink(socket_path)
+
+
+class _SocketTextStream:
+    """Minimal text-stream adapter over a socket's binary write file"""
+
+    def __init__(self, wfile):
+        self.wfile = wfile
+
+    def write(self, text):
+        self.wfile.write(text.encode('utf-8'))
+
+    def flush(self):
+        self.wfile.flush()
+
+
+def run_server(handler, argv):
+    """
+    Entry point for a module's --serve mode
+
+    Args:
+        handler: Request handler (see handle_line)
+        argv: Arguments following --serve
+    """
+    parser = argparse.ArgumentParser(prog='--serve')
+    parser.add_argument('--socket', help='Unix socket path (default: stdin/stdout)')
+    parser.add_argument('--workers', type=int, default=4, help='Concurrent requests')
+    args = parser.parse_args(argv)
+
+    if args.socket:
+        serve_unix(handler, args.socket, workers=args.workers)
+    else:
+        serve_stdio(handler, workers=args.workers)
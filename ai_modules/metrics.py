@@ -0,0 +1,481 @@
+#!/usr/bin/env python3
+"""
+Per-request stage timings and process metrics for the AI modules
+
+Instrumentation is opt-in. AI_METRICS=1 turns it on for every request, or a
+single request can ask for it with "timings": true. An instrumented request
+times each stage the modules wrap in `stage(name)` and returns the
+breakdown in its `timings` field:
+
+    {"stages_ms": {"parse": 0.1, "features": 0.4, ...}, "total_ms": 1.2,
+     "fallbacks": {"ml_skipped": 1}}
+
+Stage times also feed per-process histograms, and fallbacks (the ML model
+skipped, Prophet replaced by a cheaper engine) are always counted. Both are
+rendered in the Prometheus text format by `render()` and, when
+AI_METRICS_FILE is set, merged into that file (plus a .json sidecar with
+the raw counts) so the one-process-per-request mode aggregates too.
+
+AI_PROFILE=cpu and/or memory (comma separated) additionally runs each
+request under cProfile / tracemalloc and writes the profile to
+AI_PROFILE_DIR (default: the temp directory).
+"""
+
+import os
+import sys
+import json
+import time
+import atexit
+import tempfile
+import threading
+import contextvars
+from bisect import bisect_left
+from contextlib import contextmanager
+
+ENABLED = os.environ.get('AI_METRICS') == '1'
+METRICS_FILE = os.environ.get('AI_METRICS_FILE')
+FLUSH_INTERVAL_S = float(os.environ.get('AI_METRICS_FLUSH_INTERVAL', 10))
+PROFILE = {mode.strip() for mode in os.environ.get('AI_PROFILE', '').split(',') if mode.strip()}
+
+# Histogram upper bounds in seconds (+Inf is implied)
+BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# name -> (type, help)
+METRICS = {
+    'ai_request_duration_seconds': ('histogram', 'Time to handle an instrumented request'),
+    'ai_stage_duration_seconds': ('histogram', 'Time spent in each stage of an instrumented request'),
+    'ai_fallbacks_total': ('counter', 'Requests served by a fallback path'),
+}
+
+# Lines of the tracemalloc report written per request
+MEMORY_TOP = 25
+
+_current = contextvars.ContextVar('ai_request_timings', default=None)
+
+
+class Registry:
+    """Thread-safe histograms and counters keyed by (name, labels)"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = {}   # key -> [bucket counts (non-cumulative, +Inf last), sum, count]
+        self.counters = {}     # key -> value
+        self._flushed = ({}, {})
+        self._flushed_at = time.monotonic()
+        self.flush_lock = threading.Lock()   # one flush() at a time per process
+
+    def observe(self, name, labels, seconds):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            entry = self.histograms.get(key)
+            if entry is None:
+                entry = self.histograms[key] = [[0] * (len(BUCKETS) + 1), 0.0, 0]
+            entry[0][bisect_left(BUCKETS, seconds)] += 1
+            entry[1] += seconds
+            entry[2] += 1
+
+    def inc(self, name, labels, amount=1):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def snapshot(self):
+        with self.lock:
+            histograms = {key: [list(e[0]), e[1], e[2]] for key, e in self.histograms.items()}
+            return histograms, dict(self.counters)
+
+    def delta(self):
+        """
+        Counts since the last commit() (what flush() has not written yet)
+
+        Returns:
+            (histograms, counters, snapshot) - pass snapshot to commit() once
+            the delta has been written
+        """
+        histograms, counters = self.snapshot()
+        old_histograms, old_counters = self._flushed
+        delta_h = {}
+        for key, (buckets, total, count) in histograms.items():
+            old = old_histograms.get(key)
+            if old is not None:
+                buckets = [a - b for a, b in zip(buckets, old[0])]
+                total, count = total - old[1], count - old[2]
+            if count:
+                delta_h[key] = [buckets, total, count]
+        delta_c = {key: value - old_counters.get(key, 0) for key, value in counters.items()}
+        return delta_h, {key: value for key, value in delta_c.items() if value}, (histograms, counters)
+
+    def commit(self, snapshot):
+        """Mark the counts of a delta() snapshot as written"""
+        self._flushed = snapshot
+
+
+REGISTRY = Registry()
+
+
+class RequestTimings:
+    """Stage times and fallbacks of one instrumented request"""
+
+    def __init__(self, module, started=None):
+        self.module = module
+        self.started = time.perf_counter() if started is None else started
+        self.stages = {}
+        self.fallbacks = {}
+        self.profile = None
+        self.total_ms = None
+
+    def add(self, stage_name, ms):
+        """Add `ms` milliseconds to a stage (stages may run several times)"""
+        self.stages[stage_name] = self.stages.get(stage_name, 0.0) + ms
+
+    def finish(self):
+        """Record the request in the histograms (once)"""
+        if self.total_ms is not None:
+            return
+        total = time.perf_counter() - self.started
+        REGISTRY.observe('ai_request_duration_seconds', {'module': self.module}, total)
+        for stage_name, ms in self.stages.items():
+            REGISTRY.observe('ai_stage_duration_seconds', {'module': self.module, 'stage': stage_name}, ms / 1000)
+        self.total_ms = total * 1000
+
+    def as_dict(self):
+        total_ms = self.total_ms
+        if total_ms is None:
+            total_ms = (time.perf_counter() - self.started) * 1000
+        result = {
+            'stages_ms': {name: round(ms, 3) for name, ms in self.stages.items()},
+            'total_ms': round(total_ms, 3),
+        }
+        if self.fallbacks:
+            result['fallbacks'] = dict(self.fallbacks)
+        if self.profile:
+            result['profile'] = self.profile
+        return result
+
+
+@contextmanager
+def request(module, enabled=False, started=None):
+    """
+    Instrument one request
+
+    Args:
+        module: Module name used as the metrics label
+        enabled: Instrument even if AI_METRICS is not set
+        started: perf_counter() when the request arrived, if before this
+            call (e.g. before its JSON was parsed)
+
+    Yields:
+        RequestTimings, or None when the request is not instrumented
+    """
+    timings = RequestTimings(module, started) if enabled or ENABLED else None
+    token = _current.set(timings)
+    try:
+        with profiled(module) as profile:
+            yield timings
+    finally:
+        _current.reset(token)
+        if timings is not None:
+            timings.profile = profile
+            timings.finish()
+        if METRICS_FILE and time.monotonic() - REGISTRY._flushed_at >= FLUSH_INTERVAL_S:
+            flush()
+
+
+@contextmanager
+def stage(name):
+    """Time the wrapped block as stage `name` of the current request (if instrumented)"""
+    timings = _current.get()
+    if timings is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add(name, (time.perf_counter() - started) * 1000)
+
+
+def add_stage(name, ms):
+    """Record a stage timed by the caller (e.g. parsing, before the request is known)"""
+    timings = _current.get()
+    if timings is not None:
+        timings.add(name, ms)
+
+
+_reported = set()
+
+
+def fallback(module, kind, error=None, count=1):
+    """
+    Count a fallback path
+
+    Fallbacks caused by an error are also logged to stderr, the first time
+    each kind occurs in the process.
+
+    Args:
+        module: Module name
+        kind: Fallback name, e.g. 'ml_skipped'
+        error: Exception that caused it, if any
+        count: Number of times it was taken (e.g. rows of a batch)
+    """
+    REGISTRY.inc('ai_fallbacks_total', {'module': module, 'kind': kind}, count)
+    timings = _current.get()
+    if timings is not None:
+        timings.fallbacks[kind] = timings.fallbacks.get(kind, 0) + count
+    if error is not None and (module, kind) not in _reported:
+        _reported.add((module, kind))
+        print(f'{module}: fallback {kind}: {error}', file=sys.stderr)
+
+
+def attach(result, timings):
+    """Add the `timings` field to a result dict (unchanged if not instrumented)"""
+    if timings is None or not isinstance(result, dict):
+        return result
+    return dict(result, timings=timings.as_dict())
+
+
+def dumps(result, timings):
+    """
+    Serialize a finished request's result, timing the serialization itself
+
+    The timings are appended to the already serialized result, so they can
+    include the time it took (as a stage; total_ms covers the handling).
+    """
+    started = time.perf_counter()
+    body = json.dumps(result)
+    if timings is None or not isinstance(result, dict):
+        return body
+    ms = (time.perf_counter() - started) * 1000
+    timings.add('serialize', ms)
+    REGISTRY.observe('ai_stage_duration_seconds', {'module': timings.module, 'stage': 'serialize'}, ms / 1000)
+    separator = ', ' if len(body) > 2 else ''
+    return body[:-1] + separator + '"timings": ' + json.dumps(timings.as_dict()) + '}'
+
+
+def instrument(module, handler):
+    """
+    Wrap a request handler (see jsonl_worker) so it honours "timings": true
+
+    jsonl_worker calls the wrapper's `serve(data, started, parse_ms)`, which
+    also records the parse stage timed by the worker and returns the
+    serialized result (see dumps), so --serve requests report the same
+    stages as one-shot ones.
+    """
+    def handle(data):
+        with request(module, data.get('timings')) as timings:
+            result = handler(data)
+        return attach(result, timings)
+
+    def serve(data, started=None, parse_ms=None):
+        with request(module, data.get('timings'), started=started) as timings:
+            if parse_ms is not None:
+                add_stage('parse', parse_ms)
+            result = handler(data)
+        return dumps(result, timings)
+
+    handle.serve = serve
+    return handle
+
+
+# ---------------------------------------------------------------------------
+# Profiling
+
+_profile_lock = threading.Lock()
+
+
+@contextmanager
+def profiled(module):
+    """
+    Run the wrapped block under cProfile / tracemalloc as AI_PROFILE asks
+
+    Only one request is profiled at a time; concurrent requests run
+    unprofiled.
+
+    Yields:
+        Dict that is filled with the profile file paths (and peak traced
+        memory), or None when not profiling
+    """
+    if not PROFILE or not _profile_lock.acquire(blocking=False):
+        yield None
+        return
+
+    directory = os.environ.get('AI_PROFILE_DIR', tempfile.gettempdir())
+    stem = os.path.join(directory, f'{module}-{os.getpid()}-{int(time.time() * 1000)}')
+    report = {}
+    profiler = None
+    try:
+        if 'memory' in PROFILE:
+            import tracemalloc
+            tracemalloc.start()
+        if 'cpu' in PROFILE:
+            import cProfile
+            profiler = cProfile.Profile()
+            profiler.enable()
+        yield report
+    finally:
+        try:
+            if profiler is not None:
+                profiler.disable()
+                profiler.dump_stats(stem + '.prof')
+                report['cpu'] = stem + '.prof'
+            if 'memory' in PROFILE:
+                snapshot = tracemalloc.take_snapshot()
+                _, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+                with open(stem + '.mem.txt', 'w') as fh:
+                    fh.write(f'peak traced memory: {peak / 1024:.1f} KiB\n')
+                    for line in snapshot.statistics('lineno')[:MEMORY_TOP]:
+                        fh.write(f'{line}\n')
+                report['memory'] = stem + '.mem.txt'
+                report['peak_kb'] = round(peak / 1024, 1)
+        except OSError as e:
+            print(f'Profile write failed: {e}', file=sys.stderr)
+        finally:
+            _profile_lock.release()
+
+
+# ---------------------------------------------------------------------------
+# Prometheus text format
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in pairs) + '}'
+
+
+def render(snapshot=None):
+    """
+    Histograms and counters in the Prometheus text exposition format
+
+    Args:
+        snapshot: (histograms, counters) to render (default: this process)
+    """
+    histograms, counters = snapshot or REGISTRY.snapshot()
+    lines = []
+    for name, (kind, help_text) in METRICS.items():
+        source = histograms if kind == 'histogram' else counters
+        keys = sorted(key for key in source if key[0] == name)
+        if not keys:
+            continue
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        for key in keys:
+            labels = key[1]
+            if kind == 'counter':
+                lines.append(f'{name}{_labels(labels)} {source[key]}')
+                continue
+            buckets, total, count = source[key]
+            cumulative = 0
+            for bound, n in zip(BUCKETS + (float('inf'),), buckets):
+                cumulative += n
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f'{name}_bucket{_labels(labels, [("le", le)])} {cumulative}')
+            lines.append(f'{name}_sum{_labels(labels)} {total!r}')
+            lines.append(f'{name}_count{_labels(labels)} {count}')
+    return '\n'.join(lines) + '\n'
+
+
+# ---------------------------------------------------------------------------
+# Metrics file
+
+@contextmanager
+def _file_lock(path, timeout=2.0, stale_s=30.0):
+    """Cross-process lock using an exclusively created lock file"""
+    lock_path = path + '.lock'
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            break
+        except FileExistsError:
+            try:
+                if time.time() - os.stat(lock_path).st_mtime > stale_s:
+                    os.unlink(lock_path)  # left behind by a killed process
+                    continue
+            except OSError:
+                continue
+            if time.monotonic() > deadline:
+                raise TimeoutError(f'{lock_path} is held by another process')
+            time.sleep(0.01)
+    try:
+        yield
+    finally:
+        os.close(fd)
+        os.unlink(lock_path)
+
+
+def _atomic_write(path, text):
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as fh:
+            fh.write(text)
+        os.replace(tmp, path)
+    except OSError:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+
+
+def flush(path=None):
+    """
+    Merge this process's counts since the last flush into the metrics file
+
+    The raw counts live in `path`.json; `path` is rewritten in the
+    Prometheus text format from them.
+    """
+    path = path or METRICS_FILE
+    REGISTRY._flushed_at = time.monotonic()
+    if not path:
+        return
+
+    # The delta is only committed once it is in the file, so counts from a
+    # failed write go out with the next flush instead of being lost
+    with REGISTRY.flush_lock:
+        histograms, counters, snapshot = REGISTRY.delta()
+        if not histograms and not counters:
+            return
+        try:
+            with _file_lock(path):
+                _merge_into(path, histograms, counters, snapshot)
+        except (OSError, TimeoutError) as e:
+            print(f'Metrics file write failed ({path}): {e}', file=sys.stderr)
+
+
+def _merge_into(path, histograms, counters, snapshot):
+    try:
+        with open(path + '.json') as fh:
+            state = json.load(fh)
+    except (OSError, ValueError):
+        state = {'histograms': [], 'counters': []}
+
+    merged_h = {(e['name'], tuple(map(tuple, e['labels']))): [e['buckets'], e['sum'], e['count']]
+                for e in state['histograms']}
+    merged_c = {(e['name'], tuple(map(tuple, e['labels']))): e['value'] for e in state['counters']}
+    for key, (buckets, total, count) in histograms.items():
+        old = merged_h.get(key)
+        if old is not None and len(old[0]) == len(buckets):
+            buckets = [a + b for a, b in zip(buckets, old[0])]
+            total, count = total + old[1], count + old[2]
+        merged_h[key] = [buckets, total, count]
+    for key, value in counters.items():
+        merged_c[key] = merged_c.get(key, 0) + value
+
+    state = {
+        'histograms': [{'name': k[0], 'labels': k[1], 'buckets': v[0], 'sum': v[1], 'count': v[2]}
+                       for k, v in merged_h.items()],
+        'counters': [{'name': k[0], 'labels': k[1], 'value': v} for k, v in merged_c.items()],
+    }
+    _atomic_write(path + '.json', json.dumps(state))
+    # The raw counts are the source of truth; the text file is derived from them
+    REGISTRY.commit(snapshot)
+    _atomic_write(path, render((merged_h, merged_c)))
+
+if METRICS_FILE:
+    atexit.register(flush)
@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+"""
+Memory-mapped loading of uncompressed .npz archives
+
+np.load reads every .npz member into private memory, even with mmap_mode.
+Members of an uncompressed archive (np.savez, not np.savez_compressed) are
+plain .npy files stored at fixed offsets, so they can be memory-mapped
+directly and shared between processes through the page cache.
+"""
+
+import struct
+import zipfile
+
+import numpy as np
+
+
+def load_npz_mmap(path):
+    """
+    Memory-map every array of an uncompressed .npz (as written by np.savez)
+
+    np.load reads .npz members into memory even with mmap_mode; members of
+    an uncompressed archive are plain .npy files at fixed offsets, so they
+    can be mapped directly.
+    """
+    arrays = {}
+    with zipfile.ZipFile(path) as archive, open(path, 'rb') as fh:
+        for info in archive.infolist():
+            if info.compress_type != zipfile.ZIP_STORED:
+                raise ValueError(f'{path}: {info.filename} is compressed and cannot be memory-mapped')
+            # Local file header: 30 fixed bytes, then the name and extra field
+            fh.seek(info.header_offset + 26)
+            name_len, extra_len = struct.unpack('<HH', fh.read(4))
+            fh.seek(info.header_offset + 30 + name_len + extra_len)
+            version = np.lib.format.read_magic(fh)
+            if version == (1, 0):
+                shape, fortran, dtype = np.lib.format.read_array_header_1_0(fh)
+            else:
+                shape, fortran, dtype = np.lib.format.read_array_header_2_0(fh)
+            name = info.filename[:-4] if info.filename.endswith('.npy') else info.filename
+            if 0 in shape:
+                arrays[name] = np.empty(shape, dtype=dtype)
+            else:
+                arrays[name] = np.memmap(
+                    path, dtype=dtype, mode='r', offset=fh.tell(), shape=shape,
+                    order='F' if fortran else 'C'
+                )
+    return arrays
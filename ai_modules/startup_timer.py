@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+"""
+Startup-time accounting for the AI modules
+
+Modules wrap their expensive imports and loads in `timed(module, section)`;
+`report()` returns the per-module breakdown for --startup-report.
+"""
+
+import time
+from contextlib import contextmanager
+
+# Taken when the first AI module imports this one, i.e. right after the
+# interpreter has started and run the script's stdlib imports
+_STARTED = time.perf_counter()
+
+# module -> {section: milliseconds}
+TIMINGS = {}
+
+
+@contextmanager
+def timed(module, section):
+    """Record how long the wrapped block takes under TIMINGS[module][section]"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = (time.perf_counter() - started) * 1000
+        sections = TIMINGS.setdefault(module, {})
+        sections[section] = round(sections.get(section, 0) + elapsed, 2)
+
+
+def report():
+    """Per-module timings plus wall time since this module was first imported"""
+    return {
+        'modules': {module: dict(sections) for module, sections in TIMINGS.items()},
+        'total_ms': round((time.perf_counter() - _STARTED) * 1000, 2),
+    }
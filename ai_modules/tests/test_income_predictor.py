@@ -0,0 +1,55 @@
+"""
+Tests for the income predictor's moving-average forecast
+"""
+
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'income_prediction'))
+
+from income_predictor import IncomePredictor, DailySeries
+
+
+def _series(totals, first_day=20000):
+    return DailySeries(np.arange(first_day, first_day + len(totals)), np.asarray(totals, dtype=float))
+
+
+def test_moving_average_totals_grow_with_horizon():
+    predictor = IncomePredictor()
+    vector = predictor.moving_average_forecast(_series([1300.0] * 14), 30)
+
+    assert np.all(vector.yhat[:30] > 0)
+    assert vector.total(7) < vector.total(14) < vector.total(30)
+    # Flat daily income: the totals are that income times the number of days
+    assert np.isclose(vector.total(7), 7 * 1300.0)
+    assert np.isclose(vector.total(14), 2 * vector.total(7))
+    assert np.isclose(vector.total(30), vector.yhat[:30].sum())
+
+
+def test_moving_average_scales_by_days_with_income():
+    predictor = IncomePredictor()
+    # 1300 on 7 of 13 calendar days
+    series = DailySeries(np.arange(20000, 20014, 2), np.full(7, 1300.0))
+    vector = predictor.moving_average_forecast(series, 30)
+
+    assert np.isclose(vector.total(14), 14 * 1300.0 * 7 / 13)
+
+
+def test_moving_average_growth_trend():
+    predictor = IncomePredictor()
+    vector = predictor.moving_average_forecast(_series([100.0] * 7 + [200.0] * 7), 30)
+
+    assert np.all(np.diff(vector.yhat[:30]) > 0)
+    assert vector.total(7) < vector.total(14) < vector.total(30)
+
+
+def test_simple_moving_average_prediction_matches_vector():
+    predictor = IncomePredictor()
+    series = _series([50.0, 80.0, 120.0, 60.0, 90.0, 70.0, 110.0, 95.0])
+    vector = predictor.moving_average_forecast(series, 30)
+
+    for days in (7, 14, 30):
+        assert np.isclose(predictor.simple_moving_average_prediction(series, days), vector.total(days))
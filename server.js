@@ -110,6 +110,10 @@ function executePythonScript(scriptName, data) {
       try {
         console.log('📤 Python output:', resultData.substring(0, 200));
         const result = JSON.parse(resultData);
+        if (result && result.timings) {
+          // Set AI_METRICS=1 (or send timings: true) for per-stage timings
+          console.log(`⏱️ ${scriptName} timings:`, JSON.stringify(result.timings));
+        }
         resolve(result);
       } catch (e) {
         console.error('❌ Failed to parse Python output:', resultData);
@@ -259,13 +263,166 @@ app.post('/auth/login', async (req, res) => {
     res.status(500).json({ message: 'Server error' });
   }
 });
+// ==================== PERSISTENT PYTHON WORKERS ====================
+// One long-lived `--serve` process per AI script keeps imports and models warm.
+// Requests/responses are JSON lines matched by id, so several can be in flight.
+const PYTHON_WORKER_ENABLED = process.env.AI_WORKER_MODE !== 'off';
+const PYTHON_WORKER_TIMEOUT_MS = parseInt(process.env.AI_WORKER_TIMEOUT_MS || '10000', 10);
+// Income deadline: answer within this many ms and let Prophet finish in the
+// background for the next request (unset = wait for the full forecast)
+const INCOME_DEADLINE_MS = process.env.AI_INCOME_DEADLINE_MS
+  ? parseInt(process.env.AI_INCOME_DEADLINE_MS, 10)
+  : null;
+const pythonWorkers = {};
+
+function getPythonWorker(scriptName) {
+  if (pythonWorkers[scriptName]) {
+    return pythonWorkers[scriptName];
+  }
+
+  const scriptPath = path.join(__dirname, 'ai_modules', scriptName);
+  const pythonCmd = process.platform === 'win32' ? 'python' : 'python3';
+  const child = spawn(pythonCmd, [scriptPath, '--serve']);
+
+  const worker = { child, pending: new Map(), nextId: 1, buffer: '' };
+  pythonWorkers[scriptName] = worker;
+  console.log(`🐍 Started persistent Python worker: ${scriptName}`);
+
+  child.stdout.on('data', (chunk) => {
+    worker.buffer += chunk.toString();
+    let newline;
+    while ((newline = worker.buffer.indexOf('\n')) >= 0) {
+      const line = worker.buffer.slice(0, newline);
+      worker.buffer = worker.buffer.slice(newline + 1);
+      if (!line.trim()) continue;
+
+      let response;
+      try {
+        response = JSON.parse(line);
+      } catch (e) {
+        console.error('❌ Invalid JSON line from Python worker:', line);
+        continue;
+      }
+
+      const entry = worker.pending.get(response.id);
+      if (entry) {
+        clearTimeout(entry.timer);
+        worker.pending.delete(response.id);
+        entry.resolve(response.result);
+      }
+    }
+  });
+
+  child.stderr.on('data', (data) => {
+    console.error(`Python worker stderr (${scriptName}):`, data.toString());
+  });
+
+  const failAll = (error) => {
+    // Drop this worker so the next call starts a fresh one
+    if (pythonWorkers[scriptName] === worker) {
+      delete pythonWorkers[scriptName];
+    }
+    for (const entry of worker.pending.values()) {
+      clearTimeout(entry.timer);
+      entry.reject(error);
+    }
+    worker.pending.clear();
+  };
+
+  child.on('error', (error) => {
+    console.error('❌ Python worker failed:', error);
+    failAll(error);
+  });
+
+  // Writing to a worker that died (EPIPE) must fail its requests, not crash the server
+  child.stdin.on('error', (error) => {
+    console.error(`❌ Python worker ${scriptName} stdin failed:`, error.message);
+    failAll(error);
+    child.kill();
+  });
+
+  child.on('close', (code) => {
+    console.error(`⚠️ Python worker ${scriptName} exited with code ${code}`);
+    failAll(new Error(`Python worker exited with code ${code}`));
+  });
+
+  return worker;
+}
+
+function callPythonWorker(scriptName, data) {
+  return new Promise((resolve, reject) => {
+    const worker = getPythonWorker(scriptName);
+    if (!worker.child.stdin.writable) {
+      if (pythonWorkers[scriptName] === worker) {
+        delete pythonWorkers[scriptName];
+      }
+      reject(new Error(`Python worker ${scriptName} is not accepting requests`));
+      return;
+    }
+    const id = String(worker.nextId++);
+
+    const timer = setTimeout(() => {
+      // The request keeps running in the worker; its late response is dropped
+      worker.pending.delete(id);
+      const error = new Error(`Python worker timed out after ${PYTHON_WORKER_TIMEOUT_MS}ms`);
+      error.timedOut = true;
+      reject(error);
+    }, PYTHON_WORKER_TIMEOUT_MS);
+
+    worker.pending.set(id, { resolve, reject, timer });
+    worker.child.stdin.write(JSON.stringify({ id, data }) + '\n');
+  });
+}
+
 /**
  * Execute Python script and return result
+ * Uses the persistent worker when available, falling back to a one-shot process
+ * if the worker cannot be started or dies. A timed-out request is still running
+ * in the worker, so it is not run a second time: the timeout is thrown instead.
  * @param {string} scriptName - Name of Python script
  * @param {object} data - Data to pass to Python script
  * @returns {Promise<object>} - Result from Python script
  */
-function executePythonScript(scriptName, data) {
+async function executePythonScript(scriptName, data) {
+  if (PYTHON_WORKER_ENABLED) {
+    try {
+      return await callPythonWorker(scriptName, data);
+    } catch (error) {
+      if (error.timedOut) {
+        throw error;
+      }
+      console.error(`⚠️ Python worker unavailable for ${scriptName}, spawning process:`, error.message);
+    }
+  }
+  return spawnPythonScript(scriptName, data);
+}
+
+/**
+ * Fold committed transactions into the fraud detector's account state
+ * (lifetime counts, velocity, recipient index). Fire-and-forget: a failure
+ * only leaves the state behind, never the transfer.
+ * @param {number} accountId - Account the transactions belong to
+ * @param {Array<object>} transactions - {amount, createdAt, toRib?} rows
+ */
+function recordFraudState(accountId, transactions) {
+  if (!PYTHON_WORKER_ENABLED) {
+    return;
+  }
+  callPythonWorker('fraud_detection/fraud_detector.py', {
+    accountId,
+    recordTransactions: transactions
+  }).catch((error) => {
+    console.warn(`⚠️ Fraud state update failed for account ${accountId}:`, error.message);
+  });
+}
+
+/**
+ * Run a Python script once in a fresh process
+ * @param {string} scriptName - Name of Python script
+ * @param {object} data - Data to pass to Python script
+ * @returns {Promise<object>} - Result from Python script
+ */
+function spawnPythonScript(scriptName, data) {
   return new Promise((resolve, reject) => {
     const scriptPath = path.join(__dirname, 'ai_modules', scriptName);
     const dataJson = JSON.stringify(data);
@@ -275,8 +432,10 @@ function executePythonScript(scriptName, data) {
     // Use 'python' for Windows, 'python3' for Linux/Mac
     const pythonCmd = process.platform === 'win32' ? 'python' : 'python3';
     
-    // Spawn Python process
-    const python = spawn(pythonCmd, [scriptPath, dataJson]);
+    // Spawn Python process; the payload goes over stdin so long histories
+    // don't run into the OS argument-length limit
+    const python = spawn(pythonCmd, [scriptPath, '--stdin']);
+    python.stdin.end(dataJson);
     
     let resultData = '';
     let errorData = '';
@@ -324,7 +483,7 @@ app.post('/transactions/fraud-check', verifyToken, async (req, res) => {
     
     // Verify account belongs to user
     const [accounts] = await pool.query(
-      'SELECT id FROM accounts WHERE id = ? AND userId = ?',
+      'SELECT id, type FROM accounts WHERE id = ? AND userId = ?',
       [fromAccountId, req.userId]
     );
     
@@ -332,19 +491,23 @@ app.post('/transactions/fraud-check', verifyToken, async (req, res) => {
       return res.status(404).json({ message: 'Account not found' });
     }
     
-    // Get user's transaction history (last 30 days)
+    // Get user's transaction history (last 30 days), with the payee of outgoing transfers
     const [userHistory] = await pool.query(
-      `SELECT amount, createdAt, description
-       FROM transactions 
-       WHERE (fromAccountId = ? OR toAccountId = ?)
-       AND createdAt >= DATE_SUB(NOW(), INTERVAL 30 DAY)
-       ORDER BY createdAt DESC
+      `SELECT t.amount, t.createdAt, t.description,
+              CASE WHEN t.fromAccountId = ? THEN r.rib END AS toRib
+       FROM transactions t
+       LEFT JOIN accounts r ON r.id = t.toAccountId
+       WHERE (t.fromAccountId = ? OR t.toAccountId = ?)
+       AND t.createdAt >= DATE_SUB(NOW(), INTERVAL 30 DAY)
+       ORDER BY t.createdAt DESC
        LIMIT 50`,
-      [fromAccountId, fromAccountId]
+      [fromAccountId, fromAccountId, fromAccountId]
     );
     
     // Prepare transaction data for AI
     const transactionData = {
+      accountId: fromAccountId,
+      accountType: accounts[0].type,
       transaction: {
         amount: amount,
         toRib: toRib,
@@ -476,7 +639,9 @@ app.get('/predictions/income', verifyToken, async (req, res) => {
     try {
       const aiResult = await executePythonScript(
         'income_prediction/income_predictor.py',
-        { transactions }
+        INCOME_DEADLINE_MS
+          ? { accountId, transactions, deadlineMs: INCOME_DEADLINE_MS }
+          : { accountId, transactions }
       );
       
       if (aiResult.success) {
@@ -840,16 +1005,20 @@ app.post('/transactions/transfer', verifyToken, async (req, res) => {
     }
      try {
       const [userHistory] = await connection.query(
-        `SELECT amount, createdAt, description
-         FROM transactions 
-         WHERE (fromAccountId = ? OR toAccountId = ?)
-         AND createdAt >= DATE_SUB(NOW(), INTERVAL 30 DAY)
-         ORDER BY createdAt DESC
+        `SELECT t.amount, t.createdAt, t.description,
+                CASE WHEN t.fromAccountId = ? THEN r.rib END AS toRib
+         FROM transactions t
+         LEFT JOIN accounts r ON r.id = t.toAccountId
+         WHERE (t.fromAccountId = ? OR t.toAccountId = ?)
+         AND t.createdAt >= DATE_SUB(NOW(), INTERVAL 30 DAY)
+         ORDER BY t.createdAt DESC
          LIMIT 50`,
-        [fromAccountId, fromAccountId]
+        [fromAccountId, fromAccountId, fromAccountId]
       );
       
       const fraudCheckData = {
+        accountId: fromAccountId,
+        accountType: senderAccount.type,
         transaction: {
           amount: amount,
           toRib: toRib,
@@ -927,6 +1096,10 @@ app.post('/transactions/transfer', verifyToken, async (req, res) => {
 
     await connection.commit();
 
+    const recordedAt = new Date().toISOString();
+    recordFraudState(fromAccountId, [{ amount, createdAt: recordedAt, toRib }]);
+    recordFraudState(recipientAccount.id, [{ amount, createdAt: recordedAt }]);
+
     res.json({
       message: 'Transfer successful',
       transactionId: result.insertId,